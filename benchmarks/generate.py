@@ -0,0 +1,156 @@
+"""
+Generate deterministic synthetic projects to benchmark the compiler on.
+
+Usage: python -m benchmarks.generate OUTPUT_DIR [--preset medium] [--seed 0]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+from typing import Any, Dict, List, NamedTuple
+
+# Words the filler text is made of, so files compress and tokenize like code
+_WORDS = (
+    "def class return import from self value result config path data items "
+    "index count name value error async await yield lambda None True False "
+    "for while if else elif try except finally with open read write list dict"
+).split()
+
+_EXTENSIONS = (".py", ".js", ".ts", ".go", ".java", ".md", ".json", ".yaml", ".txt")
+
+_SECRETS = (
+    'password = "{}"',
+    'api_key = "{}"',
+    "access_token = '{}'",
+    'client_secret = "{}"',
+    'database_url = "postgres://user:{}@db/app"',
+)
+
+
+class ProjectSpec(NamedTuple):
+    """The shape of a synthetic project."""
+
+    files: int = 2000
+    # Directories are nested up to this depth, with this many subdirectories
+    # per directory
+    depth: int = 4
+    fanout: int = 4
+    # File sizes follow a log-normal distribution around this median
+    median_size: int = 4096
+    size_sigma: float = 1.2
+    max_size: int = 4 * 1024 * 1024
+    # Share of binary files, of files ignored through .gitignore files and of
+    # directories carrying their own .gitignore
+    binary_ratio: float = 0.05
+    ignored_ratio: float = 0.1
+    gitignore_ratio: float = 0.2
+    # Patterns in each .gitignore file
+    gitignore_rules: int = 10
+    # Secrets per kilobyte of text
+    secret_density: float = 0.5
+
+
+PRESETS: Dict[str, ProjectSpec] = {
+    "small": ProjectSpec(files=200, depth=2, fanout=3),
+    "medium": ProjectSpec(),
+    "large": ProjectSpec(files=20000, depth=6, fanout=5),
+    "large-files": ProjectSpec(files=50, median_size=4 * 1024 * 1024, size_sigma=0.5),
+}
+
+
+def _directories(spec: ProjectSpec) -> List[str]:
+    directories, level = [""], [""]
+    for depth in range(spec.depth):
+        level = [
+            os.path.join(parent, f"{'pkg' if depth else 'src'}{i}")
+            for parent in level
+            for i in range(spec.fanout)
+        ]
+        directories.extend(level)
+    return directories
+
+
+def _text(rng: random.Random, size: int, secret_density: float) -> str:
+    lines, length = [], 0
+    secret_every = 1024 / secret_density if secret_density else math.inf
+    next_secret = rng.expovariate(1 / secret_every) if secret_density else math.inf
+    while length < size:
+        if length >= next_secret:
+            value = "".join(rng.choices("abcdef0123456789", k=rng.randint(8, 40)))
+            line = rng.choice(_SECRETS).format(value)
+            next_secret += rng.expovariate(1 / secret_every)
+        else:
+            indent = "    " * rng.randint(0, 3)
+            line = indent + " ".join(rng.choices(_WORDS, k=rng.randint(3, 12)))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+
+def generate_project(
+    output_dir: str, spec: ProjectSpec = ProjectSpec(), seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Write a synthetic project into ``output_dir`` and describe what was written.
+
+    The same ``spec`` and ``seed`` always produce the same files.
+    """
+    rng = random.Random(seed)
+    directories = _directories(spec)
+    summary = {"files": 0, "bytes": 0, "binary": 0, "ignored": 0, "gitignores": 0}
+
+    for directory in directories:
+        os.makedirs(os.path.join(output_dir, directory), exist_ok=True)
+        if directory and rng.random() >= spec.gitignore_ratio:
+            continue
+        rules = [f"*.ignored{i}" for i in range(spec.gitignore_rules // 2)]
+        rules += [
+            f"{rng.choice(['', '**/'])}{rng.choice(_WORDS)}_{i}/"
+            for i in range(spec.gitignore_rules - len(rules) - 1)
+        ]
+        rules.append("!keep.ignored0")
+        with open(os.path.join(output_dir, directory, ".gitignore"), "w") as f:
+            f.write("\n".join(rules) + "\n")
+        summary["gitignores"] += 1
+
+    for i in range(spec.files):
+        directory = rng.choice(directories)
+        size = min(
+            spec.max_size,
+            int(rng.lognormvariate(math.log(spec.median_size), spec.size_sigma)),
+        )
+        roll = rng.random()
+        if roll < spec.binary_ratio:
+            name = f"blob_{i}.bin"
+            block_size = min(size, 65536) or 1
+            block = rng.getrandbits(8 * block_size).to_bytes(block_size, "little")
+            data = b"\0" + block * (size // block_size)
+            summary["binary"] += 1
+        else:
+            if roll < spec.binary_ratio + spec.ignored_ratio:
+                name = f"generated_{i}.ignored0"
+                summary["ignored"] += 1
+            else:
+                name = f"module_{i}{rng.choice(_EXTENSIONS)}"
+            data = _text(rng, size, spec.secret_density).encode()
+        with open(os.path.join(output_dir, directory, name), "wb") as f:
+            f.write(data)
+        summary["files"] += 1
+        summary["bytes"] += len(data)
+    return summary
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    summary = generate_project(args.output_dir, PRESETS[args.preset], args.seed)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Time each stage of the compiler on a project and report throughput as JSON.
+
+Usage: python -m benchmarks.run [--project DIR | --preset medium] [--output FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.generate import PRESETS, generate_project
+from code_context_compiler.config import DEFAULT_CONFIG
+from code_context_compiler.ignore import IgnoreMatcher
+from code_context_compiler.masker import Masker
+from code_context_compiler.scraper import _read_file
+from code_context_compiler.sink import OutputSink
+from code_context_compiler.walker import ProjectWalker
+from code_context_compiler.writers import OUTPUT_FORMATS, FileRecord, get_writer
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+logger = logging.getLogger("benchmarks")
+
+
+def peak_rss(who: str = "self") -> Optional[int]:
+    """Peak resident set size in bytes of this process or of its children."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN
+    )
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def _result(seconds: float, files: int, size: int) -> Dict[str, Any]:
+    return {
+        "seconds": round(seconds, 6),
+        "files": files,
+        "bytes": size,
+        "files_per_s": round(files / seconds, 1) if seconds else None,
+        "mb_per_s": round(size / seconds / 1e6, 2) if seconds and size else None,
+    }
+
+
+def _best(func: Callable[[], Any], repeat: int):
+    """Run ``func`` ``repeat`` times, returning the fastest time and last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_stages(
+    project_path: str, config: Dict[str, Any], repeat: int = 3
+) -> Dict[str, Dict[str, Any]]:
+    """Time the walk, filter, read, mask and write stages in isolation."""
+    stages = {}
+
+    def walk():
+        matcher = IgnoreMatcher(project_path, config["ignore_patterns"], logger)
+        walker = ProjectWalker(project_path, matcher, logger)
+        return [entry for batch in walker for entry in batch]
+
+    seconds, entries = _best(walk, repeat)
+    total = sum(entry.size for entry in entries)
+    stages["walk"] = _result(seconds, len(entries), total)
+
+    # Every path of the tree, including those the walk prunes
+    paths = []
+    for root, dirs, files in os.walk(project_path):
+        relative_root = os.path.relpath(root, project_path)
+        for name in dirs + files:
+            paths.append(os.path.normpath(os.path.join(relative_root, name)))
+    matcher = IgnoreMatcher(project_path, config["ignore_patterns"], logger)
+    seconds, _ = _best(lambda: [matcher.is_ignored(path) for path in paths], repeat)
+    stages["filter"] = _result(seconds, len(paths), 0)
+
+    seconds, reads = _best(lambda: [_read_file(entry) for entry in entries], repeat)
+    stages["read"] = _result(seconds, len(entries), total)
+    # Binary files have no text to mask
+    text_files = [
+        (entry.relative_path, text)
+        for entry, (_, text, _) in zip(entries, reads)
+        if text is not None
+    ]
+    texts = [text for _, text in text_files]
+    text_bytes = sum(len(text.encode()) for text in texts)
+
+    masker = Masker(config["mask_patterns"])
+    seconds, masked = _best(lambda: [masker.mask(text) for text in texts], repeat)
+    stages["mask"] = _result(seconds, len(texts), text_bytes)
+
+    records = [
+        FileRecord(path, "text", text) for (path, _), text in zip(text_files, masked)
+    ]
+    with tempfile.TemporaryDirectory() as output_dir:
+        for output_format in OUTPUT_FORMATS:
+            output_file = os.path.join(output_dir, f"output.{output_format}")
+
+            async def write():
+                async with OutputSink(output_file) as out_file:
+                    writer = get_writer(output_format)(out_file)
+                    await writer.start()
+                    for record in records:
+                        await writer.write_record(record)
+                    await writer.finish()
+
+            seconds, _ = _best(lambda: asyncio.run(write()), repeat)
+            stages[f"write_{output_format}"] = _result(
+                seconds, len(records), os.path.getsize(output_file)
+            )
+    return stages
+
+
+def bench_end_to_end(
+    project_path: str, output_formats: List[str], extra_args: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """Run the CLI on the project in a subprocess per output format."""
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for output_format in output_formats:
+            output_file = os.path.join(output_dir, f"output.{output_format}")
+            command = [
+                sys.executable,
+                "-m",
+                "code_context_compiler.cli",
+                project_path,
+                output_file,
+                "--output-format",
+                output_format,
+                *extra_args,
+            ]
+            start = time.perf_counter()
+            subprocess.run(command, check=True, capture_output=True)
+            seconds = time.perf_counter() - start
+            result = _result(seconds, 0, os.path.getsize(output_file))
+            del result["files"], result["files_per_s"]
+            # Children are waited for one at a time, so this is the largest
+            # peak of any run so far
+            result["peak_rss_bytes"] = peak_rss("children")
+            results[output_format] = result
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--project", help="Benchmark an existing project")
+    source.add_argument("--preset", choices=sorted(PRESETS), default="medium")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--format", action="append", choices=OUTPUT_FORMATS, dest="formats"
+    )
+    parser.add_argument("--output", help="Write the report here instead of stdout")
+    parser.add_argument(
+        "cli_args", nargs="*", help="Extra options for the end-to-end runs"
+    )
+    args = parser.parse_args(argv)
+
+    config = DEFAULT_CONFIG
+    with tempfile.TemporaryDirectory() as generated:
+        project = {"path": args.project}
+        if args.project is None:
+            spec = PRESETS[args.preset]
+            project = {
+                "preset": args.preset,
+                "seed": args.seed,
+                "spec": spec._asdict(),
+                **generate_project(generated, spec, args.seed),
+            }
+            args.project = generated
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "project": project,
+            "stages": bench_stages(args.project, config, args.repeat),
+            "end_to_end": bench_end_to_end(
+                args.project, args.formats or ["text"], args.cli_args
+            ),
+            "peak_rss_bytes": peak_rss(),
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,15 +7,16 @@ This document contains the compiled code of an entire project. The content is or
 4. Some sensitive information may have been masked and replaced with "***MASKED***".
 5. Media files (images, audio, video) are represented by placeholders: [MEDIA FILE PLACEHOLDER: filepath]
 6. Binary files or files that couldn't be read as text are represented by: [BINARY FILE PLACEHOLDER: filepath]
-7. Only files with specific extensions (if configured) are included in full. Others may be omitted or represented by placeholders.
+7. Files larger than the configured size limit are represented by: [LARGE FILE PLACEHOLDER: filepath]
+8. Only files with specific extensions (if configured) are included in full. Others may be omitted or represented by placeholders.
 
 When analyzing or referring to this code:
 - Pay attention to the file paths to understand the project structure.
 - Treat each "File: " section as a separate file in the project.
 - Be aware that masked information is sensitive and should not be speculated upon.
 - Consider the relationships and dependencies between different files.
-- Note that media and binary files are not included in their original form, only their presence is indicated.
-- If you see placeholders for media or binary files, consider their potential impact on the project without their contents.
+- Note that media, binary and large files are not included in their original form, only their presence is indicated.
+- If you see placeholders for media, binary or large files, consider their potential impact on the project without their contents.
 
 Please process this information accordingly and use it to understand the overall structure and content of the project.
 
@@ -0,0 +1,190 @@
+import fnmatch
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from code_context_compiler.writers import FileRecord, TextWriter, utf8_size
+
+# Rough cost of the path, markers and punctuation around each file's content,
+# for budgets and shards that are not sized by a writer
+RECORD_OVERHEAD = 32
+
+# Tokenizers for code average about this many bytes per token
+BYTES_PER_TOKEN = 4
+
+# Ranking criteria, in the order used when ``priority_by`` is not configured
+PRIORITY_BY = ("patterns", "recent", "small")
+
+
+def estimate_tokens(size: int, bytes_per_token: float = BYTES_PER_TOKEN) -> int:
+    """
+    Estimate the number of tokens of ``size`` bytes of code.
+
+    The size alone gives a usable estimate, known from the stat of a file
+    without reading, let alone tokenizing, any of it.
+    """
+    return int(-(-size // bytes_per_token))
+
+
+def _record_size(record: FileRecord) -> int:
+    size = utf8_size(record.content) if isinstance(record.content, str) else 0
+    return size + len(record.relative_path) + RECORD_OVERHEAD
+
+
+class Budget:
+    """
+    Fit the output into a budget of bytes, or of tokens estimated from
+    bytes, by eliding the files of least value.
+
+    ``plan`` ranks the files by priority and picks, before anything is read,
+    those whose estimated size fits; every other file is replaced by an
+    ``elided`` placeholder. Since the masked content may turn out larger
+    than the file, ``admit`` checks the actual size of each record as it is
+    written and elides those that no longer fit, so the budget is never
+    exceeded by content.
+
+    ``base_bytes`` is the size of the prompt and framing of the output, and
+    ``record_size`` that of a record as written, such as the
+    ``record_size`` of a writer; by default a rough ``RECORD_OVERHEAD`` is
+    added to the path and content of each record.
+
+    Files are ranked by the ``priority_by`` criteria in turn: ``patterns``
+    (the highest weight among the ``priority_patterns`` globs matching the
+    path, 0 when none does), ``recent`` (most recently modified first),
+    ``small`` or ``large``. Ties keep the output order.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        base_bytes: int = 0,
+        priority_patterns: Optional[Dict[str, float]] = None,
+        priority_by: Iterable[str] = PRIORITY_BY,
+        bytes_per_token: float = BYTES_PER_TOKEN,
+        record_size: Callable[[FileRecord], int] = _record_size,
+    ):
+        self.max_bytes = max_bytes
+        self.bytes_per_token = bytes_per_token
+        self.record_size = record_size
+        self.used = base_bytes
+        self.elided = 0
+        self.priority_patterns = [
+            (os.path.normcase(pattern), weight)
+            for pattern, weight in (priority_patterns or {}).items()
+        ]
+        self.priority_by = list(priority_by)
+        unknown = set(self.priority_by) - {"patterns", "recent", "small", "large"}
+        if unknown:
+            raise ValueError(f"Unknown priority criteria: {', '.join(sorted(unknown))}")
+        # Room kept for the placeholders of the records not written yet
+        self._reserved = 0
+        self._reservations: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(
+        cls, config: Dict[str, Any], writer_class: Any = TextWriter
+    ) -> Optional["Budget"]:
+        """
+        Create the budget set by ``max_bytes`` and ``max_tokens``, if any,
+        for the output of ``writer_class``.
+        """
+        bytes_per_token = config.get("bytes_per_token") or BYTES_PER_TOKEN
+        limits = []
+        if config.get("max_bytes") is not None:
+            limits.append(config["max_bytes"])
+        if config.get("max_tokens") is not None:
+            limits.append(int(config["max_tokens"] * bytes_per_token))
+        if not limits:
+            return None
+        return cls(
+            min(limits),
+            writer_class.base_size(),
+            config.get("priority_patterns"),
+            config.get("priority_by") or PRIORITY_BY,
+            bytes_per_token,
+            writer_class.record_size,
+        )
+
+    def _pattern_weight(self, relative_path: str) -> float:
+        path = os.path.normcase(relative_path)
+        weights = [
+            weight
+            for pattern, weight in self.priority_patterns
+            if fnmatch.fnmatch(path, pattern)
+        ]
+        return max(weights, default=0)
+
+    def _rank(self, entry: Any) -> Tuple:
+        key = []
+        for criterion in self.priority_by:
+            if criterion == "patterns":
+                key.append(-self._pattern_weight(entry.relative_path))
+            elif criterion == "recent":
+                # Files of a git revision have no mtime
+                key.append(-getattr(entry, "mtime_ns", 0))
+            elif criterion == "small":
+                key.append(entry.size)
+            else:
+                key.append(-entry.size)
+        return tuple(key)
+
+    def _reserve(self, record: FileRecord) -> int:
+        size = self._reservations[record.relative_path] = self.record_size(record)
+        self._reserved += size
+        return size
+
+    def plan(
+        self, entries: List[Any], placeholders: Iterable[FileRecord] = ()
+    ) -> Set[str]:
+        """
+        Return the relative paths of the ``entries`` to read, in budget.
+
+        Room is first reserved for a placeholder for every entry, and for the
+        ``placeholders`` records, which are written anyway. Files are then
+        picked in order of priority as long as they fit, their size standing
+        for that of their content.
+        """
+        for record in placeholders:
+            self._reserve(record)
+        elided = {}
+        for entry in entries:
+            path = entry.relative_path
+            elided[path] = self._reserve(FileRecord(path, "elided", ""))
+        remaining = self.max_bytes - self.used - self._reserved
+        ranked = sorted(range(len(entries)), key=lambda i: self._rank(entries[i]))
+        selected = set()
+        for i in ranked:
+            entry = entries[i]
+            path = entry.relative_path
+            empty = self.record_size(FileRecord(path, "text", ""))
+            size = empty + entry.size - elided[path]
+            if size <= remaining:
+                remaining -= size
+                selected.add(path)
+                self._sizes[path] = entry.size
+        return selected
+
+    def elide(self, relative_path: str) -> FileRecord:
+        """Return the placeholder of a file left out of the budget."""
+        self.elided += 1
+        return FileRecord(relative_path, "elided", "")
+
+    def admit(self, record: FileRecord) -> FileRecord:
+        """
+        Return the record to write, elided if its content does not fit in
+        what is left once the placeholders of later records are reserved.
+        """
+        relative_path = record.relative_path
+        self._reserved -= self._reservations.pop(relative_path, 0)
+        if isinstance(record.content, str):
+            size = self.record_size(record)
+        else:
+            # Streamed content is only known once written: count the size of
+            # the file, unescaped
+            size = self.record_size(record._replace(content=""))
+            size += self._sizes.get(relative_path, 0)
+        if record.content and self.used + size + self._reserved > self.max_bytes:
+            record = self.elide(relative_path)
+            size = self.record_size(record)
+        self.used += size
+        return record
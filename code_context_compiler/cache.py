@@ -0,0 +1,270 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+# Bump whenever the layout of cached records changes
+CACHE_VERSION = 1
+
+# Files modified this close to the moment they were hashed may have changed
+# again within the same mtime tick, so their stat info alone is not trusted.
+RACY_WINDOW_NS = 2_000_000_000
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """Hash the parts of the configuration that affect a file's masked output."""
+    relevant = {"version": CACHE_VERSION, "mask_patterns": config["mask_patterns"]}
+    if config.get("skeleton", False):
+        from code_context_compiler.reducers import skeleton_reducers
+
+        # Reduced files are cached apart, by the reducers that made them
+        relevant["reducers"] = skeleton_reducers(config)
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+
+def content_digest(data: bytes) -> str:
+    """Hash the raw content of a file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class FileCache:
+    """
+    Persistent cache of masked file contents, kept in a directory such as
+    ``<project>/.ccc-cache/``.
+
+    ``index.json`` maps each relative path to the size, mtime and content hash
+    it had when it was last processed. Masked records live in ``objects/``,
+    keyed by the content hash together with the fingerprint of the mask
+    configuration, so identical files share an object and changing the mask
+    patterns never returns stale output. A file whose size and mtime are
+    unchanged is served without being read; a file whose stat changed but
+    whose content did not is served after hashing it.
+
+    Masked git blobs, compiled with ``--rev``, are cached by their object id
+    with ``lookup_blob`` and ``store_blob`` instead, and shared by every
+    revision that contains them.
+
+    ``close`` evicts objects that are no longer referenced, drops entries for
+    files that have disappeared, trims the least recently used objects until
+    the cache fits in ``max_bytes`` and saves the index.
+    """
+
+    def __init__(self, cache_dir: str, fingerprint: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._entries, self._objects, self._blobs = self._load_index()
+
+    def _load_index(self) -> Tuple[Dict[str, dict], Dict[str, dict], Set[str]]:
+        try:
+            with open(self.index_path, "r") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return {}, {}, set()
+        if index.get("version") != CACHE_VERSION:
+            return {}, {}, set()
+        return (
+            index.get("entries", {}),
+            index.get("objects", {}),
+            set(index.get("blobs", [])),
+        )
+
+    def _object_key(self, digest: str) -> str:
+        return hashlib.sha256(f"{digest}:{self.fingerprint}".encode()).hexdigest()
+
+    def _object_path(self, key: str) -> str:
+        return os.path.join(self.objects_dir, key[:2], key[2:])
+
+    def _blob_key(self, sha: str) -> str:
+        return self._object_key(f"git:{sha}")
+
+    def _read_object(self, key: str) -> Optional[Tuple[str, str]]:
+        try:
+            with open(self._object_path(key), "rb") as obj:
+                kind, content = obj.read().decode("utf-8").split("\n", 1)
+        except (OSError, ValueError):
+            with self._lock:
+                self._objects.pop(key, None)
+                self.misses += 1
+            return None
+        return kind, content
+
+    def _write_object(self, key: str, kind: str, content: str) -> None:
+        path = self._object_path(key)
+        data = f"{kind}\n{content}".encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as obj:
+            obj.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._objects[key] = {"bytes": len(data), "used": time.time_ns()}
+
+    def lookup(
+        self,
+        relative_path: str,
+        size: int,
+        mtime_ns: int,
+        digest: Optional[str] = None,
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Return the cached ``(kind, content)`` of a file, or None on a miss.
+
+        Without ``digest`` only an exact, non-racy stat match is a hit.
+        """
+        now = time.time_ns()
+        hashed = digest is not None
+        with self._lock:
+            self._seen.add(relative_path)
+            entry = self._entries.get(relative_path)
+            if not hashed:
+                if (
+                    entry is None
+                    or entry["size"] != size
+                    or entry["mtime_ns"] != mtime_ns
+                    or mtime_ns + RACY_WINDOW_NS >= entry["verified_ns"]
+                ):
+                    return None
+                digest = entry["digest"]
+                verified_ns = entry["verified_ns"]
+            else:
+                verified_ns = now
+            key = self._object_key(digest)
+            if key not in self._objects:
+                if hashed:
+                    self.misses += 1
+                return None
+
+        cached = self._read_object(key)
+        if cached is None:
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._objects[key]["used"] = now
+            self._entries[relative_path] = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "digest": digest,
+                "verified_ns": verified_ns,
+            }
+        return cached
+
+    def digest(self, relative_path: str) -> Optional[str]:
+        """Return the content hash of a file as of its last lookup or store."""
+        with self._lock:
+            entry = self._entries.get(relative_path)
+        return None if entry is None else entry["digest"]
+
+    def store(
+        self,
+        relative_path: str,
+        size: int,
+        mtime_ns: int,
+        digest: str,
+        kind: str,
+        content: str,
+    ) -> None:
+        """Save the masked ``content`` of a file."""
+        self._write_object(self._object_key(digest), kind, content)
+        now = time.time_ns()
+        with self._lock:
+            self._seen.add(relative_path)
+            self._entries[relative_path] = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "digest": digest,
+                "verified_ns": now,
+            }
+
+    def lookup_blob(self, sha: str) -> Optional[Tuple[str, str]]:
+        """Return the cached ``(kind, content)`` of a git blob, or None."""
+        key = self._blob_key(sha)
+        with self._lock:
+            if key not in self._objects:
+                self.misses += 1
+                return None
+        cached = self._read_object(key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+                self._objects[key]["used"] = time.time_ns()
+        return cached
+
+    def store_blob(self, sha: str, kind: str, content: str) -> None:
+        """Save the masked ``content`` of a git blob."""
+        key = self._blob_key(sha)
+        self._write_object(key, kind, content)
+        with self._lock:
+            self._blobs.add(key)
+
+    def _prune(self, project_path: str) -> None:
+        """Drop stale entries and objects, then enforce the size cap."""
+        for relative_path in list(self._entries):
+            if relative_path not in self._seen and not os.path.exists(
+                os.path.join(project_path, relative_path)
+            ):
+                del self._entries[relative_path]
+
+        live = {}
+        for relative_path, entry in self._entries.items():
+            live.setdefault(self._object_key(entry["digest"]), []).append(relative_path)
+        self._blobs &= set(self._objects)
+        for key in self._blobs:
+            live.setdefault(key, [])
+        evicted = [key for key in self._objects if key not in live]
+
+        total = sum(obj["bytes"] for key, obj in self._objects.items() if key in live)
+        by_age = sorted(live, key=lambda key: self._objects.get(key, {}).get("used", 0))
+        for key in by_age:
+            if total <= self.max_bytes:
+                break
+            total -= self._objects.get(key, {}).get("bytes", 0)
+            evicted.append(key)
+            for relative_path in live[key]:
+                del self._entries[relative_path]
+            self._blobs.discard(key)
+
+        for key in evicted:
+            self._objects.pop(key, None)
+            try:
+                os.remove(self._object_path(key))
+            except OSError:
+                pass
+
+    def close(self, project_path: str, logger: logging.Logger) -> None:
+        """Evict stale objects and save the index."""
+        with self._lock:
+            # Keep the blobs stored since this cache was loaded by other runs
+            # sharing it, such as compilations of other revisions
+            _, objects, blobs = self._load_index()
+            for key in blobs - self._blobs:
+                if key in objects:
+                    self._objects.setdefault(key, objects[key])
+                    self._blobs.add(key)
+            self._prune(project_path)
+            index = {
+                "version": CACHE_VERSION,
+                "entries": self._entries,
+                "objects": self._objects,
+                "blobs": sorted(self._blobs),
+            }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        gitignore_path = os.path.join(self.cache_dir, ".gitignore")
+        if not os.path.exists(gitignore_path):
+            with open(gitignore_path, "w") as gitignore_file:
+                gitignore_file.write("*\n")
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump(index, index_file)
+        os.replace(tmp_path, self.index_path)
+        logger.debug(f"Cache: {self.hits} hits, {self.misses} misses")
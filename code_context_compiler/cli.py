@@ -1,42 +1,172 @@
-import asyncio
+import json
 import logging
+import sys
 from pathlib import Path
+from typing import List
 
 import typer
-from rich.console import Console
-from rich.progress import Progress
+from typer.core import TyperGroup
 
 from code_context_compiler.config import load_config
-from code_context_compiler.scraper import scrape_project
 
-app = typer.Typer()
-console = Console()
+# asyncio, rich and the scraper are imported by the commands themselves, so
+# that --help and argument errors stay fast.
+
+
+class DefaultCommandGroup(TyperGroup):
+    """
+    Run the ``main`` command when the first argument is a path rather than
+    a command name, so ``code_context_compiler PROJECT OUTPUT`` keeps working
+    next to subcommands such as ``watch``. Without arguments, or with
+    ``--help``, the group lists its commands.
+    """
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and not args[0].startswith("-"):
+            args = ["main", *args]
+        return super().parse_args(ctx, args)
+
+
+app = typer.Typer(
+    cls=DefaultCommandGroup,
+    no_args_is_help=True,
+    context_settings={"help_option_names": ["-h", "--help"]},
+)
+
+
+def setup_logging(debug: bool) -> None:
+    if debug:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+
+def configure(config_file: Path, **overrides) -> dict:
+    """Load the configuration and apply the options given on the command line."""
+    config = load_config(config_file)
+    return {**config, **{k: v for k, v in overrides.items() if v is not None}}
 
 
 @app.command()
 def main(
     project_path: Path = typer.Argument(..., help="Path to the project to scan"),
-    output_file: Path = typer.Argument(..., help="Path to the output file"),
+    output_file: Path = typer.Argument(
+        ..., help="Path to the output file, or - for standard output"
+    ),
     config_file: Path = typer.Option(None, help="Path to the configuration file"),
     output_format: str = typer.Option(
-        "text", help="Output format: text, json, or yaml"
+        "text", help="Output format: text, json, jsonl, or yaml"
     ),
     debug: bool = typer.Option(False, help="Enable debug logging"),
+    jobs: int = typer.Option(
+        None, help="Number of files to read and mask concurrently"
+    ),
+    workers: int = typer.Option(
+        None, help="Number of masking processes (0 for one per CPU)"
+    ),
+    cache: bool = typer.Option(
+        None, help="Reuse the masked output of unchanged files between runs"
+    ),
+    stats: Path = typer.Option(
+        None, help="Write timings and counters as JSON to this file (- for stderr)"
+    ),
+    rev: str = typer.Option(
+        None, help="Compile this git revision instead of the working tree"
+    ),
+    since: str = typer.Option(
+        None, help="Only compile the files changed since this git revision"
+    ),
+    since_mtime: str = typer.Option(
+        None,
+        help="Only compile the files modified since this time "
+        "(seconds since the epoch or ISO 8601)",
+    ),
+    list_unchanged: bool = typer.Option(
+        None, help="With --since or --since-mtime, list the other files too"
+    ),
+    dedupe: bool = typer.Option(
+        None, help="Write identical files once, then as references to the first"
+    ),
+    max_tokens: int = typer.Option(
+        None, help="Fit the output in about this many tokens, eliding files"
+    ),
+    max_bytes: int = typer.Option(
+        None, help="Fit the output in this many bytes, eliding files"
+    ),
+    skeleton: bool = typer.Option(
+        None, help="Reduce code to its signatures and docstrings"
+    ),
+    shards: int = typer.Option(
+        None, help="Split the output into this many files, with a manifest"
+    ),
+    shard_max_bytes: int = typer.Option(
+        None, help="Split the output into files of at most this many bytes"
+    ),
+    index: bool = typer.Option(
+        None, help="Write the offsets of every file next to the output"
+    ),
+    compress: str = typer.Option(
+        None,
+        help="Compress the output with gzip, bz2 or xz "
+        "(default: as the extension of the output file says)",
+    ),
+    compress_level: int = typer.Option(None, help="Compression level"),
 ):
     """
     CLI tool to scan a code project and create a single file with the entire project code.
+
+    Run "watch PROJECT_PATH OUTPUT_FILE" to keep the output up to date as
+    files change, "batch MANIFEST" to compile many projects at once, and
+    "extract OUTPUT_FILE PATHS..." to read files back from an indexed output.
     """
-    if debug:
-        logging.basicConfig(level=logging.DEBUG)
-    else:
-        logging.basicConfig(level=logging.INFO)
+    setup_logging(debug)
+
+    import asyncio
+
+    from rich.console import Console
+    from rich.markup import escape
+    from rich.progress import Progress
+
+    from code_context_compiler.scraper import scrape_project
+    from code_context_compiler.sink import STDOUT
+
+    to_stdout = str(output_file) == STDOUT
+    # Progress and messages go to stderr when the output itself goes to stdout
+    console = Console(stderr=to_stdout)
 
-    if output_format in ["json", "yaml"]:
-        raise NotImplementedError
     try:
-        config = load_config(config_file)
+        config = configure(
+            config_file,
+            jobs=jobs,
+            workers=workers,
+            cache=cache,
+            rev=rev,
+            since=since,
+            since_mtime=since_mtime,
+            list_unchanged=list_unchanged,
+            dedupe=dedupe,
+            max_tokens=max_tokens,
+            max_bytes=max_bytes,
+            skeleton=skeleton,
+            shards=shards,
+            shard_max_bytes=shard_max_bytes,
+            index=index,
+            compress=compress,
+            compress_level=compress_level,
+        )
 
-        with Progress() as progress:
+        stats_hook = None
+        if stats is not None:
+
+            def stats_hook(report):
+                if str(stats) == STDOUT:
+                    json.dump(report, sys.stderr, indent=2)
+                    sys.stderr.write("\n")
+                else:
+                    with open(stats, "w") as stats_file:
+                        json.dump(report, stats_file, indent=2)
+
+        with Progress(console=console) as progress:
             task = progress.add_task("[green]Scanning project...", total=100)
 
             def update_progress(percentage):
@@ -44,13 +174,175 @@ def main(
 
             asyncio.run(
                 scrape_project(
-                    project_path, output_file, config, output_format, update_progress
+                    project_path,
+                    STDOUT if to_stdout else output_file,
+                    config,
+                    output_format,
+                    update_progress,
+                    stats_hook,
                 )
             )
 
-        console.print(f"[green]Output written to {output_file}[/green]")
+        if config.get("shards") or config.get("shard_max_bytes"):
+            from code_context_compiler.shards import manifest_path
+
+            manifest = manifest_path(str(output_file))
+            console.print(f"[green]Output shards listed in {manifest}[/green]")
+        elif not to_stdout:
+            console.print(f"[green]Output written to {output_file}[/green]")
     except Exception as e:
-        console.print(f"[red]Error: {str(e)}[/red]")
+        console.print(f"[red]Error: {escape(str(e))}[/red]")
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def watch(
+    project_path: Path = typer.Argument(..., help="Path to the project to watch"),
+    output_file: Path = typer.Argument(..., help="Path to the output file"),
+    config_file: Path = typer.Option(None, help="Path to the configuration file"),
+    output_format: str = typer.Option(
+        "text", help="Output format: text, json, jsonl, or yaml"
+    ),
+    debug: bool = typer.Option(False, help="Enable debug logging"),
+    jobs: int = typer.Option(
+        None, help="Number of files to read and mask concurrently"
+    ),
+    debounce: float = typer.Option(
+        None, help="Seconds without changes to wait for before updating (0.2)"
+    ),
+    poll: float = typer.Option(
+        None, help="Rescan every this many seconds instead of using inotify"
+    ),
+):
+    """
+    Compile the project, then keep the output file up to date as files change.
+    """
+    setup_logging(debug)
+
+    import asyncio
+
+    from rich.console import Console
+    from rich.markup import escape
+
+    from code_context_compiler.watch import DEBOUNCE, watch_project
+
+    console = Console()
+    try:
+        config = configure(config_file, jobs=jobs)
+        asyncio.run(
+            watch_project(
+                project_path,
+                output_file,
+                config,
+                output_format,
+                DEBOUNCE if debounce is None else debounce,
+                poll,
+            )
+        )
+    except KeyboardInterrupt:
+        console.print("[green]Stopped watching[/green]")
+    except Exception as e:
+        console.print(f"[red]Error: {escape(str(e))}[/red]")
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def batch(
+    manifest: Path = typer.Argument(
+        ..., help="YAML file listing the projects to compile and their outputs"
+    ),
+    config_file: Path = typer.Option(
+        None, help="Configuration file of the projects without their own"
+    ),
+    parallel: int = typer.Option(1, help="Number of projects to compile at once"),
+    debug: bool = typer.Option(False, help="Enable debug logging"),
+):
+    """
+    Compile many projects in one process, sharing compiled patterns and
+    masking processes between them. A project that fails does not stop the
+    others.
+    """
+    setup_logging(debug)
+
+    import asyncio
+
+    from rich.console import Console
+    from rich.markup import escape
+
+    from code_context_compiler.config import load_batch
+    from code_context_compiler.scraper import scrape_projects
+
+    console = Console()
+    try:
+        projects = load_batch(manifest, config_file)
+    except Exception as e:
+        console.print(f"[red]Error: {escape(str(e))}[/red]")
+        raise typer.Exit(code=1)
+
+    def report(result):
+        if result.error is None:
+            console.print(
+                f"[green]{escape(result.output_file)}[/green] "
+                f"({result.seconds:.1f}s)"
+            )
+        else:
+            console.print(
+                f"[red]{escape(result.project_path)} failed: "
+                f"{escape(result.error)}[/red]"
+            )
+
+    results = asyncio.run(scrape_projects(projects, parallel, report))
+    failed = sum(result.error is not None for result in results)
+    if failed:
+        console.print(f"[red]{failed} of {len(results)} projects failed[/red]")
+        raise typer.Exit(code=1)
+    console.print(f"[green]Compiled {len(results)} projects[/green]")
+
+
+@app.command()
+def extract(
+    output_file: Path = typer.Argument(
+        ..., help="Output file written with --index, or the manifest of its shards"
+    ),
+    paths: List[str] = typer.Argument(None, help="Paths of the files to extract"),
+    output_dir: Path = typer.Option(
+        None, help="Write the files under this directory instead of to stdout"
+    ),
+    list_files: bool = typer.Option(
+        False, "--list", help="List the paths of the files in the output"
+    ),
+):
+    """
+    Print files of a compiled output, using its index to read only them.
+    """
+    from rich.console import Console
+    from rich.markup import escape
+
+    from code_context_compiler.index import extract as extract_files
+    from code_context_compiler.index import output_paths
+
+    console = Console(stderr=True)
+    try:
+        if list_files:
+            for path in output_paths(output_file):
+                sys.stdout.write(f"{path}\n")
+            return
+        contents = extract_files(output_file, paths or [])
+        if output_dir is not None:
+            root = output_dir.resolve()
+            for path in contents:
+                if root not in (root / path).resolve().parents:
+                    raise ValueError(f"{path} is outside of {output_dir}")
+        for path, content in contents.items():
+            if output_dir is None:
+                sys.stdout.write(content)
+                continue
+            target = output_dir / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(content)
+    except (OSError, KeyError, ValueError) as e:
+        message = e.args[0] if isinstance(e, KeyError) else str(e)
+        console.print(f"[red]Error: {escape(message)}[/red]")
         raise typer.Exit(code=1)
 
 
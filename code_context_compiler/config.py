@@ -1,7 +1,5 @@
 from pathlib import Path
-from typing import Any, Dict
-
-import yaml
+from typing import Any, Dict, List, Optional
 
 DEFAULT_CONFIG = {
     "ignore_patterns": [
@@ -48,6 +46,31 @@ DEFAULT_CONFIG = {
         r'username\s*=\s*["\'].*?["\']',
     ],
     "use_git": False,
+    "rev": None,  # Compile this git revision instead of the working tree
+    "since": None,  # Only compile files changed since this git revision
+    "since_mtime": None,  # Only compile files modified since this time
+    "list_unchanged": False,  # List the other files with a placeholder
+    "dedupe": False,  # Write identical files once, then as references
+    "max_bytes": None,  # Size budget of the output
+    "max_tokens": None,  # Token budget of the output, estimated from its size
+    "bytes_per_token": 4,
+    "priority_patterns": {},  # Glob -> weight; heavier files are kept first
+    "priority_by": ["patterns", "recent", "small"],
+    "skeleton": False,  # Reduce code to signatures and docstrings
+    "reducers": {},  # Extension -> "module:function" reducing its files
+    "shards": None,  # Split the output into this many shards
+    "shard_max_bytes": None,  # Split the output into shards of at most this size
+    "index": False,  # Write the offsets of every file next to the output
+    "compress": None,  # gzip, bz2 or xz; by default, as the output extension says
+    "compress_level": None,  # Default: 6 for gzip and xz, 9 for bz2
+    "jobs": 8,  # Number of files read and masked concurrently
+    "workers": 1,  # Masking processes; 1 masks in-process, 0 uses every CPU
+    "cache": False,  # Reuse masked output of unchanged files between runs
+    "cache_dir": ".ccc-cache",  # Relative to the project directory
+    "cache_max_bytes": 512 * 1024 * 1024,
+    "max_file_size": None,  # Files larger than this (in bytes) get a placeholder
+    "chunk_threshold": 32 * 1024 * 1024,  # Larger files are masked in chunks
+    "chunk_size": 1024 * 1024,  # Characters read and masked at a time
 }
 
 
@@ -56,7 +79,71 @@ def load_config(config_path: Path = None) -> Dict[str, Any]:
     Load configuration from a YAML file or return default config if no file is provided.
     """
     if config_path and config_path.exists():
+        import yaml
+
         with open(config_path, "r") as config_file:
             user_config = yaml.safe_load(config_file)
         return {**DEFAULT_CONFIG, **user_config}
     return DEFAULT_CONFIG
+
+
+def load_batch(manifest_path: Path, config_path: Path = None) -> List[Dict[str, Any]]:
+    """
+    Load a batch manifest: a YAML file listing the projects to compile, as
+    the arguments of ``scrape_project``::
+
+        config: {jobs: 4}       # Applied to every project
+        output_format: text     # Default format
+        projects:
+          - project: repos/api
+            output: out/api.txt
+          - project: repos/web
+            output: out/web.json
+            output_format: json
+            config_file: web.yaml
+            config: {dedupe: true}
+
+    A project uses its own ``config_file``, or ``config_path``, overridden by
+    the ``config`` of the manifest and then its own. Relative paths are
+    relative to the manifest, and each configuration file is read once.
+    """
+    import yaml
+
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, "r") as manifest_file:
+        manifest = yaml.safe_load(manifest_file) or {}
+    if isinstance(manifest, list):
+        manifest = {"projects": manifest}
+    base_dir = manifest_path.parent
+    shared = manifest.get("config") or {}
+    default_format = manifest.get("output_format", "text")
+
+    configs: Dict[Optional[Path], Dict[str, Any]] = {}
+
+    def config_for(path: Optional[Path]) -> Dict[str, Any]:
+        if path not in configs:
+            configs[path] = load_config(path)
+        return configs[path]
+
+    projects = []
+    for i, entry in enumerate(manifest.get("projects") or []):
+        if "project" not in entry or "output" not in entry:
+            raise ValueError(
+                f"Project {i + 1} of {manifest_path} needs a project and an output"
+            )
+        config_file = config_path
+        if entry.get("config_file"):
+            config_file = base_dir / entry["config_file"]
+        projects.append(
+            {
+                "project_path": str(base_dir / entry["project"]),
+                "output_file": str(base_dir / entry["output"]),
+                "config": {
+                    **config_for(config_file),
+                    **shared,
+                    **(entry.get("config") or {}),
+                },
+                "output_format": entry.get("output_format", default_format),
+            }
+        )
+    return projects
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from code_context_compiler.writers import FileRecord
+
+
+class Deduplicator:
+    """
+    Mask each distinct file content once per run and write later copies as
+    references to the first one.
+
+    Files are identified by a hash of their raw content, their content id.
+    Since files are read and masked concurrently, ``mask`` lets copies that
+    are in flight at the same time share a single masking. ``resolve`` is
+    called by the writing loop, in output order, and turns every copy after
+    the first into a record that is ``identical_to`` it. Only the contents
+    between masking and writing are held in memory, as for any record.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes_saved = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        # Path and size in bytes of the first copy written of each content
+        self._written: Dict[str, Tuple[str, int]] = {}
+
+    async def mask(
+        self, content_id: str, mask: Callable[[], Awaitable[str]]
+    ) -> Optional[str]:
+        """
+        Return the masked content of ``content_id``, calling ``mask`` unless
+        a copy is being masked already. Returns None when a copy has been
+        written already, since the content will not be written again.
+        """
+        if content_id in self._written:
+            return None
+        pending = self._pending.get(content_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[content_id] = future
+        try:
+            content = await mask()
+        except asyncio.CancelledError:
+            del self._pending[content_id]
+            future.cancel()
+            raise
+        except BaseException as e:
+            # Copies waiting for this one fail with the same error
+            del self._pending[content_id]
+            future.set_exception(e)
+            # The error is raised here already, waiters or not
+            future.exception()
+            raise
+        future.set_result(content)
+        return content
+
+    def resolve(self, record: FileRecord) -> FileRecord:
+        """Return the record to write, a reference if its content was written."""
+        content_id = record.content_id
+        if content_id is None:
+            return record
+        written = self._written.get(content_id)
+        if written is None:
+            self._pending.pop(content_id, None)
+            content = record.content
+            size = len(content) if content.isascii() else len(content.encode())
+            self._written[content_id] = (record.relative_path, size)
+            return record
+        self.files += 1
+        self.bytes_saved += written[1]
+        return record._replace(content="", identical_to=written[0])
+
+    def discard(self, record: FileRecord) -> None:
+        """
+        Forget the first copy ``resolve`` returned when it was not written
+        after all, such as when a budget elided it, so that the next copy is
+        written in full instead of as a reference to it.
+        """
+        written = self._written.get(record.content_id)
+        if written is not None and written[0] == record.relative_path:
+            del self._written[record.content_id]
@@ -0,0 +1,119 @@
+import os
+import subprocess
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+# Modes of tree entries that are not regular files: symbolic links and
+# submodules, which are skipped like the walker skips links to directories
+_SKIPPED_MODES = ("120000", "160000")
+
+
+class TreeEntry(NamedTuple):
+    """A file of a git revision, as listed by ``git ls-tree``."""
+
+    relative_path: str
+    mode: str
+    sha: str
+    size: int
+
+
+def _walk_order(entry: TreeEntry) -> List[Tuple[int, str]]:
+    # At every level, files come before subdirectories, like ProjectWalker
+    *directories, name = entry.relative_path.split(os.sep)
+    return [(1, directory) for directory in directories] + [(0, name)]
+
+
+def _git(repo_path: str, *args: str) -> bytes:
+    """Run a git command in ``repo_path`` and return its output."""
+    result = subprocess.run(
+        ["git", "-C", repo_path, *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        # Only the first line: git follows some errors with its usage
+        message = result.stderr.decode(errors="replace").strip().split("\n")[0]
+        raise ValueError(f"git {args[0]} failed: {message}")
+    return result.stdout
+
+
+def list_tree(repo_path: str, rev: str) -> List[TreeEntry]:
+    """
+    List the files of ``rev`` in the repository at ``repo_path``.
+
+    Like a walk of a checkout, only the files below ``repo_path`` are listed
+    when it is a subdirectory of a working tree, with paths relative to it,
+    and in the order the walker would find them. ``repo_path`` may also be a
+    bare repository.
+    """
+    output = _git(repo_path, "ls-tree", "-r", "-z", "--long", rev)
+    entries = []
+    for line in output.split(b"\0"):
+        if not line:
+            continue
+        info, _, path = line.partition(b"\t")
+        mode, _, sha, size = info.decode().split()
+        if mode in _SKIPPED_MODES:
+            continue
+        relative_path = os.path.normpath(os.fsdecode(path))
+        entries.append(TreeEntry(relative_path, mode, sha, int(size)))
+    entries.sort(key=_walk_order)
+    return entries
+
+
+def changed_files(repo_path: str, since: str, rev: Optional[str] = None) -> Set[str]:
+    """
+    Return the paths of the files changed between ``since`` and ``rev``, or
+    the working tree when ``rev`` is None, with a single ``git diff``.
+
+    Paths are relative to ``repo_path`` and limited to the files below it.
+    Files that are not tracked by git are not part of the diff. Deleted
+    files are included, since they cannot be told apart without another
+    call.
+    """
+    args = ["diff", "--name-only", "-z", "--relative", "--no-renames", since]
+    if rev is not None:
+        args.append(rev)
+    output = _git(repo_path, *args)
+    return {os.path.normpath(os.fsdecode(path)) for path in output.split(b"\0") if path}
+
+
+class BlobReader:
+    """
+    Read blobs from the object database of a repository through a single
+    ``git cat-file --batch`` process, instead of starting git for each file.
+
+    Blobs are read one at a time, so a reader must only be used by one
+    thread at once.
+    """
+
+    def __init__(self, repo_path: str):
+        self._process = subprocess.Popen(
+            ["git", "-C", repo_path, "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def read(self, sha: str) -> bytes:
+        """Return the content of the blob ``sha``."""
+        stdin, stdout = self._process.stdin, self._process.stdout
+        stdin.write(f"{sha}\n".encode())
+        stdin.flush()
+        header = stdout.readline().split()
+        # A missing object is reported as "<sha> missing"
+        if len(header) != 3 or header[1] != b"blob":
+            raise ValueError(f"Unable to read blob {sha}")
+        data = stdout.read(int(header[2]))
+        # Each object is followed by a newline
+        stdout.read(1)
+        return data
+
+    def close(self) -> None:
+        self._process.stdin.close()
+        self._process.wait()
+        self._process.stdout.close()
+
+    def __enter__(self) -> "BlobReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
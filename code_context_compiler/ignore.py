@@ -0,0 +1,160 @@
+import fnmatch
+import logging
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from code_context_compiler.runtime import Runtime
+
+# pathspec names a group in every pattern; the names would clash once merged
+_NAMED_GROUP = re.compile(r"(?<!\\)\(\?P<\w+>")
+
+
+def compile_ignore_patterns(ignore_patterns: List[str]) -> Optional[re.Pattern]:
+    """
+    Compile the ``ignore_patterns`` of the configuration into a single regex.
+
+    Patterns ending with ``/`` match any relative path starting with the
+    pattern (without the slash); other patterns are ``fnmatch`` globs matched
+    against the whole relative path, just like ``is_ignored`` does.
+    """
+    alternatives = []
+    for pattern in ignore_patterns:
+        if pattern.endswith("/"):
+            alternatives.append(re.escape(pattern[:-1]))
+        else:
+            alternatives.append(fnmatch.translate(os.path.normcase(pattern)))
+    if not alternatives:
+        return None
+    return re.compile("|".join(f"(?:{alternative})" for alternative in alternatives))
+
+
+class _GitIgnore:
+    """The patterns of one ``.gitignore`` file, merged into one regex when possible."""
+
+    def __init__(self, lines: List[str]):
+        import pathspec
+
+        self.spec = pathspec.PathSpec.from_lines("gitwildmatch", lines)
+        patterns = [p for p in self.spec.patterns if p.include is not None]
+        self.regex = None
+        if all(p.include for p in patterns):
+            # Without negations, matching any pattern means ignored
+            alternation = "|".join(
+                f"(?:{_NAMED_GROUP.sub('(?:', p.regex.pattern)})" for p in patterns
+            )
+            try:
+                self.regex = re.compile(alternation) if patterns else None
+            except re.error:
+                self.regex = None
+        self.empty = not patterns
+
+    def match(self, path: str) -> bool:
+        if self.empty:
+            return False
+        if self.regex is not None:
+            return self.regex.match(path) is not None
+        return self.spec.match_file(path)
+
+
+class IgnoreMatcher:
+    """
+    Decide which paths of a project are ignored, with every pattern compiled
+    once per run.
+
+    It merges the ``ignore_patterns`` of the configuration with the root
+    ``.gitignore`` and any nested ``.gitignore`` registered through
+    ``add_gitignore`` while the project is walked. Nested files apply to
+    paths below their own directory, like in git. Paths are relative to the
+    project; directories are matched with a trailing slash so that
+    directory-only patterns such as ``build/`` prune the whole subtree.
+
+    To match files that are not on disk, such as those of a git revision,
+    pass their ``.gitignore`` files as ``gitignores``, a mapping of relative
+    directories to lines; the project directory is then never read. With a
+    ``runtime``, patterns already compiled for another project are reused.
+    """
+
+    def __init__(
+        self,
+        project_path: str,
+        ignore_patterns: List[str],
+        logger: logging.Logger,
+        gitignores: Optional[Dict[str, List[str]]] = None,
+        runtime: Optional["Runtime"] = None,
+    ):
+        self.project_path = project_path
+        self.logger = logger
+        self.runtime = runtime
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+        if runtime is None:
+            self._custom = compile_ignore_patterns(ignore_patterns)
+        else:
+            self._custom = runtime.ignore_regex(ignore_patterns)
+        self._gitignores: Dict[str, _GitIgnore] = {}
+        self._chains: Dict[str, List[Tuple[int, _GitIgnore]]] = {}
+        self._lock = threading.Lock()
+        if gitignores is None:
+            self.add_gitignore("")
+        else:
+            for relative_dir, lines in gitignores.items():
+                self._add_lines(relative_dir, lines)
+
+    def add_gitignore(self, relative_dir: str) -> None:
+        """Load the ``.gitignore`` of a directory of the project, if it has one."""
+        gitignore_path = os.path.join(self.project_path, relative_dir, ".gitignore")
+        try:
+            with open(gitignore_path, "r") as gitignore_file:
+                lines = gitignore_file.read().splitlines()
+        except OSError:
+            return
+        self._add_lines(relative_dir, lines)
+
+    def _add_lines(self, relative_dir: str, lines: List[str]) -> None:
+        key = relative_dir.replace(os.sep, "/")
+        if self.runtime is None:
+            gitignore = _GitIgnore(lines)
+        else:
+            gitignore = self.runtime.gitignore(lines)
+        # Copy on write, so walker threads can keep matching concurrently
+        with self._lock:
+            self._gitignores = {**self._gitignores, key: gitignore}
+            self._chains = {}
+
+    def _chain(self, relative_dir: str) -> List[Tuple[int, _GitIgnore]]:
+        """The ``.gitignore`` files that apply inside a directory."""
+        chains, gitignores = self._chains, self._gitignores
+        chain = chains.get(relative_dir)
+        if chain is None:
+            chain = []
+            for directory, gitignore in gitignores.items():
+                if directory == "":
+                    chain.append((0, gitignore))
+                elif relative_dir == directory or relative_dir.startswith(
+                    directory + "/"
+                ):
+                    chain.append((len(directory) + 1, gitignore))
+            chains[relative_dir] = chain
+        return chain
+
+    def is_ignored(self, relative_path: str, is_dir: bool = False) -> bool:
+        """Check if a path relative to the project should be ignored."""
+        if self._custom is not None and self._custom.match(
+            os.path.normcase(relative_path)
+        ):
+            if self._debug:
+                self.logger.debug("%s ignored due to custom pattern", relative_path)
+            return True
+
+        if os.sep != "/":
+            relative_path = relative_path.replace(os.sep, "/")
+        relative_dir, _, _ = relative_path.rpartition("/")
+        path = relative_path + "/" if is_dir else relative_path
+        for offset, gitignore in self._chain(relative_dir):
+            if gitignore.match(path[offset:]):
+                if self._debug:
+                    self.logger.debug("%s ignored due to .gitignore", relative_path)
+                return True
+        return False
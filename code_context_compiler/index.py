@@ -0,0 +1,231 @@
+import hashlib
+import json
+import mmap
+import os
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from code_context_compiler.shards import MANIFEST_SUFFIX
+
+# Suffix of the index written next to an output file
+INDEX_SUFFIX = ".index.json"
+
+
+class Section(NamedTuple):
+    """Where the section of a file is in an output file, in bytes."""
+
+    relative_path: str
+    kind: str
+    offset: int
+    length: int
+    sha256: str
+    identical_to: Optional[str] = None
+
+
+def index_path(output_file: str) -> str:
+    return f"{output_file}{INDEX_SUFFIX}"
+
+
+class SectionIndex:
+    """
+    Record the byte offset, length and hash of every section written to an
+    output file.
+
+    Writers given an index write through it: it counts the bytes of
+    everything written, as encoded in the file, and hashes the text written
+    between ``begin`` and ``end``, which writers call around each record.
+    """
+
+    def __init__(self, encoding: str = "utf-8", newline: str = os.linesep):
+        self.encoding = encoding
+        self.newline = newline
+        self.position = 0
+        self.sections: List[Section] = []
+        self._out_file = None
+        self._start = 0
+        self._hash = None
+
+    def track(self, out_file) -> "SectionIndex":
+        """Write to ``out_file`` through the index, and return the index."""
+        self._out_file = out_file
+        return self
+
+    async def write(self, text: str) -> None:
+        data = text
+        if self.newline != "\n":
+            data = data.replace("\n", self.newline)
+        data = data.encode(self.encoding)
+        self.position += len(data)
+        if self._hash is not None:
+            self._hash.update(data)
+        await self._out_file.write(text)
+
+    def begin(self) -> None:
+        """Start the section of the next record."""
+        self._start = self.position
+        self._hash = hashlib.sha256()
+
+    def end(self, record: Any) -> None:
+        """End the section of ``record``."""
+        self.sections.append(
+            Section(
+                record.relative_path,
+                record.kind,
+                self._start,
+                self.position - self._start,
+                self._hash.hexdigest(),
+                record.identical_to,
+            )
+        )
+        self._hash = None
+
+    def save(self, output_file: str, output_format: str) -> str:
+        """Write the index of ``output_file`` next to it and return its path."""
+        sections = []
+        for section in self.sections:
+            entry = section._asdict()
+            entry["path"] = entry.pop("relative_path")
+            if section.identical_to is None:
+                del entry["identical_to"]
+            sections.append(entry)
+        index = {
+            "format": output_format,
+            "encoding": self.encoding,
+            "newline": self.newline,
+            "size": self.position,
+            "sections": sections,
+        }
+        target = index_path(output_file)
+        with open(target, "w") as index_file:
+            json.dump(index, index_file, indent=1)
+            index_file.write("\n")
+        return target
+
+
+class CompiledOutput:
+    """
+    Random access to the files of an output file through its index.
+
+    The output is memory-mapped and every section is read from its offset,
+    so getting a file costs the same whatever the size of the output, and
+    nothing else of it is read. Sections are checked against their hash
+    when ``verify`` is set.
+    """
+
+    def __init__(self, output_file: str, verify: bool = True):
+        self.output_file = str(output_file)
+        self.verify = verify
+        with open(index_path(self.output_file)) as index_file:
+            index = json.load(index_file)
+        self.format = index["format"]
+        self.encoding = index["encoding"]
+        self.newline = index["newline"]
+        self.sections: Dict[str, Section] = {}
+        for entry in index["sections"]:
+            section = Section(
+                entry["path"],
+                entry["kind"],
+                entry["offset"],
+                entry["length"],
+                entry["sha256"],
+                entry.get("identical_to"),
+            )
+            self.sections[section.relative_path] = section
+        self._file = open(self.output_file, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size != index["size"]:
+                raise ValueError(
+                    f"The index of {self.output_file} is out of date: "
+                    f"expected {index['size']} bytes, found {size}"
+                )
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def paths(self) -> List[str]:
+        """Return the paths of the files in the output, in output order."""
+        return list(self.sections)
+
+    def section(self, relative_path: str) -> str:
+        """Return the section of a file as written, including its markup."""
+        try:
+            section = self.sections[relative_path]
+        except KeyError:
+            raise KeyError(f"{relative_path} is not in {self.output_file}") from None
+        data = self._map[section.offset : section.offset + section.length]
+        if self.verify and hashlib.sha256(data).hexdigest() != section.sha256:
+            raise ValueError(f"The section of {relative_path} does not match its hash")
+        text = data.decode(self.encoding)
+        if self.newline != "\n":
+            text = text.replace(self.newline, "\n")
+        return text
+
+    def content(self, relative_path: str) -> str:
+        """
+        Return the content of a file, as it was compiled. The content of a
+        copy written as a reference is that of the file it refers to.
+        """
+        section = self.sections.get(relative_path)
+        if section is not None and section.identical_to is not None:
+            return self.content(section.identical_to)
+        text = self.section(relative_path)
+        if self.format == "text":
+            # "File: <path>\n<content>\n\n"
+            return text[len(f"File: {relative_path}\n") : -2]
+        if self.format == "yaml":
+            import yaml
+
+            return yaml.safe_load(text)[0]["content"]
+        return json.loads(text)["content"]
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "CompiledOutput":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def output_paths(output_file: str) -> List[str]:
+    """
+    Return the paths of the files of an output file written with an index,
+    or of all its shards given their manifest, in output order.
+    """
+    output_file = str(output_file)
+    if output_file.endswith(MANIFEST_SUFFIX):
+        with open(output_file) as manifest_file:
+            return list(json.load(manifest_file)["files"])
+    with CompiledOutput(output_file, verify=False) as output:
+        return output.paths()
+
+
+def extract(output_file: str, relative_paths: Iterable[str]) -> Dict[str, str]:
+    """
+    Return the content of the given files of an output file written with an
+    index, without reading the rest of it.
+
+    ``output_file`` may also be the manifest of sharded output, in which
+    case each file is read from the shard holding it.
+    """
+    output_file = str(output_file)
+    relative_paths = list(relative_paths)
+    if not output_file.endswith(MANIFEST_SUFFIX):
+        with CompiledOutput(output_file) as output:
+            return {path: output.content(path) for path in relative_paths}
+
+    with open(output_file) as manifest_file:
+        files = json.load(manifest_file)["files"]
+    by_shard: Dict[str, List[str]] = {}
+    for path in relative_paths:
+        if path not in files:
+            raise KeyError(f"{path} is not in {output_file}")
+        by_shard.setdefault(files[path], []).append(path)
+    contents = {}
+    directory = os.path.dirname(output_file)
+    for shard, paths in by_shard.items():
+        contents.update(extract(os.path.join(directory, shard), paths))
+    return {path: contents[path] for path in relative_paths}
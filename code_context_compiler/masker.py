@@ -1,5 +1,24 @@
+import copy
 import re
-from typing import Dict, List, Union
+import sys
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
 
 
 def create_mask_function(
@@ -19,19 +38,378 @@ def create_mask_function(
     return mask_func
 
 
+# Numbered backreferences change meaning once a pattern is wrapped in a group
+_NUMBERED_BACKREFERENCE = re.compile(r"\\[1-9]")
+
+# Literals shorter than this are too common to be worth checking for
+MIN_LITERAL_LENGTH = 2
+
+# Longest match assumed for unbounded patterns such as ``.*?`` when masking
+# text in chunks
+MAX_MATCH_LENGTH = 4096
+
+
+class MaskRule(NamedTuple):
+    regex: re.Pattern
+    mask_func: Callable[[re.Match], str]
+    # Each group is a tuple of literals of which at least one must occur in
+    # the text for the pattern to have any chance of matching.
+    requirements: Tuple[Tuple[str, ...], ...]
+    ignorecase: bool
+
+
+def _literal_runs(items) -> List[str]:
+    """Collect the runs of consecutive literal characters in a parsed regex."""
+    runs, current = [], []
+    for op, arg in items:
+        if op is sre_parse.LITERAL:
+            current.append(chr(arg))
+            continue
+        runs.append("".join(current))
+        current = []
+        if op is sre_parse.SUBPATTERN and not arg[1] and not arg[2]:
+            # A plain group is as mandatory as its surroundings
+            runs.extend(_literal_runs(arg[-1]))
+    runs.append("".join(current))
+    return [run for run in runs if len(run) >= MIN_LITERAL_LENGTH]
+
+
+def _max_width(regex: re.Pattern) -> int:
+    """The longest text ``regex`` can match (a huge number if unbounded)."""
+    try:
+        return sre_parse.parse(regex.pattern, regex.flags).getwidth()[1]
+    except Exception:
+        return sys.maxsize
+
+
+def extract_literals(regex: re.Pattern) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Work out which literal strings must appear in any text ``regex`` matches.
+
+    Returns a tuple of groups; the text can only match if, for every group,
+    at least one literal of the group occurs in it. An empty tuple means no
+    literal is known to be required.
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return ()
+    requirements = [(run,) for run in _literal_runs(parsed)]
+    for op, arg in parsed:
+        if op is sre_parse.BRANCH:
+            alternatives = [_literal_runs(branch) for branch in arg[1]]
+            if all(alternatives):
+                requirements.append(tuple(max(runs, key=len) for runs in alternatives))
+    return tuple(requirements)
+
+
+class Masker:
+    """
+    Mask sensitive information with a set of patterns compiled once.
+
+    Every pattern is compiled up front together with its mask function and
+    the literal strings it cannot match without (``password``, ``token``...),
+    either extracted from the regex or declared with a ``literals`` key on a
+    dict pattern. Before any regex runs, patterns whose literals are absent
+    from the text are skipped. The remaining patterns are merged into a
+    single alternation of named groups when they allow it, so text without
+    any sensitive information is rejected in one scan. Text that does match
+    is masked pattern by pattern, exactly like ``mask_sensitive_info`` always
+    has.
+
+    ``stats`` counts the texts masked, the texts for which the literal scan
+    ruled out every pattern, how many pattern runs it avoided and the
+    matches of each pattern. Setting ``timing`` also adds up the time spent
+    running each pattern.
+    """
+
+    def __init__(
+        self,
+        patterns: List[Union[str, Dict[str, Union[str, bool]]]],
+        max_match_length: int = MAX_MATCH_LENGTH,
+    ):
+        self.rules = []
+        for pattern in patterns:
+            literals = None
+            if isinstance(pattern, str):
+                regex, mask_func = pattern, create_mask_function()
+            elif isinstance(pattern, dict):
+                regex = pattern["pattern"]
+                mask_func = create_mask_function(
+                    pattern.get("mask_char", "*"),
+                    pattern.get("preserve_length", True),
+                )
+                literals = pattern.get("literals")
+            else:
+                continue
+            compiled = re.compile(regex)
+            ignorecase = bool(compiled.flags & re.IGNORECASE)
+            if literals:
+                requirements = (tuple(literals),)
+            else:
+                requirements = extract_literals(compiled)
+            if ignorecase:
+                requirements = tuple(
+                    tuple(literal.casefold() for literal in group)
+                    for group in requirements
+                )
+            self.rules.append(MaskRule(compiled, mask_func, requirements, ignorecase))
+        self._combined = {}
+        self.combined = self._combine(tuple(range(len(self.rules))))
+        # Longest text a single match can span when masking in chunks
+        self.window = max(
+            [1] + [min(_max_width(r.regex), max_match_length) for r in self.rules]
+        )
+        self.timing = False
+        self.stats = {
+            "files": 0,
+            "files_skipped": 0,
+            "patterns_skipped": 0,
+            "matches": [0] * len(self.rules),
+            "pattern_seconds": [0.0] * len(self.rules),
+        }
+
+    def _combine(self, indices: Tuple[int, ...]) -> Optional[re.Pattern]:
+        """Merge the given patterns into one alternation, or None if unsafe."""
+        if indices in self._combined:
+            return self._combined[indices]
+        combined = None
+        rules = [self.rules[i] for i in indices]
+        flags = {rule.regex.flags for rule in rules}
+        if len(flags) == 1 and not any(
+            _NUMBERED_BACKREFERENCE.search(rule.regex.pattern) for rule in rules
+        ):
+            alternation = "|".join(
+                f"(?P<_mask{i}>{self.rules[i].regex.pattern})" for i in indices
+            )
+            try:
+                combined = re.compile(alternation, flags.pop())
+            except re.error:
+                pass
+        self._combined[indices] = combined
+        return combined
+
+    @staticmethod
+    def _may_match(rule: MaskRule, code: str, folded: Optional[str]) -> bool:
+        """Check the literal requirements of ``rule`` against the text."""
+        text = folded if rule.ignorecase else code
+        return all(
+            any(literal in text for literal in group) for group in rule.requirements
+        )
+
+    def _active(self, code: str) -> Tuple[int, ...]:
+        """Indices of the patterns whose literals all occur in ``code``."""
+        folded = code.casefold() if any(r.ignorecase for r in self.rules) else None
+        active = tuple(
+            i
+            for i, rule in enumerate(self.rules)
+            if self._may_match(rule, code, folded)
+        )
+        self.stats["patterns_skipped"] += len(self.rules) - len(active)
+        return active
+
+    @staticmethod
+    def _sub_range(
+        rule: MaskRule, code: str, start: int, cut: int
+    ) -> Tuple[str, int, int]:
+        """
+        Mask the matches of ``rule`` that start in ``code[start:cut]``.
+
+        Returns the new text, the position of ``cut`` in it, moved past any
+        replacement that straddles it, and the number of matches.
+        """
+        pieces, last, end, delta = [], start, cut, 0
+        for match in rule.regex.finditer(code, start):
+            if match.start() >= cut:
+                break
+            masked = rule.mask_func(match)
+            pieces.append(code[last : match.start()])
+            pieces.append(masked)
+            last = match.end()
+            end = max(end, match.end())
+            delta += len(masked) - (match.end() - match.start())
+        if not pieces:
+            return code, cut, 0
+        count = len(pieces) // 2
+        pieces.append(code[last:])
+        return code[:start] + "".join(pieces), end + delta, count
+
+    def _apply(
+        self,
+        code: str,
+        active: Tuple[int, ...],
+        start: int = 0,
+        cut: Optional[int] = None,
+    ) -> Tuple[str, Optional[int]]:
+        """Mask ``code`` with the active patterns, optionally within a range."""
+        combined = self._combine(active)
+        if combined is not None and not combined.search(code, start):
+            return code, cut
+
+        changed = False
+        for i, rule in enumerate(self.rules):
+            if changed:
+                # Masking may in theory introduce a literal that was absent
+                folded = code.casefold() if rule.ignorecase else None
+                if not self._may_match(rule, code, folded):
+                    continue
+            elif i not in active:
+                continue
+            masked, cut = self._run(i, code, start, cut)
+            if masked != code:
+                changed = True
+                code = masked
+        return code, cut
+
+    def _run(
+        self, i: int, code: str, start: int = 0, cut: Optional[int] = None
+    ) -> Tuple[str, Optional[int]]:
+        """Mask ``code`` with pattern ``i``, optionally within a range."""
+        rule = self.rules[i]
+        if self.timing:
+            started = time.perf_counter()
+        if cut is None:
+            masked, count = rule.regex.subn(rule.mask_func, code)
+        else:
+            masked, cut, count = self._sub_range(rule, code, start, cut)
+        if self.timing:
+            self.stats["pattern_seconds"][i] += time.perf_counter() - started
+        self.stats["matches"][i] += count
+        return masked, cut
+
+    def mask(self, code: str) -> str:
+        """Return ``code`` with every pattern masked."""
+        self.stats["files"] += 1
+        active = self._active(code)
+        if not active:
+            if self.rules:
+                self.stats["files_skipped"] += 1
+            return code
+        return self._apply(code, active)[0]
+
+    def fork(self) -> "Masker":
+        """
+        Return a masker sharing the compiled patterns of this one, with stats
+        of its own, to mask on another thread; ``merge_stats`` adds them back.
+        """
+        forked = copy.copy(self)
+        forked.stats = {
+            key: [0 * item for item in value] if isinstance(value, list) else 0
+            for key, value in self.stats.items()
+        }
+        return forked
+
+    def merge_stats(self, stats: Dict[str, Any]) -> None:
+        """Add the stats of a forked masker, or of a worker, to these."""
+        for key, value in stats.items():
+            if isinstance(value, list):
+                self.stats[key] = [a + b for a, b in zip(self.stats[key], value)]
+            else:
+                self.stats[key] += value
+
+    def stream(self) -> "MaskStream":
+        """Start masking a text that will be fed in chunks."""
+        self.stats["files"] += 1
+        return MaskStream(self)
+
+    def mask_chunks(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Mask a text given as an iterable of chunks, yielding masked chunks."""
+        stream = self.stream()
+        for chunk in chunks:
+            masked = stream.feed(chunk)
+            if masked:
+                yield masked
+        yield stream.finish()
+
+
+class MaskStream:
+    """
+    Incrementally mask a text that arrives in chunks, in bounded memory.
+
+    ``Masker.mask`` runs every pattern on the output of the one before, so
+    the stream is a pipeline with a stage per pattern, each fed the text the
+    stage before has made final. Each stage holds the last ``masker.window``
+    characters it has seen back until the next chunk arrives, so a secret
+    split across two chunks is still matched as a whole, and keeps as much
+    of the text before them, as its pattern saw it, so that lookbehinds,
+    word boundaries and backreferences see their real context. Only matches
+    longer than the window, which is the longest match any pattern can
+    produce capped at ``max_match_length``, may be cut in two.
+    """
+
+    def __init__(self, masker: Masker):
+        self.masker = masker
+        self.window = masker.window
+        # The context and the held back text of every stage
+        self.stages: List[List[str]] = [["", ""] for _ in masker.rules]
+
+    def _safe_cut(self, regex: re.Pattern, code: str, start: int, cut: int) -> int:
+        """Move ``cut`` back until no match of ``regex`` straddles it."""
+        moved = True
+        while moved:
+            moved = False
+            for match in regex.finditer(code, max(start, cut - self.window)):
+                if match.start() >= cut:
+                    break
+                if match.end() > cut:
+                    cut = match.start()
+                    moved = True
+                    break
+        return cut
+
+    def _stage(self, i: int, text: str, final: bool = False) -> str:
+        """Feed ``text`` to the stage of pattern ``i``, returning what is final."""
+        stage = self.stages[i]
+        context, buffer = stage[0], stage[1] + text
+        if not final and len(buffer) < 2 * self.window:
+            stage[1] = buffer
+            return ""
+        code = context + buffer
+        start = len(context)
+        cut = len(code) if final else len(code) - self.window
+        rule = self.masker.rules[i]
+        folded = code.casefold() if rule.ignorecase else None
+        masked, masked_cut = code, cut
+        if not self.masker._may_match(rule, code, folded):
+            self.masker.stats["patterns_skipped"] += 1
+        else:
+            if not final:
+                cut = self._safe_cut(rule.regex, code, start, cut)
+                if cut <= start:
+                    # Only a match longer than the window leaves no safe cut
+                    cut = len(code) - self.window
+            masked, masked_cut = self.masker._run(i, code, start, cut)
+        if final:
+            stage[0] = stage[1] = ""
+            return masked[start:]
+        # The text after the cut is held back as it was, unmasked
+        cut = len(code) - (len(masked) - masked_cut)
+        stage[0] = code[max(0, cut - self.window) : cut]
+        stage[1] = code[cut:]
+        return masked[start:masked_cut]
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk of text and return the masked text that is final."""
+        text = chunk
+        for i in range(len(self.stages)):
+            text = self._stage(i, text)
+            if not text:
+                break
+        return text
+
+    def finish(self) -> str:
+        """Return the rest of the masked text."""
+        text = ""
+        for i in range(len(self.stages)):
+            text = self._stage(i, text, final=True)
+        return text
+
+
 def mask_sensitive_info(
     code: str, patterns: List[Union[str, Dict[str, Union[str, bool]]]]
 ) -> str:
-    for pattern in patterns:
-        if isinstance(pattern, str):
-            mask_func = create_mask_function()
-            code = re.sub(pattern, mask_func, code)
-        elif isinstance(pattern, dict):
-            mask_char = pattern.get("mask_char", "*")
-            preserve_length = pattern.get("preserve_length", True)
-            mask_func = create_mask_function(mask_char, preserve_length)
-            code = re.sub(pattern["pattern"], mask_func, code)
-    return code
+    """Mask sensitive information in ``code`` using the given patterns."""
+    return Masker(patterns).mask(code)
 
 
 # Example usage
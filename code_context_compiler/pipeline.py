@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from collections import deque
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def _as_async(items: Iterable[T]) -> AsyncIterator[T]:
+    for item in items:
+        yield item
+
+
+async def iterate_in_thread(
+    iterable: Iterable[T], maxsize: int = 0
+) -> AsyncIterator[T]:
+    """
+    Consume a blocking iterable on a background thread and yield its items,
+    so slow producers such as directory walks never block the event loop.
+
+    With a positive ``maxsize`` the thread waits whenever that many items
+    are waiting to be consumed, which bounds memory when items are large.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+    slots = threading.Semaphore(maxsize) if maxsize > 0 else None
+
+    def put(message) -> bool:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+            return True
+        except RuntimeError:  # The event loop is already closed
+            return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if slots is not None:
+                    slots.acquire()
+                if stop.is_set() or not put((item, None)):
+                    break
+            else:
+                put((done, None))
+        except BaseException as e:
+            put((done, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, name="ccc-producer", daemon=True).start()
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            if slots is not None:
+                slots.release()
+            yield item
+    finally:
+        stop.set()
+        if slots is not None:
+            # Wake the thread up if it is waiting for a slot
+            slots.release()
+
+
+async def ordered_map(
+    func: Callable[[T], Awaitable[R]],
+    items: Union[Iterable[T], AsyncIterable[T]],
+    jobs: int,
+) -> AsyncIterator[R]:
+    """
+    Run ``func`` over ``items`` with at most ``jobs`` calls in flight and yield
+    the results in input order.
+
+    Results that finish early are held in a reorder window of a few times
+    ``jobs`` entries, so a single slow item does not stall the other workers
+    and memory stays bounded however many items there are. ``items`` may be
+    an async iterable, in which case work starts as soon as the first items
+    arrive.
+    """
+    if not hasattr(items, "__aiter__"):
+        items = _as_async(items)
+    jobs = max(1, jobs)
+    semaphore = asyncio.Semaphore(jobs)
+    window = jobs * 4
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    pending = deque()
+    try:
+        async for item in items:
+            pending.append(asyncio.ensure_future(run(item)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,199 @@
+import asyncio
+import copy
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from code_context_compiler.masker import Masker, MaskStream
+
+# A batch is sent to a worker once it holds this many characters or files,
+# or once BATCH_DELAY has passed since its first text arrived.
+BATCH_CHARS = 256 * 1024
+BATCH_FILES = 64
+BATCH_DELAY = 0.002
+
+# The masker of a worker process, compiled once by _init_worker
+_worker_masker: Optional[Masker] = None
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_worker(patterns) -> None:
+    global _worker_masker
+    _worker_masker = Masker(patterns)
+
+
+def _reset_stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Zero ``stats`` in place, returning a copy of what it held."""
+    before = {}
+    for key, value in stats.items():
+        if isinstance(value, list):
+            before[key] = value[:]
+            value[:] = [0 * item for item in value]
+        else:
+            before[key] = value
+            stats[key] = 0
+    return before
+
+
+def _mask_batch(texts: List[str], timing: bool) -> Tuple[List[str], Dict[str, Any]]:
+    """Mask a batch of texts in a worker, returning them with their stats."""
+    _worker_masker.timing = timing
+    masked = [_worker_masker.mask(text) for text in texts]
+    return masked, _reset_stats(_worker_masker.stats)
+
+
+def _stream_step(
+    stages: List[List[str]], chunk: Optional[str], timing: bool
+) -> Tuple[str, List[List[str]], Dict[str, Any]]:
+    """
+    Feed ``chunk`` to a mask stream whose stages are in the state
+    ``stages``, or finish it when ``chunk`` is None, in a worker. Returns the
+    masked text, the new state and the stats.
+    """
+    _worker_masker.timing = timing
+    stream = MaskStream(_worker_masker)
+    stream.stages = stages
+    masked = stream.finish() if chunk is None else stream.feed(chunk)
+    return masked, stream.stages, _reset_stats(_worker_masker.stats)
+
+
+class PoolStream:
+    """
+    A ``MaskStream`` whose chunks are masked in the workers of a pool.
+
+    Only the state of the stream, the context and the text held back by each
+    stage, which are bounded by the window of the masker, travel with each
+    chunk, so any worker can take the next one. Chunks of one stream are masked in turn,
+    those of different streams in parallel.
+    """
+
+    def __init__(self, pool: "MaskPool"):
+        self.pool = pool
+        self.stages: List[List[str]] = [["", ""] for _ in pool.masker.rules]
+
+    async def _step(self, chunk: Optional[str]) -> str:
+        step = self.pool._executor.submit(
+            _stream_step, self.stages, chunk, self.pool.masker.timing
+        )
+        masked, self.stages, stats = await asyncio.wrap_future(step)
+        self.pool.masker.merge_stats(stats)
+        return masked
+
+    async def feed(self, chunk: str) -> str:
+        """Add a chunk of text and return the masked text that is final."""
+        return await self._step(chunk)
+
+    async def finish(self) -> str:
+        """Return the rest of the masked text."""
+        return await self._step(None)
+
+
+class MaskPool:
+    """
+    Mask texts in a pool of worker processes, so masking uses every core.
+
+    Workers are spawned rather than forked, since the scraper already runs
+    walker and writer threads by the time the first batch is sent. Each
+    worker compiles the mask patterns once, when it starts. Texts are
+    gathered into batches so that many small files travel to a worker in a
+    single task; every ``mask`` call still returns its own text, so callers
+    keep their order. The stats of the workers are merged into the stats of
+    ``masker``, the in-process masker the pool stands in for, and they time
+    every pattern when it has ``timing`` set.
+    """
+
+    def __init__(
+        self,
+        masker: Masker,
+        patterns: List[Any],
+        workers: int,
+        batch_chars: int = BATCH_CHARS,
+        batch_files: int = BATCH_FILES,
+    ):
+        self.masker = masker
+        self.workers = workers
+        self.batch_chars = batch_chars
+        self.batch_files = batch_files
+        self._executor = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(patterns,),
+        )
+        self._texts: List[str] = []
+        self._futures: List[asyncio.Future] = []
+        self._chars = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def mask(self, text: str) -> str:
+        """Mask ``text`` in a worker process."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._texts.append(text)
+        self._futures.append(future)
+        self._chars += len(text)
+        if self._chars >= self.batch_chars or len(self._texts) >= self.batch_files:
+            self._submit()
+        elif self._timer is None:
+            self._timer = loop.call_later(BATCH_DELAY, self._submit)
+        return await future
+
+    def fork(self, masker: Masker) -> "MaskPool":
+        """
+        Return a pool masking in the worker processes of this one, which
+        merges the stats of its own batches into ``masker`` instead. The
+        workers are shared, and are stopped by closing this pool.
+        """
+        forked = copy.copy(self)
+        forked.masker = masker
+        forked._texts, forked._futures, forked._chars = [], [], 0
+        forked._timer = None
+        return forked
+
+    def stream(self) -> PoolStream:
+        """Start masking a text that will be fed in chunks, in the workers."""
+        self.masker.stats["files"] += 1
+        return PoolStream(self)
+
+    def _submit(self) -> None:
+        """Send the current batch to a worker."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._texts:
+            return
+        texts, futures = self._texts, self._futures
+        self._texts, self._futures, self._chars = [], [], 0
+        batch = asyncio.wrap_future(
+            self._executor.submit(_mask_batch, texts, self.masker.timing)
+        )
+        batch.add_done_callback(lambda done: self._resolve(done, futures))
+
+    def _resolve(self, batch: asyncio.Future, futures: List[asyncio.Future]) -> None:
+        if batch.cancelled() or batch.exception() is not None:
+            for future in futures:
+                if not future.done():
+                    if batch.cancelled():
+                        future.cancel()
+                    else:
+                        future.set_exception(batch.exception())
+            return
+        masked, stats = batch.result()
+        self.masker.merge_stats(stats)
+        for future, text in zip(futures, masked):
+            if not future.done():
+                future.set_result(text)
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._executor.shutdown(wait=True)
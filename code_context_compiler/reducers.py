@@ -0,0 +1,278 @@
+import ast
+import asyncio
+import importlib
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Reducer = Callable[[str], str]
+
+# Reducers by file extension, as "module:function" so that worker processes
+# can import them. Files of other extensions fall back to strip_comments.
+REDUCERS: Dict[str, str] = {
+    ".py": "code_context_compiler.reducers:reduce_python",
+    ".pyi": "code_context_compiler.reducers:reduce_python",
+}
+
+# Line comment markers of the languages strip_comments knows. Languages
+# marked with a C-style "//" also have "/* ... */" block comments.
+_HASH = ("#",)
+_SLASHES = ("//",)
+COMMENT_PREFIXES: Dict[str, Tuple[str, ...]] = {
+    **dict.fromkeys((".py", ".pyi", ".sh", ".bash", ".zsh", ".rb", ".pl"), _HASH),
+    **dict.fromkeys((".r", ".yaml", ".yml", ".toml", ".cmake", ".mk"), _HASH),
+    **dict.fromkeys((".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".java"), _SLASHES),
+    **dict.fromkeys((".js", ".jsx", ".mjs", ".ts", ".tsx", ".go", ".rs"), _SLASHES),
+    **dict.fromkeys((".kt", ".swift", ".scala", ".dart", ".php"), _SLASHES),
+    **dict.fromkeys((".sql", ".lua", ".hs"), ("--",)),
+    ".ini": (";", "#"),
+}
+
+_LINE = re.compile(r"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+$")
+
+
+def register_reducer(extension: str, reducer: str) -> None:
+    """
+    Reduce the files ending with ``extension`` with ``reducer``, given as
+    ``"module:function"``. The function takes and returns the text of a
+    file, and must be importable by worker processes.
+    """
+    REDUCERS[extension.lower()] = reducer
+
+
+@lru_cache(maxsize=None)
+def load_reducer(reducer: str) -> Reducer:
+    """Import a reducer given as ``"module:function"``."""
+    module_name, _, attribute = reducer.partition(":")
+    if not attribute:
+        raise ValueError(f"Reducers are given as module:function, not {reducer}")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def strip_comments(text: str, prefixes: Tuple[str, ...] = ()) -> str:
+    """
+    Drop the blank lines, and the lines holding nothing but a comment that
+    starts with one of ``prefixes``, or C-style block comments when they
+    include ``//``. Block comments that start or end a line are cut from
+    it, and the code left on the line is kept.
+    """
+    block = "//" in prefixes
+    kept = []
+    in_block = False
+    for line in text.splitlines():
+        rest = line
+        if in_block:
+            end = rest.find("*/")
+            if end < 0:
+                continue
+            rest, in_block = rest[end + 2 :], False
+        while block and rest.lstrip().startswith("/*"):
+            rest = rest.lstrip()
+            end = rest.find("*/", 2)
+            if end < 0:
+                rest, in_block = "", True
+            else:
+                rest = rest[end + 2 :]
+        stripped = rest.strip()
+        if not stripped or (prefixes and stripped.startswith(prefixes)):
+            continue
+        if rest is not line:
+            # Keep the indentation of the line
+            rest = line[: len(line) - len(line.lstrip())] + rest.lstrip()
+        kept.append(rest)
+    return "".join(f"{line}\n" for line in kept)
+
+
+def _is_docstring(node: ast.stmt) -> bool:
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Constant)
+        and isinstance(node.value.value, str)
+    )
+
+
+class _Skeleton:
+    """The skeleton of a parsed Python module, built line by line."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lines = _LINE.findall(text)
+        self.starts = [0]
+        for line in self.lines:
+            self.starts.append(self.starts[-1] + len(line))
+        self.out: List[str] = []
+
+    def _offset(self, lineno: int, col_offset: int) -> int:
+        # Column offsets are in UTF-8 bytes
+        line = self.lines[lineno - 1]
+        column = len(line.encode("utf-8")[:col_offset].decode("utf-8", "ignore"))
+        return self.starts[lineno - 1] + column
+
+    def _indent(self, lineno: int) -> str:
+        line = self.lines[lineno - 1]
+        return line[: len(line) - len(line.lstrip())]
+
+    def _source(self, node: ast.AST) -> str:
+        start = self.starts[node.lineno - 1]
+        end = self._offset(node.end_lineno, node.end_col_offset)
+        return self.text[start:end].rstrip()
+
+    def _assignment(self, node: ast.stmt) -> str:
+        if node.lineno == node.end_lineno:
+            return self._source(node)
+        # Long values are left out
+        indent = self._indent(node.lineno)
+        if isinstance(node, ast.AnnAssign):
+            target = ast.get_source_segment(self.text, node.target)
+            annotation = ast.get_source_segment(self.text, node.annotation)
+            if node.value is None:
+                return f"{indent}{target}: {annotation}"
+            return f"{indent}{target}: {annotation} = ..."
+        targets = " = ".join(
+            ast.get_source_segment(self.text, target) for target in node.targets
+        )
+        return f"{indent}{targets} = ..."
+
+    def _definition(self, node: ast.stmt) -> None:
+        first = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        body = node.body[0]
+        start = self.starts[first - 1]
+        decorators = getattr(body, "decorator_list", [])
+        if decorators:
+            # The decorators of the first member start on lines of their own
+            end = self.starts[min(d.lineno for d in decorators) - 1]
+        else:
+            end = self._offset(body.lineno, body.col_offset)
+        header = self.text[start:end].rstrip()
+        self.out.append(header)
+        header_end = first + header.count("\n")
+        if body.lineno > header_end:
+            indent = self._indent(body.lineno)
+        else:
+            indent = self._indent(node.lineno) + "    "
+        members = node.body
+        if _is_docstring(body):
+            docstring = ast.get_source_segment(self.text, body.value)
+            self.out.append(f"{indent}{docstring}")
+            members = node.body[1:]
+        if isinstance(node, ast.ClassDef):
+            count = len(self.out)
+            self.statements(members)
+            if len(self.out) > count or _is_docstring(body):
+                return
+        elif _is_docstring(body):
+            return
+        self.out.append(f"{indent}...")
+
+    def statements(self, nodes: List[ast.stmt], top_level: bool = False) -> None:
+        for node in nodes:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                self.out.append(self._source(node))
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                self.out.append(self._assignment(node))
+            elif isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                if top_level and self.out:
+                    self.out.append("")
+                self._definition(node)
+
+
+def reduce_python(text: str) -> str:
+    """
+    Reduce Python source to its skeleton: the module docstring, imports,
+    module and class level assignments, and the signatures of classes and
+    functions with their docstrings. Function bodies become ``...``.
+
+    Source that does not parse only has its comments and blank lines
+    stripped.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return strip_comments(text, _HASH)
+    skeleton = _Skeleton(text)
+    nodes = tree.body
+    if nodes and _is_docstring(nodes[0]):
+        skeleton.out.append(skeleton._source(nodes[0]))
+        nodes = nodes[1:]
+    skeleton.statements(nodes, top_level=True)
+    return "".join(f"{line}\n" for line in skeleton.out)
+
+
+def reduce_file(relative_path: str, text: str, reducers: Dict[str, str]) -> str:
+    """
+    Reduce the text of a file with the reducer of its extension, stripping
+    comments and blank lines from other code. Files of unknown languages
+    are left as they are.
+    """
+    ext = os.path.splitext(relative_path)[1].lower()
+    reducer = reducers.get(ext)
+    if reducer is not None:
+        return load_reducer(reducer)(text)
+    prefixes = COMMENT_PREFIXES.get(ext)
+    if prefixes is None:
+        return text
+    return strip_comments(text, prefixes)
+
+
+class Skeleton:
+    """
+    Reduce files to their skeleton in-process.
+
+    ``reducers`` maps extensions to reducers, as ``REDUCERS`` does.
+    """
+
+    def __init__(self, reducers: Dict[str, str]):
+        self.reducers = dict(reducers)
+        for reducer in self.reducers.values():
+            # Fail early on a reducer that cannot be imported
+            load_reducer(reducer)
+
+    async def reduce(self, relative_path: str, text: str) -> str:
+        """Reduce the text of a file."""
+        return reduce_file(relative_path, text, self.reducers)
+
+    def close(self) -> None:
+        pass
+
+
+class SkeletonPool(Skeleton):
+    """
+    Reduce files to their skeleton in a pool of worker processes, since
+    parsing is CPU-bound. Like ``MaskPool``, workers are spawned rather than
+    forked.
+    """
+
+    def __init__(self, reducers: Dict[str, str], workers: int):
+        super().__init__(reducers)
+        self._executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def reduce(self, relative_path: str, text: str) -> str:
+        """Reduce the text of a file in a worker process."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, reduce_file, relative_path, text, self.reducers
+        )
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        self._executor.shutdown(wait=True)
+
+
+def skeleton_reducers(config: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """
+    Return the reducers of skeleton mode, the built-in ones overridden by
+    ``config["reducers"]``, or None unless ``config["skeleton"]`` is set.
+    """
+    if not config.get("skeleton", False):
+        return None
+    return {
+        **REDUCERS,
+        **{ext.lower(): r for ext, r in (config.get("reducers") or {}).items()},
+    }
@@ -0,0 +1,96 @@
+import json
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from code_context_compiler.ignore import _GitIgnore, compile_ignore_patterns
+from code_context_compiler.masker import Masker
+
+if TYPE_CHECKING:
+    from code_context_compiler.pool import MaskPool
+    from code_context_compiler.reducers import SkeletonPool
+
+
+def _key(patterns: List[Any]) -> str:
+    # Mask patterns may be dicts, which are not hashable
+    return json.dumps(patterns, sort_keys=True)
+
+
+class Runtime:
+    """
+    Compiled state shared by every project scraped in one process.
+
+    Maskers, ignore pattern regexes, ``.gitignore`` files, masking pools and
+    the pools of skeleton mode are created once for each distinct
+    configuration and reused by every project with the same one, instead of
+    once per project. Each project masks with a fork of the shared masker
+    and pool, which keeps its stats and timing apart from those of projects
+    scraped alongside it. ``close`` stops the pools.
+    """
+
+    def __init__(self):
+        self._maskers: Dict[str, Masker] = {}
+        self._pools: Dict[Tuple[str, int], "MaskPool"] = {}
+        self._skeletons: Dict[Tuple[str, int], "SkeletonPool"] = {}
+        self._ignore_regexes: Dict[Tuple[str, ...], Optional[re.Pattern]] = {}
+        self._gitignores: Dict[Tuple[str, ...], _GitIgnore] = {}
+
+    def masker(self, patterns: List[Any]) -> Masker:
+        """Return a masker of ``patterns``, with stats of its own."""
+        key = _key(patterns)
+        masker = self._maskers.get(key)
+        if masker is None:
+            masker = self._maskers[key] = Masker(patterns)
+        return masker.fork()
+
+    def pool(self, masker: Masker, patterns: List[Any], workers: int) -> "MaskPool":
+        """
+        Return a pool of ``workers`` processes masking with ``patterns``,
+        whose stats are merged into ``masker``.
+        """
+        key = (_key(patterns), workers)
+        pool = self._pools.get(key)
+        if pool is None:
+            from code_context_compiler.pool import MaskPool
+
+            shared = self.masker(patterns)
+            pool = self._pools[key] = MaskPool(shared, patterns, workers)
+        return pool.fork(masker)
+
+    def skeleton(self, reducers: Dict[str, str], workers: int) -> "SkeletonPool":
+        """Return a pool of ``workers`` processes reducing with ``reducers``."""
+        key = (_key(reducers), workers)
+        skeleton = self._skeletons.get(key)
+        if skeleton is None:
+            from code_context_compiler.reducers import SkeletonPool
+
+            skeleton = self._skeletons[key] = SkeletonPool(reducers, workers)
+        return skeleton
+
+    def ignore_regex(self, ignore_patterns: List[str]) -> Optional[re.Pattern]:
+        """Return ``compile_ignore_patterns(ignore_patterns)``, compiled once."""
+        key = tuple(ignore_patterns)
+        if key not in self._ignore_regexes:
+            self._ignore_regexes[key] = compile_ignore_patterns(ignore_patterns)
+        return self._ignore_regexes[key]
+
+    def gitignore(self, lines: List[str]) -> _GitIgnore:
+        """Return the compiled patterns of a ``.gitignore`` file."""
+        key = tuple(lines)
+        gitignore = self._gitignores.get(key)
+        if gitignore is None:
+            # Walker threads may compile the same file twice; either is kept
+            gitignore = self._gitignores[key] = _GitIgnore(lines)
+        return gitignore
+
+    def close(self) -> None:
+        """Stop the worker processes of the pools."""
+        pools, self._pools = self._pools, {}
+        skeletons, self._skeletons = self._skeletons, {}
+        for pool in [*pools.values(), *skeletons.values()]:
+            pool.close()
+
+    def __enter__(self) -> "Runtime":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
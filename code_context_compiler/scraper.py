@@ -1,22 +1,65 @@
 import asyncio
 import fnmatch
-import json
+import locale
 import logging
 import mimetypes
+import mmap
 import os
+import time
+from datetime import date, datetime
 from pathlib import Path
-from typing import Any, Callable, Dict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import aiofiles
-import git
-import pathspec
-import yaml
+from code_context_compiler.budget import Budget
+from code_context_compiler.cache import FileCache, config_fingerprint, content_digest
+from code_context_compiler.config import DEFAULT_CONFIG
+from code_context_compiler.dedupe import Deduplicator
+from code_context_compiler.ignore import IgnoreMatcher
+from code_context_compiler.index import SectionIndex
+from code_context_compiler.masker import Masker
+from code_context_compiler.pipeline import iterate_in_thread, ordered_map
+from code_context_compiler.sink import STDOUT, OutputSink, compression_for
+from code_context_compiler.stats import ScrapeStats
+from code_context_compiler.walker import ProjectWalker, WalkEntry
+from code_context_compiler.writers import FileRecord, TextWriter, get_writer
 
-from code_context_compiler.ai_prompt import AI_PROMPT
-from code_context_compiler.masker import mask_sensitive_info
+if TYPE_CHECKING:
+    import pathspec
 
-# Initialize mimetypes
-mimetypes.init()
+    from code_context_compiler.gitrev import TreeEntry
+    from code_context_compiler.pool import MaskPool
+    from code_context_compiler.reducers import Skeleton
+    from code_context_compiler.runtime import Runtime
+
+# GitPython, pathspec and multiprocessing are slow to import, so they are
+# only imported by the code that needs them. The mimetypes database is
+# likewise loaded on the first call to is_media_file rather than at import
+# time.
+
+# Encoding used to read files, the same default as open() in text mode
+TEXT_ENCODING = locale.getpreferredencoding(False)
+
+# Only this much of a file is inspected to tell binary content from text
+SNIFF_BYTES = 8192
+
+# Text files at least this large are memory-mapped rather than copied into
+# a bytes object before being decoded
+MMAP_THRESHOLD = 1024 * 1024
+
+# Bytes commonly found in text files
+_TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7F})
 
 
 def setup_logging(debug: bool):
@@ -36,7 +79,9 @@ def is_media_file(file_path: str) -> bool:
     return False
 
 
-def load_gitignore(project_path: str) -> pathspec.PathSpec:
+def load_gitignore(project_path: str) -> "pathspec.PathSpec":
+    import pathspec
+
     gitignore_path = os.path.join(project_path, ".gitignore")
     if os.path.exists(gitignore_path):
         with open(gitignore_path, "r") as gitignore_file:
@@ -48,7 +93,7 @@ def load_gitignore(project_path: str) -> pathspec.PathSpec:
 def is_ignored(
     file_path: str,
     project_path: str,
-    gitignore_spec: pathspec.PathSpec,
+    gitignore_spec: "pathspec.PathSpec",
     ignore_patterns: list,
     logger: logging.Logger,
 ) -> bool:
@@ -81,46 +126,922 @@ def is_ignored(
     return False
 
 
+def has_extension(relative_path: str, config: Dict[str, Any]) -> bool:
+    """Check a path against ``file_extensions`` (all files match when empty)."""
+    return not config["file_extensions"] or any(
+        relative_path.endswith(ext) for ext in config["file_extensions"]
+    )
+
+
+def to_timestamp(value: Union[int, float, str, date]) -> float:
+    """
+    Convert seconds since the epoch, an ISO 8601 date or time, or a date or
+    datetime (as parsed from YAML) to seconds since the epoch. Times without
+    a timezone are local.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value.timestamp()
+
+
 def get_git_tracked_files(project_path: str) -> set:
     """Get a set of files tracked by Git."""
+    import git
+
     repo = git.Repo(project_path)
     return set(repo.git.ls_files().splitlines())
 
 
+def is_binary(probe: bytes) -> bool:
+    """Guess from the first bytes of a file whether it is binary."""
+    if b"\0" in probe:
+        return True
+    controls = len(probe.translate(None, _TEXT_BYTES))
+    try:
+        probe.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # The probe may end in the middle of a multi-byte character
+        if e.reason != "unexpected end of data":
+            # Not UTF-8: text in a legacy encoding has hardly any controls
+            return controls > len(probe) * 0.1
+    return controls > len(probe) * 0.3
+
+
+def decode_text(data) -> str:
+    """Decode file content the same way reading the file in text mode would."""
+    text = str(data, TEXT_ENCODING, "ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _content_key(digest: str, relative_path: str, reduced: bool) -> str:
+    # The same content is reduced differently under another extension
+    if not reduced:
+        return digest
+    return f"{digest}:{os.path.splitext(relative_path)[1].lower()}"
+
+
+def _read_file(
+    entry: WalkEntry,
+    cache: Optional[FileCache] = None,
+    hashed: bool = False,
+    reduced: bool = False,
+):
+    """
+    Read a file, meant to run on a worker thread.
+
+    Returns ``(cached, text, key)``: the cached record of the file if it has
+    one, otherwise its decoded text (None if it is binary), and the key to
+    cache its masked text under, ``(size, mtime_ns, digest)``. The key is
+    also returned with cached records when ``hashed`` is set, and then
+    computed even without a cache. With ``reduced``, the digest also covers
+    the extension of the file.
+    """
+    if cache is not None:
+        cached = cache.lookup(entry.relative_path, entry.size, entry.mtime_ns)
+        if cached is not None:
+            if hashed:
+                digest = cache.digest(entry.relative_path)
+                return cached, None, (entry.size, entry.mtime_ns, digest)
+            return cached, None, None
+
+    with open(entry.path, "rb") as f:
+        # Sniff the start of the file before reading the rest of it
+        probe = f.read(SNIFF_BYTES)
+        if is_binary(probe):
+            return None, None, None
+        if len(probe) < SNIFF_BYTES:
+            data = probe
+        elif entry.size < MMAP_THRESHOLD:
+            data = probe + f.read()
+        else:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                data = probe + f.read()
+
+    try:
+        key = None
+        if cache is not None or hashed:
+            digest = _content_key(content_digest(data), entry.relative_path, reduced)
+            key = (entry.size, entry.mtime_ns, digest)
+        if cache is not None:
+            cached = cache.lookup(entry.relative_path, *key)
+            if cached is not None:
+                return cached, None, key if hashed else None
+        return None, decode_text(data), key
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def _sniff(path: str) -> bool:
+    """Check whether a file is binary from its first bytes."""
+    with open(path, "rb") as f:
+        return is_binary(f.read(SNIFF_BYTES))
+
+
+async def _mask_chunks(
+    entry: WalkEntry,
+    masker: Masker,
+    chunk_size: int,
+    stats: Optional[ScrapeStats] = None,
+    pool: Optional["MaskPool"] = None,
+) -> AsyncIterator[str]:
+    """
+    Read and mask a file chunk by chunk, yielding its masked text.
+
+    Chunks are masked by ``pool`` when one is given, otherwise on a worker
+    thread, so the event loop is never blocked by a large file.
+    """
+    loop = asyncio.get_running_loop()
+    f = await loop.run_in_executor(
+        None, lambda: open(entry.path, "r", encoding=TEXT_ENCODING, errors="ignore")
+    )
+    read = f.read
+    if stats is not None:
+        stats.bytes_read += entry.size
+        read = stats.timed("read", read)
+    if pool is not None:
+        stream = pool.stream()
+    else:
+        # Masked on another thread, with stats of its own merged once done
+        forked = masker.fork()
+        stream = forked.stream()
+
+    async def mask(chunk: Optional[str]) -> str:
+        if stats is not None:
+            started = time.perf_counter()
+        if pool is not None:
+            masked = await (stream.finish() if chunk is None else stream.feed(chunk))
+        elif chunk is None:
+            masked = await loop.run_in_executor(None, stream.finish)
+        else:
+            masked = await loop.run_in_executor(None, stream.feed, chunk)
+        if stats is not None:
+            stats.add_time("mask", time.perf_counter() - started)
+        return masked
+
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, read, chunk_size)
+            if not chunk:
+                break
+            masked = await mask(chunk)
+            if masked:
+                yield masked
+        yield await mask(None)
+    finally:
+        f.close()
+        if pool is None:
+            masker.merge_stats(forked.stats)
+
+
+async def load_file(
+    entry: WalkEntry,
+    masker: Masker,
+    logger: logging.Logger,
+    cache: Optional[FileCache] = None,
+    max_file_size: Optional[int] = None,
+    chunk_threshold: Optional[int] = None,
+    chunk_size: int = DEFAULT_CONFIG["chunk_size"],
+    pool: Optional["MaskPool"] = None,
+    stats: Optional[ScrapeStats] = None,
+    dedupe: Optional[Deduplicator] = None,
+    skeleton: Optional["Skeleton"] = None,
+) -> Tuple[str, Union[str, AsyncIterator[str]], Optional[str]]:
+    """
+    Read and mask a single file, returning its kind, masked content and
+    content id.
+
+    Files of at least ``chunk_threshold`` bytes are not read here: their
+    content is an async iterator that reads and masks them ``chunk_size``
+    characters at a time while the record is written, and are never
+    reduced. Other files are reduced to their skeleton by ``skeleton`` when
+    one is given. Both are masked by ``pool`` when one is given. Time spent
+    reading, reducing and masking is added to ``stats`` when given.
+
+    The content id, the hash of a text file, is only computed with
+    ``dedupe``, which then masks each distinct content once. The content
+    is empty when a copy of it was written already.
+    """
+    relative_path = entry.relative_path
+    if is_media_file(entry.path):
+        logger.debug(f"Media file detected: {relative_path}")
+        return "media", "", None
+    if max_file_size is not None and entry.size > max_file_size:
+        logger.debug(f"Large file skipped ({entry.size} bytes): {relative_path}")
+        return "large", "", None
+
+    loop = asyncio.get_running_loop()
+    if chunk_threshold is not None and entry.size >= chunk_threshold:
+        if await loop.run_in_executor(None, _sniff, entry.path):
+            logger.debug(f"Binary file detected: {relative_path}")
+            return "binary", "", None
+        logger.debug(f"Masking file in chunks ({entry.size} bytes): {relative_path}")
+        return "text", _mask_chunks(entry, masker, chunk_size, stats, pool), None
+
+    read = _read_file if stats is None else stats.timed("read", _read_file)
+    cached, text, key = await loop.run_in_executor(
+        None, read, entry, cache, dedupe is not None, skeleton is not None
+    )
+    content_id = key[2] if dedupe is not None and key is not None else None
+    if cached is not None:
+        logger.debug(f"Cache hit: {relative_path}")
+        return (*cached, content_id)
+    if text is None:
+        logger.debug(f"Binary file detected: {relative_path}")
+        return "binary", "", None
+
+    content = await _mask_text(
+        text, entry.size, masker, pool, stats, content_id, dedupe, skeleton, entry
+    )
+    if content is None:
+        logger.debug(f"Identical to a file written already: {relative_path}")
+        return "text", "", content_id
+    logger.debug(f"Processed file: {relative_path}")
+    if cache is not None:
+        await loop.run_in_executor(
+            None, cache.store, relative_path, *key, "text", content
+        )
+    return "text", content, content_id
+
+
+async def _mask_text(
+    text: str,
+    size: int,
+    masker: Masker,
+    pool: Optional["MaskPool"] = None,
+    stats: Optional[ScrapeStats] = None,
+    content_id: Optional[str] = None,
+    dedupe: Optional[Deduplicator] = None,
+    skeleton: Optional["Skeleton"] = None,
+    entry: Any = None,
+) -> Optional[str]:
+    """
+    Mask the text of a file, once per content with ``dedupe``, reducing it
+    first with ``skeleton``, by the extension of ``entry``.
+    """
+
+    async def mask() -> str:
+        source = text
+        if stats is not None:
+            stats.bytes_read += size
+            started = time.perf_counter()
+        if skeleton is not None:
+            source = await skeleton.reduce(entry.relative_path, text)
+            if stats is not None:
+                stats.add_time("reduce", time.perf_counter() - started)
+                started = time.perf_counter()
+        content = masker.mask(source) if pool is None else await pool.mask(source)
+        if stats is not None:
+            stats.add_time("mask", time.perf_counter() - started)
+        return content
+
+    if dedupe is None:
+        return await mask()
+    return await dedupe.mask(content_id, mask)
+
+
+async def process_record(
+    entry: WalkEntry,
+    config: Dict[str, Any],
+    logger: logging.Logger,
+    masker: Optional[Masker] = None,
+    cache: Optional[FileCache] = None,
+    pool: Optional["MaskPool"] = None,
+    stats: Optional[ScrapeStats] = None,
+    dedupe: Optional[Deduplicator] = None,
+    skeleton: Optional["Skeleton"] = None,
+) -> Optional[FileRecord]:
+    """Read and mask a single file, returning its record (None if skipped)."""
+    if masker is None:
+        masker = Masker(config["mask_patterns"])
+    relative_path = entry.relative_path
+
+    # If file_extensions is not empty, check the extension
+    if not has_extension(relative_path, config):
+        logger.debug(f"Skipping file due to extension: {relative_path}")
+        if stats is not None:
+            stats.skip("extension")
+        return None
+
+    if stats is not None:
+        started = time.perf_counter()
+    kind, content, content_id = await load_file(
+        entry,
+        masker,
+        logger,
+        cache,
+        config.get("max_file_size"),
+        config.get("chunk_threshold", DEFAULT_CONFIG["chunk_threshold"]),
+        config.get("chunk_size", DEFAULT_CONFIG["chunk_size"]),
+        pool,
+        stats,
+        dedupe,
+        skeleton,
+    )
+    if stats is not None:
+        stats.file_done(relative_path, kind, time.perf_counter() - started)
+    return FileRecord(relative_path, kind, content, content_id)
+
+
+def list_revision(
+    project_path: str,
+    rev: str,
+    config: Dict[str, Any],
+    logger: logging.Logger,
+    stats: Optional[ScrapeStats] = None,
+    runtime: Optional["Runtime"] = None,
+) -> List["TreeEntry"]:
+    """
+    List the files of the git revision ``rev`` to compile, leaving out those
+    matched by the ignore patterns or by the ``.gitignore`` files of the
+    revision itself, and those with other extensions than ``file_extensions``.
+    """
+    from code_context_compiler.gitrev import BlobReader, list_tree
+
+    entries = list_tree(project_path, rev)
+    gitignores = {}
+    with BlobReader(project_path) as reader:
+        for entry in entries:
+            relative_dir, name = os.path.split(entry.relative_path)
+            if name == ".gitignore":
+                text = decode_text(reader.read(entry.sha))
+                gitignores[relative_dir] = text.splitlines()
+    matcher = IgnoreMatcher(
+        project_path, config["ignore_patterns"], logger, gitignores, runtime
+    )
+    is_ignored = matcher.is_ignored
+    if stats is not None:
+        is_ignored = stats.timed("filter", is_ignored)
+
+    ignored_dirs: Dict[str, bool] = {"": False}
+
+    def is_dir_ignored(relative_dir: str) -> bool:
+        # Like the walker, count an ignored directory once and skip its files
+        if relative_dir not in ignored_dirs:
+            ignored = is_dir_ignored(os.path.dirname(relative_dir))
+            if not ignored and is_ignored(relative_dir, is_dir=True):
+                ignored = True
+                if stats is not None:
+                    stats.skip("ignored")
+            ignored_dirs[relative_dir] = ignored
+        return ignored_dirs[relative_dir]
+
+    files = []
+    for entry in entries:
+        relative_path = entry.relative_path
+        if is_dir_ignored(os.path.dirname(relative_path)):
+            continue
+        if is_ignored(relative_path):
+            if stats is not None:
+                stats.skip("ignored")
+            continue
+        if not has_extension(relative_path, config):
+            logger.debug(f"Skipping file due to extension: {relative_path}")
+            if stats is not None:
+                stats.skip("extension")
+            continue
+        files.append(entry)
+    return files
+
+
+def _placeholder_kind(
+    relative_path: str, size: int, max_file_size: Optional[int]
+) -> Optional[str]:
+    """The kind of a file that is replaced by a placeholder without being read."""
+    if is_media_file(relative_path):
+        return "media"
+    if max_file_size is not None and size > max_file_size:
+        return "large"
+    return None
+
+
+def _read_blobs(
+    project_path: str,
+    entries: List["TreeEntry"],
+    cache: Optional[FileCache] = None,
+    max_file_size: Optional[int] = None,
+    stats: Optional[ScrapeStats] = None,
+    reduced: bool = False,
+) -> Iterator[Tuple["TreeEntry", Optional[Tuple[str, str]], Optional[str]]]:
+    """
+    Read the blobs of a revision in order, meant to run on a worker thread.
+
+    Yields ``(entry, cached, text)`` like ``_read_file`` returns: the cached
+    record of the blob if it has one, otherwise its decoded text (None if
+    it is binary, or if it is a media or large file and was not read).
+    With ``reduced``, blobs are cached by object id and extension.
+    """
+    from code_context_compiler.gitrev import BlobReader
+
+    with BlobReader(project_path) as reader:
+        read = reader.read if stats is None else stats.timed("read", reader.read)
+        for entry in entries:
+            if _placeholder_kind(entry.relative_path, entry.size, max_file_size):
+                yield entry, None, None
+                continue
+            key = _content_key(entry.sha, entry.relative_path, reduced)
+            if cache is not None:
+                cached = cache.lookup_blob(key)
+                if cached is not None:
+                    yield entry, cached, None
+                    continue
+            data = read(entry.sha)
+            if is_binary(data[:SNIFF_BYTES]):
+                if cache is not None:
+                    cache.store_blob(key, "binary", "")
+                yield entry, None, None
+                continue
+            yield entry, None, decode_text(data)
+
+
+def _interleave(items: List[Any], blobs: Iterator[Any]) -> Iterator[Any]:
+    """Yield the records of ``items``, and the next blob for each other item."""
+    try:
+        for item in items:
+            yield item if isinstance(item, FileRecord) else next(blobs)
+    finally:
+        blobs.close()
+
+
+async def process_blob(
+    item: Tuple["TreeEntry", Optional[Tuple[str, str]], Optional[str]],
+    config: Dict[str, Any],
+    logger: logging.Logger,
+    masker: Masker,
+    cache: Optional[FileCache] = None,
+    pool: Optional["MaskPool"] = None,
+    stats: Optional[ScrapeStats] = None,
+    dedupe: Optional[Deduplicator] = None,
+    skeleton: Optional["Skeleton"] = None,
+) -> FileRecord:
+    """
+    Mask a file of a git revision read by ``_read_blobs``, returning its record.
+
+    The masked content is cached under the object id of the blob, so a file
+    is masked once for every revision that shares its content. The object
+    id also serves as the content id for ``dedupe``. With ``skeleton``, both
+    also cover the extension of the file.
+    """
+    entry, cached, text = item
+    relative_path = entry.relative_path
+    key = _content_key(entry.sha, relative_path, skeleton is not None)
+    if stats is not None:
+        started = time.perf_counter()
+    content_id = None
+    kind = _placeholder_kind(relative_path, entry.size, config.get("max_file_size"))
+    if kind is not None:
+        logger.debug(f"File replaced by a {kind} placeholder: {relative_path}")
+        content = ""
+    elif cached is not None:
+        logger.debug(f"Cache hit: {relative_path}")
+        kind, content = cached
+        if dedupe is not None and kind == "text":
+            content_id = key
+    elif text is None:
+        logger.debug(f"Binary file detected: {relative_path}")
+        kind, content = "binary", ""
+    else:
+        kind = "text"
+        if dedupe is not None:
+            content_id = key
+        content = await _mask_text(
+            text, entry.size, masker, pool, stats, content_id, dedupe, skeleton, entry
+        )
+        if content is None:
+            logger.debug(f"Identical to a file written already: {relative_path}")
+            content = ""
+        else:
+            logger.debug(f"Processed file: {relative_path}")
+            if cache is not None:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, cache.store_blob, key, kind, content)
+    if stats is not None:
+        stats.file_done(relative_path, kind, time.perf_counter() - started)
+    return FileRecord(relative_path, kind, content, content_id)
+
+
 async def process_file(
     file_path: str,
     project_path: str,
     config: Dict[str, Any],
     out_file,
     logger: logging.Logger,
+    masker: Optional[Masker] = None,
 ) -> None:
     """Process a single file: read, mask sensitive info, and write to output."""
-    relative_path = os.path.relpath(file_path, project_path)
+    entry = WalkEntry.from_path(file_path, project_path)
+    record = await process_record(entry, config, logger, masker)
+    if record is not None:
+        await TextWriter(out_file).write_record(record)
 
-    # If file_extensions is not empty, check the extension
-    if config["file_extensions"] and not any(
-        relative_path.endswith(ext) for ext in config["file_extensions"]
+
+class _Scrape:
+    """
+    A scrape of one project: what to compile, and the cache, masker, budget
+    and pool to compile it with.
+
+    ``items`` lists the files to compile and ``records`` turns them into
+    the records to write, in output order. ``scrape_project`` writes those
+    records with ``writer_class``, which sizes them for the budget, and
+    ``iter_records`` yields them.
+    """
+
+    def __init__(
+        self,
+        project_path: str,
+        config: Dict[str, Any],
+        logger: logging.Logger,
+        stats: Optional[ScrapeStats] = None,
+        runtime: Optional["Runtime"] = None,
+        progress_callback: Optional[Callable[[float], None]] = None,
+        writer_class: Any = TextWriter,
     ):
-        logger.debug(f"Skipping file due to extension: {relative_path}")
-        return
+        self.project_path = project_path
+        self.logger = logger
+        self.stats = stats
+        self.runtime = runtime
+        self.progress_callback = progress_callback
+        self.total_files = 0
+        self.done = 0
+        self.progress = 0.0
 
-    await out_file.write(f"File: {relative_path}\n")
+        self.rev = rev = config.get("rev")
+        self.git_tracked_files = (
+            get_git_tracked_files(project_path)
+            if config["use_git"] and not rev
+            else None
+        )
 
-    if is_media_file(file_path):
-        logger.debug(f"Media file detected: {relative_path}")
-        await out_file.write(f"[MEDIA FILE PLACEHOLDER: {relative_path}]\n\n")
-    else:
-        async with aiofiles.open(file_path, "r", errors="ignore") as f:
-            try:
-                code = await f.read()
-                masked_code = mask_sensitive_info(code, config["mask_patterns"])
-                await out_file.write(masked_code)
-                logger.debug(f"Processed file: {relative_path}")
-            except UnicodeDecodeError:
-                logger.warning(f"Unable to decode file as text: {relative_path}")
-                await out_file.write(f"[BINARY FILE PLACEHOLDER: {relative_path}]\n")
+        since, since_mtime = config.get("since"), config.get("since_mtime")
+        if since and since_mtime is not None:
+            raise ValueError("since and since_mtime cannot be combined")
+        if rev and since_mtime is not None:
+            raise ValueError("since_mtime cannot be combined with rev")
+        self.changed_paths = None
+        subtrees = None
+        if since:
+            from code_context_compiler.gitrev import changed_files
+
+            self.changed_paths = changed_files(project_path, since, rev)
+            logger.info(f"{len(self.changed_paths)} files changed since {since}")
+            if not config.get("list_unchanged", False):
+                # Only the directories holding changes need to be walked
+                subtrees = set()
+                for relative_path in self.changed_paths:
+                    relative_dir = os.path.dirname(relative_path)
+                    while relative_dir and relative_dir not in subtrees:
+                        subtrees.add(relative_dir)
+                        relative_dir = os.path.dirname(relative_dir)
+        self.since_ns = None
+        if since_mtime is not None:
+            self.since_ns = int(to_timestamp(since_mtime) * 1_000_000_000)
+
+        self.cache = None
+        if config.get("cache", False):
+            cache_dir = os.path.join(
+                project_path, config.get("cache_dir", DEFAULT_CONFIG["cache_dir"])
+            )
+            self.cache = FileCache(
+                cache_dir,
+                config_fingerprint(config),
+                config.get("cache_max_bytes", DEFAULT_CONFIG["cache_max_bytes"]),
+            )
+            # Never compile the cache into its own project
+            config = {
+                **config,
+                "ignore_patterns": [
+                    *config["ignore_patterns"],
+                    os.path.relpath(cache_dir, project_path) + "/",
+                ],
+            }
+        self.config = config
+
+        # Files are read and masked concurrently, but ``records`` yields them
+        # in discovery order, so the output is identical to processing the
+        # files one by one.
+        if runtime is None:
+            self.masker = Masker(config["mask_patterns"])
+        else:
+            self.masker = runtime.masker(config["mask_patterns"])
+        self.masker.timing = stats is not None
+        self.dedupe = Deduplicator() if config.get("dedupe", False) else None
+        self.budget = Budget.from_config(config, writer_class)
+        self.jobs = config.get("jobs", DEFAULT_CONFIG["jobs"])
+        workers = config.get("workers", DEFAULT_CONFIG["workers"])
+        if workers != 1:
+            from code_context_compiler.pool import available_cpus
+
+            workers = workers or available_cpus()
+            # Keep enough files in flight to fill every worker's batches
+            self.jobs = max(self.jobs, workers * 4)
+
+        matcher = IgnoreMatcher(
+            project_path, config["ignore_patterns"], logger, runtime=runtime
+        )
+        if stats is not None:
+            is_ignored = stats.timed("filter", matcher.is_ignored)
+
+            def count_ignored(relative_path: str, is_dir: bool = False) -> bool:
+                ignored = is_ignored(relative_path, is_dir)
+                if ignored:
+                    stats.skip("ignored")
+                return ignored
+
+            matcher.is_ignored = count_ignored
+        self.walker = ProjectWalker(project_path, matcher, logger, subtrees=subtrees)
+
+        self.pool = None
+        if workers != 1:
+            from code_context_compiler.pool import MaskPool
+
+            logger.debug(f"Masking in {workers} worker processes")
+            if runtime is None:
+                self.pool = MaskPool(self.masker, config["mask_patterns"], workers)
+            else:
+                self.pool = runtime.pool(self.masker, config["mask_patterns"], workers)
+
+        self.skeleton = None
+        if config.get("skeleton", False):
+            from code_context_compiler.pool import available_cpus
+            from code_context_compiler.reducers import SkeletonPool, skeleton_reducers
+
+            # Parsing is CPU-bound: reduce in as many processes as there are
+            # files in flight, up to one per CPU
+            processes = workers if workers != 1 else min(self.jobs, available_cpus())
+            reducers = skeleton_reducers(config)
+            logger.debug(f"Reducing files to their skeleton in {processes} processes")
+            if runtime is None:
+                self.skeleton = SkeletonPool(reducers, processes)
+            else:
+                self.skeleton = runtime.skeleton(reducers, processes)
+
+    def _is_changed(self, relative_path: str, mtime_ns: Optional[int] = None) -> bool:
+        if self.changed_paths is not None:
+            return relative_path in self.changed_paths
+        if self.since_ns is not None:
+            return mtime_ns >= self.since_ns
+        return True
+
+    def _unchanged(self, relative_path: str) -> Optional[FileRecord]:
+        # Unchanged files are either left out or listed without being read
+        if self.stats is not None:
+            self.stats.skip("unchanged")
+        if self.config.get("list_unchanged", False) and has_extension(
+            relative_path, self.config
+        ):
+            return FileRecord(relative_path, "unchanged", "")
+        return None
+
+    def _pack(self, items: List[Any]) -> List[Any]:
+        # Rank every file that would be read and replace those that do not
+        # fit in the budget by placeholders, before anything is read
+        max_file_size = self.config.get("max_file_size")
+        entries, placeholders = [], []
+        for item in items:
+            if isinstance(item, FileRecord):
+                placeholders.append(item)
+                continue
+            kind = _placeholder_kind(item.relative_path, item.size, max_file_size)
+            if kind is not None:
+                placeholders.append(FileRecord(item.relative_path, kind, ""))
+            elif has_extension(item.relative_path, self.config):
+                entries.append(item)
+        selected = self.budget.plan(entries, placeholders)
+        elided = {entry.relative_path for entry in entries} - selected
+        if self.stats is not None:
+            for _ in elided:
+                self.stats.skip("budget")
+        return [
+            self.budget.elide(item.relative_path)
+            if not isinstance(item, FileRecord) and item.relative_path in elided
+            else item
+            for item in items
+        ]
+
+    async def _discover(self) -> AsyncIterator[Any]:
+        # Files are handed to the pipeline as soon as their directory
+        # has been listed, while the rest of the tree is still walked.
+        stats = self.stats
+        started = time.perf_counter()
+        async for batch in iterate_in_thread(self.walker):
+            for entry in batch:
+                if (
+                    self.git_tracked_files
+                    and entry.relative_path not in self.git_tracked_files
+                ):
+                    if stats is not None:
+                        stats.skip("untracked")
+                    continue
+                item = entry
+                if not self._is_changed(entry.relative_path, entry.mtime_ns):
+                    item = self._unchanged(entry.relative_path)
+                    if item is None:
+                        continue
+                self.total_files += 1
+                yield item
+        if stats is not None:
+            stats.add_time("walk", time.perf_counter() - started)
+        self.logger.info(f"Found {self.total_files} files to process")
+
+    async def _list_rev(self) -> List[Any]:
+        # The tree is listed up front, its blobs are read by ``_read_rev``
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        entries = await loop.run_in_executor(
+            None,
+            list_revision,
+            self.project_path,
+            self.rev,
+            self.config,
+            self.logger,
+            self.stats,
+            self.runtime,
+        )
+        if self.stats is not None:
+            self.stats.add_time("walk", time.perf_counter() - started)
+        items = []
+        for entry in entries:
+            if self._is_changed(entry.relative_path):
+                items.append(entry)
+            else:
+                record = self._unchanged(entry.relative_path)
+                if record is not None:
+                    items.append(record)
+        self.total_files = len(items)
+        self.logger.info(f"Found {self.total_files} files to process in {self.rev}")
+        return items
+
+    def _read_rev(self, items: List[Any]) -> AsyncIterator[Any]:
+        # Blobs are streamed from a single git process, a bounded number of
+        # files ahead
+        to_read = [item for item in items if not isinstance(item, FileRecord)]
+        blobs = _read_blobs(
+            self.project_path,
+            to_read,
+            self.cache,
+            self.config.get("max_file_size"),
+            self.stats,
+            self.skeleton is not None,
+        )
+        if len(to_read) < len(items):
+            blobs = _interleave(items, blobs)
+        return iterate_in_thread(blobs, maxsize=self.jobs * 4)
+
+    async def items(
+        self, collect: bool = False
+    ) -> Union[List[Any], AsyncIterator[Any]]:
+        """
+        Return the files to compile, in output order: a list once they are
+        all known, or, unless ``collect`` is set or the files must be ranked
+        first, an async iterator of files as they are found.
+        """
+        if self.rev:
+            items = await self._list_rev()
+        elif self.budget is not None or collect:
+            # Files can only be ranked and split once they are all known
+            items = [item async for item in self._discover()]
+        else:
+            return self._discover()
+        if self.budget is not None:
+            items = self._pack(items)
+        return items
+
+    async def _process(self, item: Any, dedupe: Optional[Deduplicator]):
+        # Records that need no reading, such as unchanged files, pass
+        # straight through
+        if isinstance(item, FileRecord):
+            return item
+        args = (
+            item,
+            self.config,
+            self.logger,
+            self.masker,
+            self.cache,
+            self.pool,
+            self.stats,
+            dedupe,
+            self.skeleton,
+        )
+        if self.rev:
+            return await process_blob(*args)
+        return await process_record(*args)
+
+    async def records(
+        self, items: Any, dedupe: Optional[Deduplicator], jobs: int
+    ) -> AsyncIterator[FileRecord]:
+        """
+        Read and mask ``items``, ``jobs`` at a time, and yield their records
+        in order, as they are to be written.
+        """
+        if self.rev:
+            items = self._read_rev(items)
+        records = ordered_map(lambda item: self._process(item, dedupe), items, jobs)
+        async for record in records:
+            if record is not None:
+                if dedupe is not None:
+                    record = dedupe.resolve(record)
+                if self.budget is not None:
+                    admitted = self.budget.admit(record)
+                    if dedupe is not None and admitted is not record:
+                        dedupe.discard(record)
+                    record = admitted
+                yield record
+            self.done += 1
+            if self.progress_callback is not None:
+                # Until the walk is over this is relative to the files found
+                # so far, which grow faster than files are done at times:
+                # hold the progress rather than moving it back
+                progress = self.done / self.total_files * 100
+                if progress > self.progress:
+                    self.progress = progress
+                    self.progress_callback(progress)
+
+    def close(self) -> None:
+        """
+        Save the cache, even when the scrape failed, so that the objects
+        stored so far are not left out of its index, and stop the masking
+        and reducing processes, if any.
+        """
+        try:
+            if self.cache is not None:
+                self.cache.close(self.project_path, self.logger)
+        finally:
+            # The pools of a runtime are closed with it
+            if self.runtime is None:
+                if self.pool is not None:
+                    self.pool.close()
+                if self.skeleton is not None:
+                    self.skeleton.close()
+
+    def finish(self) -> None:
+        """Log what was done, once every record is out."""
+        masker, dedupe, budget = self.masker, self.dedupe, self.budget
+        self.logger.debug(
+            "Masking prefilter skipped %d of %d files and %d pattern scans",
+            masker.stats["files_skipped"],
+            masker.stats["files"],
+            masker.stats["patterns_skipped"],
+        )
+        if dedupe is not None:
+            self.logger.info(
+                f"Wrote {dedupe.files} duplicate files as references, "
+                f"saving {dedupe.bytes_saved} bytes"
+            )
+        if budget is not None:
+            self.logger.info(
+                f"Packed about {budget.used} of {budget.max_bytes} bytes, "
+                f"eliding {budget.elided} files"
+            )
+
+    def report(self) -> Dict[str, Any]:
+        return self.stats.report(self.masker, self.cache, self.dedupe, self.budget)
+
+
+async def iter_records(
+    project_path: str,
+    config: Dict[str, Any],
+    stats_hook: Optional[Callable[[Dict[str, Any]], None]] = None,
+    runtime: Optional["Runtime"] = None,
+    progress_callback: Optional[Callable[[float], None]] = None,
+) -> AsyncIterator[FileRecord]:
+    """
+    Scrape the project and yield the record of every file, in output order,
+    as soon as it is masked; the records ``scrape_project`` writes.
+
+    Records unpack as ``(relative_path, kind, content, ...)`` (see
+    ``FileRecord``). The content of files masked in chunks is an async
+    iterator of masked chunks, read as it is consumed. Only ``jobs`` files
+    are read ahead of the record last yielded, so a slow consumer slows the
+    scrape down rather than letting records pile up. The options of
+    ``scrape_project`` apply, except those about output files:
+    ``shards``, ``shard_max_bytes`` and ``index``.
+    """
+    stats = ScrapeStats() if stats_hook is not None else None
+    logger = setup_logging(config.get("debug", False))
+    logger.info(f"Starting to scrape project: {project_path}")
+    logger.debug(f"Configuration: {config}")
 
-    await out_file.write("\n\n")
+    scrape = _Scrape(project_path, config, logger, stats, runtime, progress_callback)
+    try:
+        items = await scrape.items()
+        async for record in scrape.records(items, scrape.dedupe, scrape.jobs):
+            yield record
+    finally:
+        scrape.close()
+    scrape.finish()
+    if stats is not None:
+        stats_hook(scrape.report())
 
 
 async def scrape_project(
@@ -129,87 +1050,209 @@ async def scrape_project(
     config: Dict[str, Any],
     output_format: str,
     progress_callback: Callable[[float], None],
+    stats_hook: Optional[Callable[[Dict[str, Any]], None]] = None,
+    runtime: Optional["Runtime"] = None,
 ) -> None:
-    """Scrape the entire project, process files, and write to output."""
+    """
+    Scrape the entire project, process files, and write to output.
 
+    ``output_file`` may be ``-`` to write to standard output. When
+    ``config["rev"]`` names a git revision, its files are compiled straight
+    from the object database of the repository at ``project_path``, which
+    may be a bare clone, instead of walking the working tree.
+
+    With ``config["since"]``, a git revision, only the files changed since
+    then are compiled, and subtrees without changes are not walked; with
+    ``config["since_mtime"]`` (see ``to_timestamp``), only files modified
+    since then. ``config["list_unchanged"]`` adds a placeholder for every
+    other file, so the output still shows the layout of the project.
+
+    With ``config["dedupe"]``, files with the same content are masked once
+    and every copy after the first is written as a reference to it (see
+    ``Deduplicator``). With ``config["max_bytes"]`` or ``config["max_tokens"]``,
+    the files of least priority that do not fit in the budget are replaced
+    by placeholders without being read (see ``Budget``).
+
+    With ``config["shards"]`` or ``config["shard_max_bytes"]``, the output is
+    split into that many shards, or into shards of at most that size, each
+    written concurrently by its own writer, next to a manifest mapping every
+    file to its shard (see ``plan_shards``). With ``config["index"]``, an
+    index of the sections of every output file is written next to it, for
+    random access to its files (see ``CompiledOutput``). The output is
+    compressed with ``config["compress"]``, or as its extension says (see
+    ``OutputSink``), at ``config["compress_level"]``.
+
+    When ``stats_hook`` is given, timers and counters are collected for
+    every stage and it is called with their report (see
+    ``ScrapeStats.report``) at the end of the run. A ``runtime`` shares
+    compiled patterns and masking processes with other projects scraped in
+    the same process (see ``scrape_projects``). The records written are
+    those ``iter_records`` yields.
+    """
+
+    stats = ScrapeStats() if stats_hook is not None else None
     logger = setup_logging(config.get("debug", False))
+    writer_class = get_writer(output_format)
 
     logger.info(f"Starting to scrape project: {project_path}")
     logger.debug(f"Configuration: {config}")
 
-    gitignore_spec = load_gitignore(project_path)
-    git_tracked_files = (
-        get_git_tracked_files(project_path) if config["use_git"] else None
+    shard_count, shard_max_bytes = config.get("shards"), config.get("shard_max_bytes")
+    sharded = shard_count is not None or shard_max_bytes is not None
+    if shard_count is not None and shard_max_bytes is not None:
+        raise ValueError("shards and shard_max_bytes cannot be combined")
+    if sharded and str(output_file) == STDOUT:
+        raise ValueError("Sharded output cannot be written to standard output")
+    if config.get("index") and str(output_file) == STDOUT:
+        raise ValueError("An index cannot be written for standard output")
+    compression = config.get("compress") or compression_for(output_file)
+    if config.get("index") and compression is not None:
+        raise ValueError("An index cannot be written for compressed output")
+
+    scrape = _Scrape(
+        project_path, config, logger, stats, runtime, progress_callback, writer_class
     )
+    dedupe = scrape.dedupe
 
-    async with aiofiles.open(output_file, "w") as out_file:
-        # Add the LLM prompt at the beginning of the file
-        llm_prompt = AI_PROMPT
-        await out_file.write(llm_prompt)
-
-        files_to_process = []
-        for root, dirs, files in os.walk(project_path):
-            # Remove ignored directories
-            dirs[:] = [
-                d
-                for d in dirs
-                if not is_ignored(
-                    os.path.join(root, d),
-                    project_path,
-                    gitignore_spec,
-                    config["ignore_patterns"],
-                    logger=logger,
-                )
-            ]
-
-            for file in files:
-                file_path = os.path.join(root, file)
-                if not is_ignored(
-                    file_path,
-                    project_path,
-                    gitignore_spec,
-                    config["ignore_patterns"],
-                    logger=logger,
-                ):
-                    if (
-                        not git_tracked_files
-                        or os.path.relpath(file_path, project_path) in git_tracked_files
-                    ):
-                        files_to_process.append(file_path)
+    async def write_output(target: str, records: AsyncIterator[FileRecord]) -> None:
+        async with OutputSink(
+            target, compression=compression, level=config.get("compress_level")
+        ) as out_file:
+            index = SectionIndex(out_file.encoding) if config.get("index") else None
+            # The writer adds the LLM prompt at the beginning of the file
+            writer = writer_class(out_file, index)
+            await writer.start()
+            async for record in records:
+                if stats is None:
+                    await writer.write_record(record)
+                else:
+                    started = time.perf_counter()
+                    await writer.write_record(record)
+                    stats.add_time("write", time.perf_counter() - started)
+            await writer.finish()
+        if index is not None:
+            index.save(target, output_format)
+
+    async def write_shards(items: List[Any]) -> None:
+        from code_context_compiler.shards import (
+            plan_shards,
+            shard_paths,
+            write_manifest,
+        )
 
-        total_files = len(files_to_process)
-        logger.info(f"Found {total_files} files to process")
+        base_bytes = writer_class.base_size()
+        shards = plan_shards(items, shard_count, shard_max_bytes, base_bytes)
+        paths = shard_paths(str(output_file), len(shards))
+        logger.info(f"Writing {len(items)} files to {len(shards)} shards")
+        # Each shard has its own writer, and its own deduplicator so that it
+        # never refers to a file of another shard. Shards are written
+        # concurrently, sharing the ``jobs`` files in flight.
+        jobs = scrape.jobs
+        concurrent = min(len(shards), jobs)
+        semaphore = asyncio.Semaphore(concurrent)
+        dedupes = [Deduplicator() if dedupe is not None else None for _ in shards]
 
-        for i, file_path in enumerate(files_to_process):
-            await process_file(file_path, project_path, config, out_file, logger)
-            progress_callback((i + 1) / total_files * 100)
+        async def write_shard(path, shard, shard_dedupe):
+            async with semaphore:
+                records = scrape.records(
+                    shard, shard_dedupe, max(1, jobs // concurrent)
+                )
+                await write_output(path, records)
+
+        tasks = [
+            asyncio.ensure_future(write_shard(*shard))
+            for shard in zip(paths, shards, dedupes)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        if dedupe is not None:
+            for shard_dedupe in dedupes:
+                dedupe.files += shard_dedupe.files
+                dedupe.bytes_saved += shard_dedupe.bytes_saved
+        manifest = write_manifest(str(output_file), paths, shards, output_format)
+        logger.info(f"Wrote the manifest of the shards to {manifest}")
 
-    if output_format in ["json", "yaml"]:
-        convert_output(output_file, output_format)
+    try:
+        items = await scrape.items(collect=sharded)
+        if sharded:
+            await write_shards(items)
+        else:
+            await write_output(output_file, scrape.records(items, dedupe, scrape.jobs))
+    finally:
+        scrape.close()
+    scrape.finish()
 
     logger.info(f"Finished scraping project. Output written to {output_file}")
+    if stats is not None:
+        stats_hook(scrape.report())
 
 
-def convert_output(output_file: str, output_format: str) -> None:
-    """Convert the output file to JSON or YAML format."""
-    with open(output_file, "r") as f:
-        content = f.read()
+class BatchResult(NamedTuple):
+    """The outcome of one project of a batch: the error it failed with, if any."""
 
-    # Split the content into the prompt and the files
-    prompt, files_content = content.split(
-        "The project files and their contents begin below:", 1
-    )
+    project_path: str
+    output_file: str
+    error: Optional[str]
+    seconds: float
+
+
+async def scrape_projects(
+    projects: List[Dict[str, Any]],
+    parallel: int = 1,
+    result_callback: Optional[Callable[[BatchResult], None]] = None,
+    runtime: Optional["Runtime"] = None,
+) -> List[BatchResult]:
+    """
+    Scrape many projects in one process, sharing a ``Runtime`` between them.
 
-    files = files_content.strip().split("\nFile: ")
-    files_dict = {
-        file.split("\n", 1)[0]: file.split("\n", 1)[1] for file in files if file
-    }
+    Each project is a dict with the ``project_path``, ``output_file``,
+    ``config`` and ``output_format`` arguments of ``scrape_project`` (see
+    ``load_batch``). Up to ``parallel`` projects are scraped at once. A
+    project that fails is logged and reported in its result; the others
+    carry on. ``result_callback`` is called with the result of every project
+    as it ends, and the results are returned in the order of ``projects``.
+    """
+    from code_context_compiler.runtime import Runtime
 
-    output_dict = {"prompt": prompt.strip(), "files": files_dict}
+    logger = logging.getLogger(__name__)
+    semaphore = asyncio.Semaphore(parallel)
+
+    async def scrape(project: Dict[str, Any]) -> BatchResult:
+        async with semaphore:
+            started = time.perf_counter()
+            error = None
+            try:
+                await scrape_project(
+                    project["project_path"],
+                    project["output_file"],
+                    project["config"],
+                    project.get("output_format", "text"),
+                    lambda x: None,
+                    runtime=runtime,
+                )
+            except Exception as e:
+                logger.error(f"Failed to scrape {project['project_path']}: {e}")
+                error = str(e) or type(e).__name__
+            result = BatchResult(
+                str(project["project_path"]),
+                str(project["output_file"]),
+                error,
+                time.perf_counter() - started,
+            )
+            if result_callback is not None:
+                result_callback(result)
+            return result
 
-    if output_format == "json":
-        with open(output_file, "w") as f:
-            json.dump(output_dict, f, indent=2)
-    elif output_format == "yaml":
-        with open(output_file, "w") as f:
-            yaml.dump(output_dict, f)
+    own_runtime = runtime is None
+    if own_runtime:
+        runtime = Runtime()
+    try:
+        return list(await asyncio.gather(*(scrape(project) for project in projects)))
+    finally:
+        if own_runtime:
+            runtime.close()
@@ -0,0 +1,160 @@
+import bisect
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from code_context_compiler.budget import RECORD_OVERHEAD
+from code_context_compiler.sink import split_ext
+
+# Suffix of the manifest written next to the shards of an output file
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def _estimate(item: Any) -> int:
+    # Placeholder records have no size of their own
+    return getattr(item, "size", 0) + len(item.relative_path) + RECORD_OVERHEAD
+
+
+def _shared_depth(previous: str, relative_path: str) -> int:
+    """Number of directories shared by two paths; cuts are best where it is low."""
+    depth = 0
+    for a, b in zip(
+        os.path.dirname(previous).split(os.sep),
+        os.path.dirname(relative_path).split(os.sep),
+    ):
+        if a != b or not a:
+            break
+        depth += 1
+    return depth
+
+
+def _best_cut(
+    paths: List[str],
+    cumulative: List[int],
+    first: int,
+    last: int,
+    low: float,
+    high: float,
+    ideal: float,
+) -> int:
+    """
+    Return the index, between ``first`` and ``last``, of the item to start
+    the next shard with: among the cuts whose offset is within ``low`` and
+    ``high``, the one at the shallowest directory boundary, then the one
+    nearest to ``ideal``.
+    """
+    start = max(first, bisect.bisect_left(cumulative, low))
+    end = min(last, bisect.bisect_right(cumulative, high) - 1)
+    if start > end:
+        # A single file spans the whole range: cut right before it
+        return max(first, min(last, bisect.bisect_right(cumulative, high) - 1))
+    return min(
+        range(start, end + 1),
+        key=lambda i: (
+            _shared_depth(paths[i - 1], paths[i]),
+            abs(cumulative[i] - ideal),
+        ),
+    )
+
+
+def plan_shards(
+    items: List[Any],
+    count: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    base_bytes: int = 0,
+) -> List[List[Any]]:
+    """
+    Split ``items``, in output order, into ``count`` shards of about the same
+    size, or into as few shards of at most ``max_bytes`` as possible.
+
+    Sizes are estimated from the size of each file, before anything is read,
+    and ``base_bytes`` are added to every shard for its prompt. Shards follow
+    directory boundaries where they can: a shard may be up to a quarter of
+    the average size off with ``count``, or be half empty with
+    ``max_bytes``, when that lets it end with a whole directory. Since the
+    walk lists every directory as a whole, subtree after subtree, a shard
+    only holds parts of the directories it starts and ends with.
+    """
+    if (count is None) == (max_bytes is None):
+        raise ValueError("Either a shard count or a shard size must be given")
+    paths = [item.relative_path for item in items]
+    cumulative = [0]
+    for item in items:
+        cumulative.append(cumulative[-1] + _estimate(item))
+    total = len(items)
+
+    cuts: List[int] = []
+    start = 0
+    if count is not None:
+        if count < 1:
+            raise ValueError("The shard count must be at least 1")
+        count = max(1, min(count, total))
+        share = cumulative[-1] / count
+        for k in range(1, count):
+            ideal = k * share
+            start = _best_cut(
+                paths,
+                cumulative,
+                start + 1,
+                total - (count - k),
+                ideal - share / 4,
+                ideal + share / 4,
+                ideal,
+            )
+            cuts.append(start)
+    else:
+        room = max_bytes - base_bytes
+        if room <= 0:
+            raise ValueError(
+                f"A shard size of {max_bytes} bytes leaves no room for files"
+            )
+        while start < total - 1 and cumulative[-1] - cumulative[start] > room:
+            high = cumulative[start] + room
+            start = _best_cut(
+                paths, cumulative, start + 1, total - 1, high - room / 2, high, high
+            )
+            cuts.append(start)
+
+    bounds = [0, *cuts, total]
+    return [items[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def shard_paths(output_file: str, count: int) -> List[str]:
+    """Return the paths of ``count`` shards of ``output_file``, numbered from 1."""
+    base, ext = split_ext(output_file)
+    width = max(3, len(str(count)))
+    return [f"{base}.{i:0{width}d}{ext}" for i in range(1, count + 1)]
+
+
+def manifest_path(output_file: str) -> str:
+    return split_ext(output_file)[0] + MANIFEST_SUFFIX
+
+
+def write_manifest(
+    output_file: str,
+    paths: List[str],
+    shards: List[List[Any]],
+    output_format: str,
+) -> str:
+    """
+    Write the manifest of the shards of ``output_file`` next to them and
+    return its path.
+
+    The manifest lists every shard with its number of files and size, and
+    maps the path of each file to the name of the shard holding it.
+    """
+    files: Dict[str, str] = {}
+    entries = []
+    for path, shard in zip(paths, shards):
+        name = os.path.basename(path)
+        entries.append(
+            {"path": name, "files": len(shard), "bytes": os.path.getsize(path)}
+        )
+        for item in shard:
+            files[item.relative_path] = name
+    manifest = {"format": output_format, "shards": entries, "files": files}
+    target = manifest_path(output_file)
+    with open(target, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+        manifest_file.write("\n")
+    return target
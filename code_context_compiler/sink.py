@@ -0,0 +1,167 @@
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, List, Optional, Tuple
+
+# Output target meaning standard output
+STDOUT = "-"
+
+# Buffered text is handed to the writer thread once it reaches this size
+BUFFER_SIZE = 1024 * 1024
+
+# Compression formats, with the file extension that selects each
+COMPRESSIONS = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+# Levels used when none is given: gzip's own default of 9 is several times
+# slower than 6 for a slightly smaller output
+DEFAULT_LEVELS = {"gzip": 6, "bz2": 9, "xz": 6}
+
+
+def compression_for(path: str) -> Optional[str]:
+    """Return the compression selected by the extension of ``path``, if any."""
+    ext = os.path.splitext(str(path))[1].lower()
+    for compression, compression_ext in COMPRESSIONS.items():
+        if ext == compression_ext:
+            return compression
+    return None
+
+
+def split_ext(path: str) -> Tuple[str, str]:
+    """
+    Like ``os.path.splitext``, keeping a compression extension with the one
+    before it: ``out.txt.gz`` gives ``out`` and ``.txt.gz``.
+    """
+    base, ext = os.path.splitext(path)
+    if compression_for(path) is not None:
+        base, inner = os.path.splitext(base)
+        ext = inner + ext
+    return base, ext
+
+
+def _open_compressed(target, compression: str, level: Optional[int]) -> IO[bytes]:
+    """
+    Open a binary file compressing what is written to ``target``, a path or
+    a binary file, which is then left open.
+    """
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == "gzip":
+        import gzip
+
+        return gzip.open(target, "wb", compresslevel=level)
+    if compression == "bz2":
+        import bz2
+
+        return bz2.open(target, "wb", compresslevel=level)
+    import lzma
+
+    return lzma.open(target, "wb", preset=level)
+
+
+class OutputSink:
+    """
+    Buffered output file with a ``write`` coroutine.
+
+    Written text is accumulated in memory and handed over in bulk, with a
+    single ``writelines`` call, to one background writer thread once
+    ``buffer_size`` characters are pending. While the thread writes one
+    batch the next one is filled, so at most two batches are ever held in
+    memory and writing a small section costs no thread round trip at all.
+
+    The target ``-`` writes to standard output, which is flushed but never
+    closed.
+
+    With a ``compression`` (see ``COMPRESSIONS``), the text is compressed as
+    it is written, at ``level``. Compression runs on the writer thread too,
+    so it overlaps with whatever fills the next batch, and nothing is ever
+    written uncompressed.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        buffer_size: int = BUFFER_SIZE,
+        compression: Optional[str] = None,
+        level: Optional[int] = None,
+    ):
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unsupported compression: {compression} "
+                f"(expected one of: {', '.join(COMPRESSIONS)})"
+            )
+        self.target = str(target)
+        self.buffer_size = buffer_size
+        self.compression = compression
+        self.level = level
+        self._file = None
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._pending: Optional[Future] = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="ccc-writer")
+
+    @property
+    def is_stdout(self) -> bool:
+        return self.target == STDOUT
+
+    @property
+    def encoding(self) -> str:
+        """Encoding of the open file."""
+        return self._file.encoding
+
+    def _open(self) -> IO[str]:
+        if self.compression is None:
+            return sys.stdout if self.is_stdout else open(self.target, "w")
+        target = sys.stdout.buffer if self.is_stdout else self.target
+        # Same encoding and newlines as a file opened in text mode
+        return io.TextIOWrapper(_open_compressed(target, self.compression, self.level))
+
+    async def __aenter__(self) -> "OutputSink":
+        if self.is_stdout and self.compression is None:
+            self._file = sys.stdout
+        else:
+            loop = asyncio.get_running_loop()
+            self._file = await loop.run_in_executor(self._executor, self._open)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def write(self, text: str) -> None:
+        """Buffer ``text``, handing the buffer to the writer thread when full."""
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size:
+            await self._hand_over()
+
+    async def _hand_over(self) -> None:
+        """Wait for the previous batch to be written and start writing this one."""
+        if self._pending is not None:
+            await asyncio.wrap_future(self._pending)
+            self._pending = None
+        if self._buffer:
+            batch, self._buffer, self._buffered = self._buffer, [], 0
+            self._pending = self._executor.submit(self._file.writelines, batch)
+
+    async def flush(self) -> None:
+        """Write everything buffered so far."""
+        await self._hand_over()
+        await self._hand_over()
+        await asyncio.wrap_future(self._executor.submit(self._file.flush))
+
+    async def close(self) -> None:
+        """Flush the buffer and close the file."""
+        if self._file is None:
+            return
+        try:
+            await self.flush()
+        finally:
+            file, self._file = self._file, None
+            if not self.is_stdout:
+                await asyncio.wrap_future(self._executor.submit(file.close))
+            elif self.compression is not None:
+                # Closing the compressor writes its trailer, not closing stdout
+                await asyncio.wrap_future(self._executor.submit(file.close))
+                sys.stdout.buffer.flush()
+            self._executor.shutdown(wait=False)
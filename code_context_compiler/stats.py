@@ -0,0 +1,119 @@
+import heapq
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from code_context_compiler.budget import Budget, estimate_tokens
+from code_context_compiler.cache import FileCache
+from code_context_compiler.dedupe import Deduplicator
+from code_context_compiler.masker import Masker
+
+F = TypeVar("F", bound=Callable)
+
+# Number of slowest files listed in the report
+SLOWEST_FILES = 10
+
+
+class ScrapeStats:
+    """
+    Timers and counters for one run of ``scrape_project``.
+
+    The scraper only creates one when stats are requested and otherwise
+    skips every measurement, so collecting them costs nothing by default.
+    Stage times other than ``total`` and ``walk`` add up the time spent by
+    every file in the stage, across threads and concurrent tasks, so they
+    can exceed the wall-clock time of the run.
+    """
+
+    def __init__(self, slowest: int = SLOWEST_FILES):
+        self.started = time.perf_counter()
+        self.slowest = slowest
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.files: Dict[str, int] = defaultdict(int)
+        self.skipped: Dict[str, int] = defaultdict(int)
+        self.bytes_read = 0
+        self._slowest: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    def timed(self, stage: str, func: F) -> F:
+        """Wrap ``func`` so that the time spent in it counts towards ``stage``."""
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_time(stage, time.perf_counter() - started)
+
+        return wrapper
+
+    def skip(self, reason: str) -> None:
+        """Count a file left out of the output, by reason."""
+        with self._lock:
+            self.skipped[reason] += 1
+
+    def file_done(self, relative_path: str, kind: str, seconds: float) -> None:
+        """Record a processed file, with the time it took to read and mask."""
+        with self._lock:
+            self.files[kind] += 1
+            item = (seconds, relative_path)
+            if len(self._slowest) < self.slowest:
+                heapq.heappush(self._slowest, item)
+            elif item > self._slowest[0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def report(
+        self,
+        masker: Optional[Masker] = None,
+        cache: Optional[FileCache] = None,
+        dedupe: Optional[Deduplicator] = None,
+        budget: Optional[Budget] = None,
+    ) -> Dict[str, Any]:
+        """Return every timer and counter as a JSON-serializable dict."""
+        seconds = {"total": time.perf_counter() - self.started, **self.seconds}
+        report = {
+            "seconds": {stage: round(value, 6) for stage, value in seconds.items()},
+            "files": dict(self.files),
+            "skipped": dict(self.skipped),
+            "bytes_read": self.bytes_read,
+            "slowest_files": [
+                {"path": path, "seconds": round(value, 6)}
+                for value, path in sorted(self._slowest, reverse=True)
+            ],
+        }
+        if masker is not None:
+            report["prefilter"] = {
+                "files": masker.stats["files"],
+                "files_skipped": masker.stats["files_skipped"],
+                "patterns_skipped": masker.stats["patterns_skipped"],
+            }
+            report["patterns"] = [
+                {
+                    "pattern": rule.regex.pattern,
+                    "matches": masker.stats["matches"][i],
+                    "seconds": round(masker.stats["pattern_seconds"][i], 6),
+                }
+                for i, rule in enumerate(masker.rules)
+            ]
+        if cache is not None:
+            report["cache"] = {"hits": cache.hits, "misses": cache.misses}
+        if dedupe is not None:
+            report["dedupe"] = {
+                "files": dedupe.files,
+                "bytes_saved": dedupe.bytes_saved,
+            }
+        if budget is not None:
+            report["budget"] = {
+                "max_bytes": budget.max_bytes,
+                "used_bytes": budget.used,
+                "estimated_tokens": estimate_tokens(
+                    budget.used, budget.bytes_per_token
+                ),
+                "elided": budget.elided,
+            }
+        return report
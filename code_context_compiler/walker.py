@@ -0,0 +1,118 @@
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from code_context_compiler.ignore import IgnoreMatcher
+
+
+class WalkEntry(NamedTuple):
+    """A file found in the project, with the stat info read while listing it."""
+
+    path: str
+    relative_path: str
+    size: int
+    mtime_ns: int
+
+    @classmethod
+    def from_path(cls, file_path: str, project_path: str) -> "WalkEntry":
+        stat = os.stat(file_path)
+        relative_path = os.path.relpath(file_path, project_path)
+        return cls(file_path, relative_path, stat.st_size, stat.st_mtime_ns)
+
+
+class ProjectWalker:
+    """
+    List the files of a project that are not ignored, using ``os.scandir``.
+
+    Directory listings are fanned out across a thread pool: as soon as a
+    directory has been listed, its subdirectories are queued for listing, so
+    slow filesystems are kept busy with many concurrent requests. The type
+    and stat information of each ``DirEntry`` is reused instead of being
+    queried again, and ignored directories are never listed.
+
+    Iterating yields batches of files, one batch per directory, lazily and
+    in a deterministic order: the files of a directory sorted by name, then
+    each subdirectory in name order, recursively. Like ``os.walk``, symbolic
+    links to directories are not followed.
+
+    When ``subtrees`` is given, only the subdirectories it holds (relative
+    paths) are entered, so the rest of the tree is never listed.
+    """
+
+    def __init__(
+        self,
+        project_path: str,
+        matcher: IgnoreMatcher,
+        logger: logging.Logger,
+        workers: Optional[int] = None,
+        subtrees: Optional[Set[str]] = None,
+    ):
+        self.project_path = project_path
+        self.matcher = matcher
+        self.logger = logger
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.subtrees = subtrees
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._stopped = False
+
+    def _list(self, relative_dir: str) -> Tuple[List[WalkEntry], List[Future]]:
+        """List one directory and queue the listing of its subdirectories."""
+        if self._stopped:
+            return [], []
+        directory = os.path.join(self.project_path, relative_dir)
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            self.logger.warning(f"Unable to list directory {directory}: {e}")
+            return [], []
+
+        if relative_dir and any(entry.name == ".gitignore" for entry in entries):
+            self.matcher.add_gitignore(relative_dir)
+
+        files, subdirs = [], []
+        for entry in entries:
+            relative_path = os.path.join(relative_dir, entry.name)
+            try:
+                is_dir = entry.is_dir()
+                if is_dir and entry.is_symlink():
+                    continue
+            except OSError:
+                continue
+            if (
+                is_dir
+                and self.subtrees is not None
+                and relative_path not in self.subtrees
+            ):
+                continue
+            if self.matcher.is_ignored(relative_path, is_dir=is_dir):
+                continue
+            if is_dir:
+                subdirs.append(self._pool.submit(self._list, relative_path))
+                continue
+            try:
+                stat = entry.stat()
+            except OSError as e:
+                self.logger.warning(f"Unable to stat {entry.path}: {e}")
+                continue
+            files.append(
+                WalkEntry(entry.path, relative_path, stat.st_size, stat.st_mtime_ns)
+            )
+        return files, subdirs
+
+    def __iter__(self) -> Iterator[List[WalkEntry]]:
+        self._stopped = False
+        with ThreadPoolExecutor(
+            self.workers, thread_name_prefix="ccc-walker"
+        ) as self._pool:
+            stack: List[Future] = [self._pool.submit(self._list, "")]
+            try:
+                while stack:
+                    files, subdirs = stack.pop().result()
+                    if files:
+                        yield files
+                    stack.extend(reversed(subdirs))
+            finally:
+                # Stop listing if the consumer gives up early
+                self._stopped = True
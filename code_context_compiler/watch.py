@@ -0,0 +1,456 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from code_context_compiler.cache import RACY_WINDOW_NS
+from code_context_compiler.config import DEFAULT_CONFIG
+from code_context_compiler.ignore import IgnoreMatcher
+from code_context_compiler.masker import Masker
+from code_context_compiler.pipeline import ordered_map
+from code_context_compiler.scraper import (
+    get_git_tracked_files,
+    process_record,
+    setup_logging,
+)
+from code_context_compiler.sink import STDOUT, OutputSink, compression_for
+from code_context_compiler.walker import ProjectWalker, WalkEntry
+from code_context_compiler.writers import FileRecord, get_writer
+
+# Events are gathered until none has arrived for this long
+DEBOUNCE = 0.2
+
+# ...but for no longer than this, so a steady stream of events still updates
+# the output
+MAX_DEBOUNCE = 5.0
+
+# How often the project is rescanned when inotify is unavailable
+POLL_INTERVAL = 1.0
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """
+    Wait for changes in a project by walking it every ``interval`` seconds,
+    and comparing the stat of every file that is not ignored with the one
+    it had at the last ``update``.
+    """
+
+    def __init__(
+        self, project_path: str, logger: logging.Logger, interval: float = POLL_INTERVAL
+    ):
+        self.project_path = project_path
+        self.logger = logger
+        self.interval = interval
+        self.matcher: Optional[IgnoreMatcher] = None
+        self._snapshot: FrozenSet[Tuple[str, int, int]] = frozenset()
+
+    def _scan(self) -> FrozenSet[Tuple[str, int, int]]:
+        walker = ProjectWalker(self.project_path, self.matcher, self.logger)
+        return frozenset(
+            (entry.relative_path, entry.size, entry.mtime_ns)
+            for batch in walker
+            for entry in batch
+        )
+
+    def update(self, matcher: IgnoreMatcher) -> None:
+        """Take the stat of every file that ``matcher`` does not ignore."""
+        self.matcher = matcher
+        self._snapshot = self._scan()
+
+    async def wait(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            snapshot = await loop.run_in_executor(None, self._scan)
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                return
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Wait for changes in a project with Linux inotify, through ``ctypes``.
+
+    Every directory that is not ignored gets a watch; directories created
+    later are watched as soon as their creation is reported. Events for
+    ignored paths and for the paths in ``excluded`` (the output file) are
+    dropped.
+    """
+
+    def __init__(
+        self, project_path: str, logger: logging.Logger, excluded: Tuple[str, ...] = ()
+    ):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.project_path = project_path
+        self.logger = logger
+        self.excluded = excluded
+        self.matcher: Optional[IgnoreMatcher] = None
+        self._dirs: Dict[int, str] = {}
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.fd, self._read)
+
+    def _watch(self, relative_dir: str) -> None:
+        """Watch a directory and, recursively, its subdirectories."""
+        path = os.path.join(self.project_path, relative_dir)
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno in (2, 20):  # ENOENT, ENOTDIR: gone already
+                return
+            raise OSError(errno, f"Unable to watch {path}: {os.strerror(errno)}")
+        self._dirs[wd] = relative_dir
+        try:
+            with os.scandir(path) as it:
+                subdirs = [
+                    entry.name for entry in it if entry.is_dir(follow_symlinks=False)
+                ]
+        except OSError:
+            return
+        for name in subdirs:
+            relative_path = os.path.join(relative_dir, name)
+            if not self.matcher.is_ignored(relative_path, is_dir=True):
+                self._watch(relative_path)
+
+    def update(self, matcher: IgnoreMatcher) -> None:
+        """Watch every directory that ``matcher`` does not ignore."""
+        self.matcher = matcher
+        self._watch("")
+
+    def _read(self) -> None:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._changed.set()
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            relative_dir = self._dirs.get(wd)
+            if relative_dir is None:
+                continue
+            relative_path = os.path.join(relative_dir, name) if name else relative_dir
+            if relative_path in self.excluded:
+                continue
+            is_dir = bool(mask & IN_ISDIR)
+            if name and self.matcher.is_ignored(relative_path, is_dir=is_dir):
+                continue
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._watch(relative_path)
+                except OSError as e:
+                    self.logger.warning(str(e))
+            self._changed.set()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+        self._changed.clear()
+
+    def close(self) -> None:
+        self._loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+class _Section(NamedTuple):
+    """
+    The record of a file, with the stat it had when it was read.
+
+    ``record`` is None for skipped files, and its content is None for files
+    masked in chunks.
+    """
+
+    size: int
+    mtime_ns: int
+    read_ns: int
+    record: Optional[FileRecord]
+
+
+class WatchSession:
+    """
+    Keep the compiled output of a project up to date.
+
+    The masked record of every file is kept in memory, keyed by its path
+    together with the size and mtime it had when read. Each ``update`` walks
+    the project again, re-masks only the files whose stat changed (or that
+    were modified too recently to trust their mtime), drops the files that
+    disappeared, and rewrites the whole output to a temporary file that is
+    then renamed over the output, so readers never see a partial file.
+    Files masked in chunks are never held in memory; they are read again
+    every time the output is written.
+    """
+
+    def __init__(
+        self,
+        project_path: str,
+        output_file: str,
+        config: Dict[str, Any],
+        output_format: str,
+        logger: logging.Logger,
+    ):
+        self.project_path = project_path
+        self.output_file = os.path.abspath(output_file)
+        self.writer_class = get_writer(output_format)
+        self.logger = logger
+        self.masker = Masker(config["mask_patterns"])
+        self.skeleton = None
+        if config.get("skeleton", False):
+            from code_context_compiler.reducers import Skeleton, skeleton_reducers
+
+            # Few files change at a time: they are reduced in-process
+            self.skeleton = Skeleton(skeleton_reducers(config))
+        self._sections: Dict[str, _Section] = {}
+        self._order: List[str] = []
+
+        # The output may live inside the project, but must not be compiled
+        # into itself nor trigger a rebuild when it is rewritten
+        self.excluded: Tuple[str, ...] = ()
+        relative_output = os.path.relpath(self.output_file, project_path)
+        if not relative_output.startswith(os.pardir):
+            self.excluded = (relative_output, relative_output + ".tmp")
+        self.config = {
+            **config,
+            "ignore_patterns": [*config["ignore_patterns"], *self.excluded],
+        }
+
+    def matcher(self) -> IgnoreMatcher:
+        """A matcher with the current ``.gitignore`` files of the project."""
+        return IgnoreMatcher(
+            self.project_path, self.config["ignore_patterns"], self.logger
+        )
+
+    def _walk(self, matcher: IgnoreMatcher) -> List[WalkEntry]:
+        walker = ProjectWalker(self.project_path, matcher, self.logger)
+        entries = [entry for batch in walker for entry in batch]
+        if self.config["use_git"]:
+            tracked = get_git_tracked_files(self.project_path)
+            entries = [entry for entry in entries if entry.relative_path in tracked]
+        return entries
+
+    def _is_fresh(self, entry: WalkEntry) -> bool:
+        section = self._sections.get(entry.relative_path)
+        return (
+            section is not None
+            and section.size == entry.size
+            and section.mtime_ns == entry.mtime_ns
+            and entry.mtime_ns + RACY_WINDOW_NS < section.read_ns
+        )
+
+    async def _process(
+        self, entry: WalkEntry
+    ) -> Tuple[WalkEntry, Optional[FileRecord], int]:
+        read_ns = time.time_ns()
+        record = await process_record(
+            entry, self.config, self.logger, self.masker, skeleton=self.skeleton
+        )
+        if record is not None and not isinstance(record.content, str):
+            # Streamed content is read again whenever the output is written
+            await record.content.aclose()
+            record = record._replace(content=None)
+        return entry, record, read_ns
+
+    async def update(self, matcher: Optional[IgnoreMatcher] = None) -> bool:
+        """Bring the output up to date; return whether it was rewritten."""
+        loop = asyncio.get_running_loop()
+        matcher = matcher or self.matcher()
+        entries = await loop.run_in_executor(None, self._walk, matcher)
+        order = [entry.relative_path for entry in entries]
+
+        stale = [entry for entry in entries if not self._is_fresh(entry)]
+        changed = 0
+        jobs = self.config.get("jobs", DEFAULT_CONFIG["jobs"])
+        async for entry, record, read_ns in ordered_map(self._process, stale, jobs):
+            previous = self._sections.get(entry.relative_path)
+            if (
+                previous is None
+                or previous.record != record
+                or (record is not None and record.content is None)
+            ):
+                changed += 1
+            self._sections[entry.relative_path] = _Section(
+                entry.size, entry.mtime_ns, read_ns, record
+            )
+
+        removed = set(self._sections) - set(order)
+        for relative_path in removed:
+            del self._sections[relative_path]
+        if not changed and order == self._order:
+            return False
+        self._order = order
+
+        await self._write(entries)
+        self.logger.info(
+            f"Output updated: {changed} changed, {len(removed)} removed, "
+            f"{len(order)} files"
+        )
+        return True
+
+    async def _write(self, entries: List[WalkEntry]) -> None:
+        tmp_path = self.output_file + ".tmp"
+        compression = self.config.get("compress") or compression_for(self.output_file)
+        async with OutputSink(
+            tmp_path, compression=compression, level=self.config.get("compress_level")
+        ) as out_file:
+            writer = self.writer_class(out_file)
+            await writer.start()
+            for entry in entries:
+                record = self._sections[entry.relative_path].record
+                if record is not None and record.content is None:
+                    record = await process_record(
+                        entry,
+                        self.config,
+                        self.logger,
+                        self.masker,
+                        skeleton=self.skeleton,
+                    )
+                if record is not None:
+                    await writer.write_record(record)
+            await writer.finish()
+        os.replace(tmp_path, self.output_file)
+
+
+def create_watcher(
+    project_path: str,
+    logger: logging.Logger,
+    excluded: Tuple[str, ...] = (),
+    poll_interval: Optional[float] = None,
+):
+    """Use inotify where available, unless a polling interval is requested."""
+    if poll_interval is None and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(project_path, logger, excluded)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable, polling instead: {e}")
+    return PollingWatcher(project_path, logger, poll_interval or POLL_INTERVAL)
+
+
+async def watch_project(
+    project_path: str,
+    output_file: str,
+    config: Dict[str, Any],
+    output_format: str,
+    debounce: float = DEBOUNCE,
+    poll_interval: Optional[float] = None,
+    on_update: Optional[Callable[[], None]] = None,
+    stop: Optional[asyncio.Event] = None,
+    max_debounce: float = MAX_DEBOUNCE,
+) -> None:
+    """
+    Compile the project, then keep the output up to date until ``stop`` is set.
+
+    Changes are detected with inotify on Linux and by rescanning the project
+    every ``poll_interval`` seconds elsewhere, or when ``poll_interval`` is
+    given. Bursts of events, such as a branch checkout, are gathered until
+    none has arrived for ``debounce`` seconds, or for ``max_debounce``
+    seconds at most, before the output is updated. ``on_update`` is called
+    after each rewrite of the output.
+    """
+    if str(output_file) == STDOUT:
+        raise ValueError("Watch mode needs an output file, not stdout")
+    logger = setup_logging(config.get("debug", False))
+    session = WatchSession(project_path, output_file, config, output_format, logger)
+    stop = stop or asyncio.Event()
+
+    watcher = create_watcher(project_path, logger, session.excluded, poll_interval)
+    try:
+        matcher = session.matcher()
+        watcher.update(matcher)
+        await session.update(matcher)
+        logger.info(f"Watching {project_path} for changes")
+        if on_update is not None:
+            on_update()
+
+        stopped = asyncio.ensure_future(stop.wait())
+        while not stop.is_set():
+            changed = asyncio.ensure_future(watcher.wait())
+            await asyncio.wait([changed, stopped], return_when=asyncio.FIRST_COMPLETED)
+            if stop.is_set():
+                changed.cancel()
+                break
+            # Wait for the burst of events to settle
+            deadline = time.monotonic() + max(debounce, max_debounce)
+            while not stop.is_set():
+                timeout = min(debounce, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                changed = asyncio.ensure_future(watcher.wait())
+                await asyncio.wait(
+                    [changed, stopped],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not changed.done():
+                    changed.cancel()
+                    break
+            if stop.is_set():
+                break
+            matcher = session.matcher()
+            watcher.update(matcher)
+            if await session.update(matcher) and on_update is not None:
+                on_update()
+        stopped.cancel()
+    finally:
+        watcher.close()
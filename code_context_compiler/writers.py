@@ -0,0 +1,308 @@
+import json
+import re
+from typing import TYPE_CHECKING, AsyncIterator, NamedTuple, Optional, Union
+
+from code_context_compiler.ai_prompt import AI_PROMPT
+
+if TYPE_CHECKING:
+    from code_context_compiler.index import SectionIndex
+
+# Last line of AI_PROMPT, which only makes sense in the text output
+FILES_MARKER = "The project files and their contents begin below:"
+
+# Prompt included in the structured outputs
+STRUCTURED_PROMPT = AI_PROMPT.split(FILES_MARKER)[0].strip()
+
+OUTPUT_FORMATS = ("text", "json", "jsonl", "yaml")
+
+# What JsonWriter writes before its records, and before each but the first
+_JSON_HEAD = f'{{\n  "prompt": {json.dumps(STRUCTURED_PROMPT)},\n  "files": ['
+_JSON_SEPARATOR = ",\n    "
+
+
+class FileRecord(NamedTuple):
+    """
+    A processed file: its path, what kind of file it is and its masked content.
+
+    The content of very large files is an async iterator of masked chunks,
+    which writers consume as they write the record. With deduplication,
+    text files have a ``content_id`` and copies of a file written earlier
+    have no content but the path of that file in ``identical_to``.
+    """
+
+    relative_path: str
+    kind: str  # "text", "media", "binary", "large", "unchanged" or "elided"
+    content: Union[str, AsyncIterator[str]]
+    content_id: Optional[str] = None
+    identical_to: Optional[str] = None
+
+
+def utf8_size(text: str) -> int:
+    """Size of ``text`` in UTF-8, without encoding it when it is ASCII."""
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def format_section(
+    relative_path: str,
+    kind: str,
+    content: str,
+    content_id: Optional[str] = None,
+    identical_to: Optional[str] = None,
+) -> str:
+    """Format a processed file as a section of the text output."""
+    if identical_to is not None:
+        content = f"[IDENTICAL TO: {identical_to}]\n"
+    elif kind == "media":
+        content = f"[MEDIA FILE PLACEHOLDER: {relative_path}]\n\n"
+    elif kind == "binary":
+        content = f"[BINARY FILE PLACEHOLDER: {relative_path}]\n"
+    elif kind == "large":
+        content = f"[LARGE FILE PLACEHOLDER: {relative_path}]\n"
+    elif kind == "unchanged":
+        content = f"[UNCHANGED FILE PLACEHOLDER: {relative_path}]\n"
+    elif kind == "elided":
+        content = f"[ELIDED FILE PLACEHOLDER: {relative_path}]\n"
+    return f"File: {relative_path}\n{content}\n\n"
+
+
+def record_to_dict(record: FileRecord) -> dict:
+    data = {"path": record.relative_path, "kind": record.kind}
+    if record.content_id is not None:
+        data["content_id"] = record.content_id
+    if record.identical_to is not None:
+        data["identical_to"] = record.identical_to
+    data["content"] = record.content
+    return data
+
+
+async def write_json_record(out_file, record: FileRecord) -> None:
+    """Write a record as a JSON object, streaming its content if needed."""
+    if isinstance(record.content, str):
+        await out_file.write(json.dumps(record_to_dict(record)))
+        return
+    # Escaping is per character, so each chunk can be escaped on its own
+    head = json.dumps({"path": record.relative_path, "kind": record.kind})
+    await out_file.write(head[:-1] + ', "content": "')
+    async for chunk in record.content:
+        await out_file.write(json.dumps(chunk)[1:-1])
+    await out_file.write('"}')
+
+
+# Everything a YAML double-quoted scalar cannot hold verbatim on one line
+_YAML_UNSAFE = re.compile(
+    '["\\\\]|[^\\x20-\\x7e\\xa0-\\u2027\\u202a-\\ud7ff\\ue000-\\ufefe\\uff00-\\ufffd'
+    "\\U00010000-\\U0010ffff]"
+)
+_YAML_ESCAPES = {
+    '"': '\\"',
+    "\\": "\\\\",
+    "\0": "\\0",
+    "\a": "\\a",
+    "\b": "\\b",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\v": "\\v",
+    "\f": "\\f",
+    "\r": "\\r",
+    "\x1b": "\\e",
+    "\x85": "\\N",
+    "\u2028": "\\L",
+    "\u2029": "\\P",
+}
+
+
+def _yaml_escape(match: re.Match) -> str:
+    char = match.group()
+    if char in _YAML_ESCAPES:
+        return _YAML_ESCAPES[char]
+    code = ord(char)
+    if code < 0x100:
+        return f"\\x{code:02x}"
+    if code < 0x10000:
+        return f"\\u{code:04x}"
+    return f"\\U{code:08x}"
+
+
+def yaml_quote(text: str) -> str:
+    """Quote a string as a single-line YAML double-quoted scalar."""
+    return '"' + _YAML_UNSAFE.sub(_yaml_escape, text) + '"'
+
+
+def _yaml_head(record: FileRecord) -> str:
+    """Everything of the YAML item of ``record`` up to its content."""
+    head = f"- path: {yaml_quote(record.relative_path)}\n"
+    head += f"  kind: {record.kind}\n"
+    if record.content_id is not None:
+        head += f"  content_id: {yaml_quote(record.content_id)}\n"
+    if record.identical_to is not None:
+        head += f"  identical_to: {yaml_quote(record.identical_to)}\n"
+    return head + "  content: "
+
+
+class TextWriter:
+    """
+    Write the AI prompt followed by one ``File: `` section per file.
+
+    Like every writer, ``base_size`` and ``record_size`` tell how many bytes
+    the prompt and framing, and each record with its content, take in the
+    output, so that budgets can be kept without writing anything.
+    """
+
+    def __init__(self, out_file, index: Optional["SectionIndex"] = None):
+        self.out_file = out_file if index is None else index.track(out_file)
+        self.index = index
+
+    @staticmethod
+    def base_size() -> int:
+        return utf8_size(AI_PROMPT)
+
+    @staticmethod
+    def record_size(record: FileRecord) -> int:
+        return utf8_size(format_section(*record))
+
+    async def start(self) -> None:
+        await self.out_file.write(AI_PROMPT)
+
+    async def write_record(self, record: FileRecord) -> None:
+        if self.index is not None:
+            self.index.begin()
+        if isinstance(record.content, str):
+            await self.out_file.write(format_section(*record))
+        else:
+            await self.out_file.write(f"File: {record.relative_path}\n")
+            async for chunk in record.content:
+                await self.out_file.write(chunk)
+            await self.out_file.write("\n\n")
+        if self.index is not None:
+            self.index.end(record)
+
+    async def finish(self) -> None:
+        pass
+
+
+class JsonWriter:
+    """
+    Write ``{"prompt": ..., "files": [{"path", "kind", "content"}, ...]}``
+    one file record at a time, so the whole document is never held in memory.
+    """
+
+    def __init__(self, out_file, index: Optional["SectionIndex"] = None):
+        self.out_file = out_file if index is None else index.track(out_file)
+        self.index = index
+        self.count = 0
+
+    @staticmethod
+    def base_size() -> int:
+        return len(_JSON_HEAD) + len("\n  ]\n}\n")
+
+    @staticmethod
+    def record_size(record: FileRecord) -> int:
+        # json.dumps escapes everything beyond ASCII
+        return len(_JSON_SEPARATOR) + len(json.dumps(record_to_dict(record)))
+
+    async def start(self) -> None:
+        await self.out_file.write(_JSON_HEAD)
+
+    async def write_record(self, record: FileRecord) -> None:
+        separator = _JSON_SEPARATOR if self.count else "\n    "
+        self.count += 1
+        await self.out_file.write(separator)
+        if self.index is not None:
+            self.index.begin()
+        await write_json_record(self.out_file, record)
+        if self.index is not None:
+            self.index.end(record)
+
+    async def finish(self) -> None:
+        await self.out_file.write("\n  ]\n}\n" if self.count else "]\n}\n")
+
+
+class JsonLinesWriter:
+    """Write a ``{"prompt": ...}`` line followed by one JSON line per file."""
+
+    def __init__(self, out_file, index: Optional["SectionIndex"] = None):
+        self.out_file = out_file if index is None else index.track(out_file)
+        self.index = index
+
+    @staticmethod
+    def base_size() -> int:
+        return len(json.dumps({"prompt": STRUCTURED_PROMPT})) + 1
+
+    @staticmethod
+    def record_size(record: FileRecord) -> int:
+        return len(json.dumps(record_to_dict(record))) + 1
+
+    async def start(self) -> None:
+        await self.out_file.write(json.dumps({"prompt": STRUCTURED_PROMPT}) + "\n")
+
+    async def write_record(self, record: FileRecord) -> None:
+        if self.index is not None:
+            self.index.begin()
+        await write_json_record(self.out_file, record)
+        await self.out_file.write("\n")
+        if self.index is not None:
+            self.index.end(record)
+
+    async def finish(self) -> None:
+        pass
+
+
+class YamlWriter:
+    """Write the same document as ``JsonWriter`` as YAML, one record at a time."""
+
+    def __init__(self, out_file, index: Optional["SectionIndex"] = None):
+        self.out_file = out_file if index is None else index.track(out_file)
+        self.index = index
+        self.count = 0
+
+    @staticmethod
+    def base_size() -> int:
+        head = f"prompt: {yaml_quote(STRUCTURED_PROMPT)}\n"
+        return utf8_size(head) + len("files: []\n")
+
+    @staticmethod
+    def record_size(record: FileRecord) -> int:
+        return utf8_size(f"{_yaml_head(record)}{yaml_quote(record.content)}\n")
+
+    async def start(self) -> None:
+        await self.out_file.write(f"prompt: {yaml_quote(STRUCTURED_PROMPT)}\n")
+
+    async def write_record(self, record: FileRecord) -> None:
+        if not self.count:
+            await self.out_file.write("files:\n")
+        self.count += 1
+        if self.index is not None:
+            self.index.begin()
+        prefix = _yaml_head(record)
+        if isinstance(record.content, str):
+            await self.out_file.write(f"{prefix}{yaml_quote(record.content)}\n")
+        else:
+            await self.out_file.write(prefix + '"')
+            async for chunk in record.content:
+                await self.out_file.write(_YAML_UNSAFE.sub(_yaml_escape, chunk))
+            await self.out_file.write('"\n')
+        if self.index is not None:
+            self.index.end(record)
+
+    async def finish(self) -> None:
+        if not self.count:
+            await self.out_file.write("files: []\n")
+
+
+WRITERS = {
+    "text": TextWriter,
+    "json": JsonWriter,
+    "jsonl": JsonLinesWriter,
+    "yaml": YamlWriter,
+}
+
+
+def get_writer(output_format: str):
+    """Return the writer class for ``output_format``."""
+    try:
+        return WRITERS[output_format]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported output format: {output_format} "
+            f"(expected one of: {', '.join(OUTPUT_FORMATS)})"
+        ) from None
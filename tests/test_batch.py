@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import pytest
+from code_context_compiler.config import load_batch
+from code_context_compiler.runtime import Runtime, _key
+from code_context_compiler.scraper import scrape_project, scrape_projects
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    for name in ("api", "web", "docs"):
+        project_path = tmp_path / "repos" / name
+        project_path.mkdir(parents=True)
+        (project_path / "main.py").write_text(f'password = "{name}-secret"\n')
+        (project_path / ".gitignore").write_text("*.tmp\n")
+    (tmp_path / "web.yaml").write_text("file_extensions: ['.md']\n")
+    manifest = tmp_path / "batch.yaml"
+    manifest.write_text(
+        """
+config:
+  jobs: 2
+projects:
+  - project: repos/api
+    output: out/api.txt
+  - project: repos/web
+    output: out/web.json
+    output_format: json
+    config_file: web.yaml
+    config: {dedupe: true}
+  - project: repos/docs
+    output: out/docs.xml
+    output_format: xml
+"""
+    )
+    (tmp_path / "out").mkdir()
+    return manifest
+
+
+def test_load_batch(tmp_path, manifest):
+    api, web, docs = load_batch(manifest)
+    assert api["project_path"] == str(tmp_path / "repos" / "api")
+    assert api["output_file"] == str(tmp_path / "out" / "api.txt")
+    assert api["output_format"] == "text"
+    assert api["config"]["jobs"] == 2
+    assert api["config"]["file_extensions"] == []
+    assert web["config"]["file_extensions"] == [".md"]
+    assert web["config"]["jobs"] == 2
+    assert web["config"]["dedupe"] is True
+    assert docs["output_format"] == "xml"
+
+    bad = tmp_path / "bad.yaml"
+    bad.write_text("projects:\n  - project: repos/api\n")
+    with pytest.raises(ValueError, match="output"):
+        load_batch(bad)
+
+
+@pytest.mark.asyncio
+async def test_scrape_projects_isolates_failures(tmp_path, manifest):
+    results = []
+    with Runtime() as runtime:
+        returned = await scrape_projects(load_batch(manifest), 2, results.append, runtime)
+        # The projects have the same patterns, compiled once
+        assert len(runtime._maskers) == 1
+        assert len(runtime._gitignores) == 1
+
+    assert [result.output_file for result in returned] == [
+        str(tmp_path / "out" / name) for name in ("api.txt", "web.json", "docs.xml")
+    ]
+    assert sorted(results) == sorted(returned)
+    assert [result.error is None for result in returned] == [True, True, False]
+    assert "xml" in returned[2].error
+
+    text = (tmp_path / "out" / "api.txt").read_text()
+    assert "File: main.py" in text
+    assert "api-secret" not in text
+    assert json.loads((tmp_path / "out" / "web.json").read_text())["files"] == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [1, 2])
+async def test_runtime_keeps_stats_per_project(tmp_path, workers):
+    for name, count in (("one", 1), ("three", 3)):
+        for i in range(count):
+            project_path = tmp_path / name
+            project_path.mkdir(exist_ok=True)
+            (project_path / f"mod{i}.py").write_text('password = "secret"\n')
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']', r"token"],
+        "use_git": False,
+        "workers": workers,
+    }
+
+    reports = {}
+    with Runtime() as runtime:
+        await asyncio.gather(
+            *(
+                scrape_project(
+                    str(tmp_path / name),
+                    str(tmp_path / f"{name}.txt"),
+                    config,
+                    "text",
+                    lambda x: None,
+                    lambda report, name=name: reports.__setitem__(name, report),
+                    runtime,
+                )
+                for name in ("one", "three")
+            )
+        )
+        # Only the projects timed their patterns
+        assert not any(runtime._maskers[_key(config["mask_patterns"])].stats["pattern_seconds"])
+
+    for name, count in (("one", 1), ("three", 3)):
+        assert reports[name]["prefilter"]["files"] == count
+        assert [p["matches"] for p in reports[name]["patterns"]] == [count, 0]
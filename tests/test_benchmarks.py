@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from benchmarks.generate import ProjectSpec, generate_project
+from benchmarks.run import bench_stages
+from code_context_compiler.config import DEFAULT_CONFIG
+
+SPEC = ProjectSpec(files=30, depth=2, fanout=2, median_size=512)
+
+
+def tree_digest(root):
+    digest = hashlib.sha256()
+    for directory, dirs, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def test_generate_project_is_deterministic(tmp_path):
+    first = generate_project(str(tmp_path / "a"), SPEC, seed=1)
+    second = generate_project(str(tmp_path / "b"), SPEC, seed=1)
+    assert first == second
+    assert first["files"] == 30
+    assert tree_digest(tmp_path / "a") == tree_digest(tmp_path / "b")
+    generate_project(str(tmp_path / "c"), SPEC, seed=2)
+    assert tree_digest(tmp_path / "c") != tree_digest(tmp_path / "a")
+
+
+def test_bench_stages_reports_every_stage(tmp_path):
+    summary = generate_project(str(tmp_path), SPEC)
+    stages = bench_stages(str(tmp_path), DEFAULT_CONFIG, repeat=1)
+    assert set(stages) == {"walk", "filter", "read", "mask", "write_text", "write_json", "write_jsonl", "write_yaml"}
+    # Files ignored through the generated .gitignore files are never walked,
+    # while the .gitignore files themselves are
+    assert stages["walk"]["files"] == summary["files"] - summary["ignored"] + summary["gitignores"]
+    assert stages["mask"]["files"] == stages["walk"]["files"] - summary["binary"]
@@ -0,0 +1,119 @@
+import os
+from typing import NamedTuple
+
+import pytest
+from code_context_compiler.budget import RECORD_OVERHEAD, Budget, estimate_tokens
+from code_context_compiler.scraper import scrape_project
+from code_context_compiler.writers import FileRecord
+
+
+class Entry(NamedTuple):
+    relative_path: str
+    size: int
+    mtime_ns: int = 0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens(0) == 0
+    assert estimate_tokens(1) == 1
+    assert estimate_tokens(4000) == 1000
+    assert estimate_tokens(10, bytes_per_token=3.5) == 3
+
+
+def test_budget_plan_ranking():
+    entries = [
+        Entry("docs/big.md", 500, mtime_ns=3),
+        Entry("src/app.py", 400, mtime_ns=1),
+        Entry("src/old.py", 100, mtime_ns=1),
+        Entry("src/new.py", 100, mtime_ns=2),
+    ]
+    placeholders = sum(len(e.relative_path) + RECORD_OVERHEAD for e in entries)
+
+    budget = Budget(placeholders + 600, priority_patterns={"src/*": 1})
+    # src/ comes first, then the most recent and the smallest files
+    assert budget.plan(entries) == {"src/new.py", "src/old.py", "src/app.py"}
+
+    budget = Budget(placeholders + 600, priority_by=["small"])
+    assert budget.plan(entries) == {"src/new.py", "src/old.py", "src/app.py"}
+
+    budget = Budget(placeholders + 600, priority_by=["recent", "large"])
+    assert budget.plan(entries) == {"docs/big.md", "src/new.py"}
+
+    with pytest.raises(ValueError, match="newest"):
+        Budget(100, priority_by=["newest"])
+
+
+def test_budget_admit_elides_what_no_longer_fits():
+    entries = [Entry("a.py", 10), Entry("b.py", 10)]
+    budget = Budget(2 * (4 + RECORD_OVERHEAD) + 20)
+    assert budget.plan(entries) == {"a.py", "b.py"}
+    # Masking made the first file larger than planned
+    assert budget.admit(FileRecord("a.py", "text", "x" * 15)).kind == "text"
+    assert budget.admit(FileRecord("b.py", "text", "y" * 10)).kind == "elided"
+    assert budget.used <= budget.max_bytes
+    assert budget.elided == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", ["max_bytes", "max_tokens"])
+async def test_scrape_project_with_budget(tmp_path, limit):
+    project_path = tmp_path / "project"
+    (project_path / "src").mkdir(parents=True)
+    (project_path / "src" / "main.py").write_text("print('main')\n" * 50)
+    (project_path / "notes.md").write_text("note\n" * 100)
+    (project_path / "big.txt").write_text("data\n" * 2000)
+    (project_path / "logo.png").write_bytes(b"png")
+
+    budget = 3200 if limit == "max_bytes" else 800
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [],
+        "use_git": False,
+        limit: budget,
+        "priority_patterns": {"src/*": 10},
+    }
+    reports = []
+    output_file = tmp_path / "output.txt"
+    await scrape_project(str(project_path), str(output_file), config, "text", lambda x: None, reports.append)
+
+    content = output_file.read_text()
+    assert len(content) <= 3200
+    assert "print('main')" in content
+    assert "note\n" in content
+    assert "[ELIDED FILE PLACEHOLDER: big.txt]" in content
+    assert "[MEDIA FILE PLACEHOLDER: logo.png]" in content
+
+    [report] = reports
+    # The elided file was never read
+    assert report["bytes_read"] == os.path.getsize(project_path / "src" / "main.py") + os.path.getsize(project_path / "notes.md")
+    assert report["skipped"] == {"budget": 1}
+    assert report["budget"]["elided"] == 1
+    assert report["budget"]["used_bytes"] <= report["budget"]["max_bytes"] == 3200
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["text", "json", "jsonl", "yaml"])
+async def test_scrape_project_output_fits_budget(tmp_path, output_format):
+    project_path = tmp_path / "project"
+    nested = project_path / ("long_directory_name_" * 4) / "package"
+    nested.mkdir(parents=True)
+    for i in range(40):
+        # Quotes, backslashes, tabs and non-ASCII text grow when escaped
+        (nested / f"module_{i}.py").write_text('print("\\t\té")\n' * (i * 5))
+    (nested / "logo.png").write_bytes(b"png")
+
+    for max_bytes in (15000, 30000):
+        config = {
+            "ignore_patterns": [],
+            "file_extensions": [],
+            "mask_patterns": [],
+            "use_git": False,
+            "max_bytes": max_bytes,
+        }
+        output_file = tmp_path / f"output.{output_format}"
+        await scrape_project(str(project_path), str(output_file), config, output_format, lambda x: None)
+
+        content = output_file.read_bytes()
+        assert len(content) <= max_bytes
+        assert b"elided" in content.lower() and b"print(" in content
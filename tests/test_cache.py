@@ -0,0 +1,129 @@
+import logging
+import os
+
+import pytest
+from code_context_compiler.cache import FileCache, config_fingerprint, content_digest
+from code_context_compiler.scraper import scrape_project
+
+logger = logging.getLogger(__name__)
+
+OLD = 10**9  # An mtime far outside the racy window
+
+
+def test_cache_stat_and_content_hits(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    digest = content_digest(b"data")
+    cache = FileCache(cache_dir, "fp", max_bytes=10**6)
+    assert cache.lookup("a.py", 4, OLD) is None
+    cache.store("a.py", 4, OLD, digest, "text", "masked\ncontent")
+    cache.close(str(tmp_path), logger)
+
+    cache = FileCache(cache_dir, "fp", max_bytes=10**6)
+    assert cache.lookup("a.py", 4, OLD) == ("text", "masked\ncontent")
+    # Touched file: stat differs but content hash still matches
+    assert cache.lookup("a.py", 4, OLD + 1) is None
+    assert cache.lookup("a.py", 4, OLD + 1, digest) == ("text", "masked\ncontent")
+
+    # A different mask configuration never sees these objects
+    other = FileCache(cache_dir, "other-fp", max_bytes=10**6)
+    assert other.lookup("a.py", 4, OLD + 1, digest) is None
+
+
+def test_cache_racy_stat_is_not_trusted(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), "fp", max_bytes=10**6)
+    mtime_ns = os.stat(tmp_path).st_mtime_ns
+    cache.store("a.py", 4, mtime_ns, content_digest(b"data"), "text", "x")
+    assert cache.lookup("a.py", 4, mtime_ns) is None
+
+
+def test_cache_eviction(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    (tmp_path / "kept.py").write_text("kept")
+    cache = FileCache(cache_dir, "fp", max_bytes=30)
+    cache.store("gone.py", 1, OLD, content_digest(b"gone"), "text", "gone")
+    cache.store("kept.py", 1, OLD, content_digest(b"kept"), "text", "kept")
+    cache.close(str(tmp_path), logger)
+
+    cache = FileCache(cache_dir, "fp", max_bytes=30)
+    assert cache.lookup("kept.py", 1, OLD) == ("text", "kept")
+    cache.close(str(tmp_path), logger)
+
+    cache = FileCache(cache_dir, "fp", max_bytes=30)
+    # gone.py was not seen and no longer exists, so it was evicted
+    assert cache.lookup("gone.py", 1, OLD, content_digest(b"gone")) is None
+    assert cache.lookup("kept.py", 1, OLD) == ("text", "kept")
+
+    cache.store("big.py", 1, OLD, content_digest(b"big"), "text", "x" * 20)
+    cache.close(str(tmp_path), logger)
+    objects = [f for _, _, files in os.walk(os.path.join(cache_dir, "objects")) for f in files]
+    # Over the cap, the least recently used object goes first
+    assert len(objects) == 1
+    cache = FileCache(cache_dir, "fp", max_bytes=30)
+    assert cache.lookup("kept.py", 1, OLD) is None
+    assert cache.lookup("big.py", 1, OLD) == ("text", "x" * 20)
+
+
+@pytest.mark.asyncio
+async def test_scrape_project_with_cache(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "a.py").write_text('password = "secret"')
+    (project_path / "b.py").write_text("print('b')")
+
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+        "cache": True,
+    }
+
+    first = tmp_path / "first.txt"
+    await scrape_project(str(project_path), str(first), config, "text", lambda x: None)
+    assert (project_path / ".ccc-cache" / "index.json").exists()
+
+    second = tmp_path / "second.txt"
+    await scrape_project(str(project_path), str(second), config, "text", lambda x: None)
+    assert first.read_text() == second.read_text()
+    assert ".ccc-cache" not in second.read_text()
+
+    (project_path / "b.py").write_text("print('changed')")
+    third = tmp_path / "third.txt"
+    await scrape_project(str(project_path), str(third), config, "text", lambda x: None)
+    assert "print('changed')" in third.read_text()
+    assert 'password = "******"' in third.read_text()
+
+    assert config_fingerprint(config) != config_fingerprint({**config, "mask_patterns": []})
+
+
+@pytest.mark.asyncio
+async def test_failed_scrape_saves_cache(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    for name in ("a", "b", "c"):
+        (project_path / f"{name}.py").write_text(f"print('{name}')")
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [],
+        "use_git": False,
+        "cache": True,
+        "jobs": 1,
+    }
+
+    def fail(percentage):
+        raise RuntimeError("interrupted")
+
+    with pytest.raises(RuntimeError):
+        await scrape_project(str(project_path), str(tmp_path / "out.txt"), config, "text", fail)
+
+    # The objects stored before the failure are in the index
+    cache_dir = str(project_path / ".ccc-cache")
+    objects = [
+        name
+        for _, _, names in os.walk(os.path.join(cache_dir, "objects"))
+        for name in names
+    ]
+    assert objects
+    cache = FileCache(cache_dir, config_fingerprint(config), max_bytes=10**6)
+    assert len(cache._objects) == len(objects)
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from typer.testing import CliRunner
 from code_context_compiler.cli import app
@@ -39,17 +41,143 @@ mask_patterns:
     content = output_file.read_text()
     assert 'api_key = "******"' in content
 
-# def test_cli_output_format(tmp_path):
-#     project_path = tmp_path / "project"
-#     project_path.mkdir()
-#     file_path = project_path / "test_file.py"
-#     file_path.write_text('password = "secret"')
+def test_cli_with_jobs(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "test_file.py").write_text('password = "secret"')
 
-#     output_file = tmp_path / "output.json"
-    
-#     result = runner.invoke(app, [str(project_path), str(output_file), "--output-format", "json"])
-#     assert result.exit_code == 0
+    output_file = tmp_path / "output.txt"
+
+    result = runner.invoke(app, [str(project_path), str(output_file), "--jobs", "2"])
+    assert result.exit_code == 0
+
+    content = output_file.read_text()
+    assert 'password = "******"' in content
+
+def test_cli_with_workers(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "test_file.py").write_text('password = "secret"')
+
+    output_file = tmp_path / "output.txt"
+
+    result = runner.invoke(app, [str(project_path), str(output_file), "--workers", "2"])
+    assert result.exit_code == 0
+
+    content = output_file.read_text()
+    assert 'password = "******"' in content
+
+def test_cli_output_format(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    file_path = project_path / "test_file.py"
+    file_path.write_text('password = "secret"')
+
+    output_file = tmp_path / "output.json"
+
+    result = runner.invoke(app, [str(project_path), str(output_file), "--output-format", "json"])
+    assert result.exit_code == 0
+
+    content = json.loads(output_file.read_text())
+    assert content["files"] == [{"path": "test_file.py", "kind": "text", "content": 'password = "******"'}]
+
+def test_cli_unsupported_output_format(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+
+    result = runner.invoke(app, [str(project_path), str(tmp_path / "output.xml"), "--output-format", "xml"])
+    assert result.exit_code == 1
+    assert "Unsupported output format" in result.output
+
+def test_cli_stdout(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "test_file.py").write_text('password = "secret"')
+
+    result = runner.invoke(app, [str(project_path), "-", "--output-format", "jsonl"])
+    assert result.exit_code == 0
+
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert "prompt" in lines[0]
+    assert lines[1]["content"] == 'password = "******"'
+
+def test_cli_stats(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "test_file.py").write_text('password = "secret"')
+
+    stats_file = tmp_path / "stats.json"
+    result = runner.invoke(app, [str(project_path), str(tmp_path / "output.txt"), "--stats", str(stats_file)])
+    assert result.exit_code == 0
+
+    report = json.loads(stats_file.read_text())
+    assert report["files"] == {"text": 1}
+    assert sum(pattern["matches"] for pattern in report["patterns"]) == 1
+
+def test_cli_help_lists_commands():
+    for args in (["--help"], ["-h"]):
+        result = runner.invoke(app, args)
+        assert result.exit_code == 0
+        assert "watch" in result.stdout and "extract" in result.stdout
+    result = runner.invoke(app, [])
+    assert "watch" in result.output
+
+def test_cli_watch_needs_output_file(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+
+    result = runner.invoke(app, ["watch", str(project_path), "-"])
+    assert result.exit_code == 1
+    assert "needs an output file" in result.output
+
+def test_cli_index_and_extract(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / "src").mkdir(parents=True)
+    (project_path / "src" / "app.py").write_text('password = "secret"\nprint("app")\n')
+    (project_path / "README.md").write_text("# Readme\n")
+    output_file = tmp_path / "output.txt"
+
+    result = runner.invoke(app, [str(project_path), str(output_file), "--index"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(app, ["extract", str(output_file), "--list"])
+    assert result.stdout.split() == ["README.md", str(Path("src") / "app.py")]
+    result = runner.invoke(app, ["extract", str(output_file), str(Path("src") / "app.py")])
+    assert result.exit_code == 0
+    assert result.stdout == 'password = "******"\nprint("app")\n'
+
+    result = runner.invoke(app, ["extract", str(output_file), "missing.py"])
+    assert result.exit_code == 1
+
+def test_cli_extract_stays_in_output_dir(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "README.md").write_text("# Readme\n")
+    output_file = tmp_path / "output.txt"
+    result = runner.invoke(app, [str(project_path), str(output_file), "--index"])
+    assert result.exit_code == 0
+
+    # An index naming a file outside of the output directory
+    index_file = tmp_path / "output.txt.index.json"
+    index_file.write_text(index_file.read_text().replace('"README.md"', '"../x.md"'))
+    output_dir = tmp_path / "extracted"
+    result = runner.invoke(app, ["extract", str(output_file), "../x.md", "--output-dir", str(output_dir)])
+    assert result.exit_code == 1
+    assert "outside" in result.output
+    assert not (tmp_path / "x.md").exists()
+
+def test_cli_batch(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "main.py").write_text(f"print('{name}')\n")
+    manifest = tmp_path / "batch.yaml"
+    manifest.write_text(
+        "projects:\n"
+        "  - {project: a, output: a.txt}\n"
+        "  - {project: b, output: missing/b.txt}\n"
+    )
 
-#     content = output_file.read_text()
-#     assert '"test_file.py"' in content
-#     assert '"password = \\"***MASKED***\\""' in content
+    result = runner.invoke(app, ["batch", str(manifest)])
+    assert result.exit_code == 1
+    assert "print('a')" in (tmp_path / "a.txt").read_text()
+    assert "1 of 2 projects failed" in result.stdout
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+
+import pytest
+from code_context_compiler.dedupe import Deduplicator
+from code_context_compiler.scraper import scrape_project
+from code_context_compiler.writers import FileRecord, TextWriter
+
+CONFIG = {
+    "ignore_patterns": [],
+    "file_extensions": [],
+    "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+    "use_git": False,
+    "dedupe": True,
+}
+
+SHARED = 'password = "secret"\n'
+MASKED = 'password = "******"\n'
+
+
+def make_project(root):
+    for package in ("a", "b", "c"):
+        (root / package).mkdir(parents=True)
+        (root / package / "__init__.py").write_text(SHARED)
+        (root / package / "module.py").write_text(f"print({package!r})\n")
+    (root / "empty.txt").write_text("")
+    (root / "blank.txt").write_text("")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("jobs", [1, 16])
+async def test_dedupe_text_output(tmp_path, jobs):
+    project_path = tmp_path / "project"
+    make_project(project_path)
+    output_file = tmp_path / "output.txt"
+
+    reports = []
+    config = {**CONFIG, "jobs": jobs}
+    await scrape_project(str(project_path), str(output_file), config, "text", lambda x: None, reports.append)
+
+    content = output_file.read_text()
+    first = os.path.join("a", "__init__.py")
+    assert content.count(MASKED) == 1
+    assert content.count(f"[IDENTICAL TO: {first}]") == 2
+    assert f"File: {os.path.join('c', '__init__.py')}\n[IDENTICAL TO: {first}]\n" in content
+    assert "File: empty.txt\n[IDENTICAL TO: blank.txt]\n" in content
+    assert "print('c')" in content
+
+    [report] = reports
+    # The shared content was masked only once
+    assert [pattern["matches"] for pattern in report["patterns"]] == [1]
+    assert report["dedupe"] == {"files": 3, "bytes_saved": 2 * len(MASKED)}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["json", "jsonl"])
+async def test_dedupe_structured_output(tmp_path, output_format):
+    project_path = tmp_path / "project"
+    make_project(project_path)
+    output_file = tmp_path / f"output.{output_format}"
+    await scrape_project(str(project_path), str(output_file), CONFIG, output_format, lambda x: None)
+
+    if output_format == "json":
+        files = json.loads(output_file.read_text())["files"]
+    else:
+        files = [json.loads(line) for line in output_file.read_text().splitlines()[1:]]
+    records = {record["path"]: record for record in files}
+    first = records[os.path.join("a", "__init__.py")]
+    assert first["content"] == MASKED
+    assert "identical_to" not in first
+    for package in ("b", "c"):
+        copy = records[os.path.join(package, "__init__.py")]
+        assert copy["content_id"] == first["content_id"]
+        assert copy["identical_to"] == os.path.join("a", "__init__.py")
+        assert copy["content"] == ""
+    assert records[os.path.join("b", "module.py")]["content_id"] != first["content_id"]
+
+
+@pytest.mark.asyncio
+async def test_dedupe_with_cache(tmp_path):
+    project_path = tmp_path / "project"
+    make_project(project_path)
+    config = {**CONFIG, "cache": True}
+
+    outputs = []
+    for run in range(2):
+        output_file = tmp_path / f"output{run}.txt"
+        await scrape_project(str(project_path), str(output_file), config, "text", lambda x: None)
+        outputs.append(output_file.read_text())
+    # Cache hits are deduplicated like freshly masked files
+    assert outputs[0] == outputs[1]
+    assert outputs[1].count(MASKED) == 1
+
+
+@pytest.mark.asyncio
+async def test_dedupe_with_budget(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "a.txt").write_text("1 " * 10 + "\n")
+    (project_path / "b.txt").write_text("1 " * 10 + "\n")
+    # Masking makes the content larger than planned, so it no longer fits
+    placeholder = TextWriter.record_size(FileRecord("a.txt", "elided", ""))
+    config = {
+        **CONFIG,
+        "mask_patterns": [{"pattern": r"\d", "preserve_length": False}],
+        "max_bytes": TextWriter.base_size() + 2 * placeholder + 30,
+    }
+    output_file = tmp_path / "output.txt"
+    await scrape_project(str(project_path), str(output_file), config, "text", lambda x: None)
+
+    # Never a reference to a copy that was elided
+    content = output_file.read_text()
+    assert "IDENTICAL TO" not in content
+    assert "File: b.txt\n[ELIDED FILE PLACEHOLDER: b.txt]\n" in content
+
+
+@pytest.mark.asyncio
+async def test_no_dedupe_by_default(tmp_path):
+    project_path = tmp_path / "project"
+    make_project(project_path)
+    output_file = tmp_path / "output.json"
+    config = {**CONFIG, "dedupe": False}
+    await scrape_project(str(project_path), str(output_file), config, "json", lambda x: None)
+
+    files = json.loads(output_file.read_text())["files"]
+    assert all(set(record) == {"path", "kind", "content"} for record in files)
+    assert sum(record["content"] == MASKED for record in files) == 3
+
+
+@pytest.mark.asyncio
+async def test_dedupe_copies_share_the_error_of_the_first():
+    dedupe = Deduplicator()
+    started = asyncio.Event()
+
+    async def fail():
+        started.set()
+        await asyncio.sleep(0.01)
+        raise UnicodeDecodeError("utf-8", b"", 0, 1, "bad")
+
+    first = asyncio.ensure_future(dedupe.mask("id", fail))
+    await started.wait()
+    copy = asyncio.ensure_future(dedupe.mask("id", fail))
+    results = await asyncio.gather(first, copy, return_exceptions=True)
+    assert [type(result) for result in results] == [UnicodeDecodeError] * 2
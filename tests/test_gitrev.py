@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+from code_context_compiler.gitrev import BlobReader, list_tree
+from code_context_compiler.scraper import scrape_project
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+CONFIG = {
+    "ignore_patterns": [".git", "*.log"],
+    "file_extensions": [],
+    "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+    "use_git": False,
+}
+
+
+def git(repo, *args):
+    return subprocess.run(
+        ["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        check=True, capture_output=True, text=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repository with two commits, tagged v1 and v2."""
+    repo = tmp_path / "repo"
+    (repo / "src" / "pkg").mkdir(parents=True)
+    git(repo, "init", "-q")
+    (repo / ".gitignore").write_text("build/\n")
+    (repo / "src" / "app.py").write_text('password = "secret"\n')
+    (repo / "src" / "pkg" / "util.py").write_text("print('util')\n")
+    (repo / "README.md").write_text("# Readme\n")
+    (repo / "debug.log").write_text("tracked but ignored\n")
+    (repo / "data.bin").write_bytes(b"\0\1\2")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "v1")
+    git(repo, "tag", "v1")
+    (repo / "src" / "app.py").write_text('password = "changed"\nprint("v2")\n')
+    (repo / "build").mkdir()
+    (repo / "build" / "out.txt").write_text("force-added build output\n")
+    git(repo, "add", "-A")
+    git(repo, "add", "-f", "build/out.txt")
+    git(repo, "commit", "-qm", "v2")
+    git(repo, "tag", "v2")
+    return repo
+
+
+def test_list_tree_and_read_blobs(repo):
+    entries = list_tree(str(repo), "v1")
+    assert [entry.relative_path for entry in entries] == [
+        ".gitignore",
+        "README.md",
+        "data.bin",
+        "debug.log",
+        os.path.join("src", "app.py"),
+        os.path.join("src", "pkg", "util.py"),
+    ]
+    with BlobReader(str(repo)) as reader:
+        assert reader.read(entries[1].sha) == b"# Readme\n"
+        assert reader.read(entries[2].sha) == b"\0\1\2"
+        with pytest.raises(ValueError):
+            reader.read("0" * 40)
+        # The reader keeps working after a missing object
+        assert reader.read(entries[1].sha) == b"# Readme\n"
+
+    with pytest.raises(ValueError, match="nope"):
+        list_tree(str(repo), "nope")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["text", "json"])
+async def test_scrape_revision_matches_checkout(tmp_path, repo, output_format):
+    # The working tree has moved on and is dirty, the revision is what counts
+    (repo / "src" / "app.py").write_text("uncommitted\n")
+    (repo / "untracked.py").write_text("untracked\n")
+
+    from_rev = tmp_path / f"rev.{output_format}"
+    config = {**CONFIG, "rev": "v1"}
+    await scrape_project(str(repo), str(from_rev), config, output_format, lambda x: None)
+
+    checkout = tmp_path / "checkout"
+    git(repo, "worktree", "add", "-q", str(checkout), "v1")
+    os.remove(checkout / ".git")
+    from_checkout = tmp_path / f"checkout.{output_format}"
+    await scrape_project(str(checkout), str(from_checkout), CONFIG, output_format, lambda x: None)
+
+    assert from_rev.read_text() == from_checkout.read_text()
+    assert "secret" not in from_rev.read_text()
+    assert "uncommitted" not in from_rev.read_text()
+    assert "debug.log" not in from_rev.read_text()
+
+
+@pytest.mark.asyncio
+async def test_scrape_revisions_share_cached_blobs(tmp_path, repo):
+    bare = tmp_path / "bare.git"
+    subprocess.run(["git", "clone", "-q", "--bare", str(repo), str(bare)], check=True)
+    config = {**CONFIG, "cache": True}
+
+    reports = []
+    for rev in ("v1", "v2"):
+        output_file = tmp_path / f"{rev}.txt"
+        await scrape_project(
+            str(bare), str(output_file), {**config, "rev": rev}, "text",
+            lambda x: None, reports.append,
+        )
+    assert "print(\"v2\")" not in (tmp_path / "v1.txt").read_text()
+    assert "print(\"v2\")" in (tmp_path / "v2.txt").read_text()
+    # build/ is ignored by the revision's own .gitignore
+    assert "build" + os.sep + "out.txt" not in (tmp_path / "v2.txt").read_text()
+
+    assert reports[0]["cache"] == {"hits": 0, "misses": 5}
+    # Only src/app.py changed between the revisions
+    assert reports[1]["cache"] == {"hits": 4, "misses": 1}
+    assert reports[1]["files"] == {"text": 4, "binary": 1}
+    assert reports[1]["skipped"] == {"ignored": 2}
+
+
+@pytest.mark.asyncio
+async def test_scrape_since_revision(tmp_path, repo):
+    (repo / "README.md").write_text("# Uncommitted change\n")
+    output_file = tmp_path / "output.json"
+
+    reports = []
+    config = {**CONFIG, "since": "v1"}
+    await scrape_project(str(repo), str(output_file), config, "json", lambda x: None, reports.append)
+    files = json.loads(output_file.read_text())["files"]
+    # build/out.txt changed too, but is ignored
+    assert [record["path"] for record in files] == ["README.md", os.path.join("src", "app.py")]
+    # debug.log and build/ are ignored; src/pkg holds no change and is not
+    # walked at all
+    assert reports[0]["skipped"] == {"ignored": 2, "unchanged": 2}
+
+    config = {**config, "list_unchanged": True}
+    await scrape_project(str(repo), str(output_file), config, "json", lambda x: None)
+    kinds = {record["path"]: record["kind"] for record in json.loads(output_file.read_text())["files"]}
+    assert kinds == {
+        ".gitignore": "unchanged",
+        "README.md": "text",
+        "data.bin": "unchanged",
+        os.path.join("src", "app.py"): "text",
+        os.path.join("src", "pkg", "util.py"): "unchanged",
+    }
+
+    # Between two revisions, without looking at the working tree
+    config = {**CONFIG, "since": "v1", "rev": "v2", "list_unchanged": True}
+    await scrape_project(str(repo), str(output_file), config, "json", lambda x: None)
+    files = json.loads(output_file.read_text())["files"]
+    assert [record["path"] for record in files if record["kind"] != "unchanged"] == [
+        os.path.join("src", "app.py")
+    ]
+    assert [record["path"] for record in files] == list(kinds)
+
+
+@pytest.mark.asyncio
+async def test_scrape_revision_dedupe(tmp_path, repo):
+    (repo / "copy.py").write_text("print('util')\n")
+    git(repo, "add", "copy.py")
+    git(repo, "commit", "-qm", "copy")
+
+    output_file = tmp_path / "output.json"
+    config = {**CONFIG, "rev": "HEAD", "dedupe": True}
+    await scrape_project(str(repo), str(output_file), config, "json", lambda x: None)
+    records = {record["path"]: record for record in json.loads(output_file.read_text())["files"]}
+    first = records["copy.py"]
+    copy = records[os.path.join("src", "pkg", "util.py")]
+    # The object id of the blob is the content id
+    assert first["content_id"] == git(repo, "rev-parse", "HEAD:copy.py")
+    assert copy["content_id"] == first["content_id"]
+    assert copy["identical_to"] == "copy.py"
+
+
+@pytest.mark.asyncio
+async def test_scrape_revision_with_budget(tmp_path, repo):
+    output_file = tmp_path / "output.json"
+    config = {**CONFIG, "rev": "v1", "max_bytes": 1980, "priority_by": ["large"]}
+    await scrape_project(str(repo), str(output_file), config, "json", lambda x: None)
+    kinds = {record["path"]: record["kind"] for record in json.loads(output_file.read_text())["files"]}
+    # The largest file fits next to the prompt, the next largest ones do not
+    assert kinds[os.path.join("src", "app.py")] == "text"
+    assert kinds["README.md"] == "elided"
+    assert kinds[os.path.join("src", "pkg", "util.py")] == "elided"
@@ -0,0 +1,67 @@
+import logging
+
+import pytest
+from code_context_compiler.ignore import IgnoreMatcher
+from code_context_compiler.scraper import is_ignored, load_gitignore, scrape_project
+
+logger = logging.getLogger(__name__)
+
+
+def test_matcher_agrees_with_is_ignored(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\n/dist\n")
+    patterns = ["*.tmp", "node_modules", "docs/", "*/generated_*"]
+    matcher = IgnoreMatcher(str(tmp_path), patterns, logger)
+    gitignore_spec = load_gitignore(str(tmp_path))
+
+    paths = [
+        "app.py", "app.log", "nested/app.log", "dist", "nested/dist",
+        "a.tmp", "deep/er/a.tmp", "node_modules", "src/node_modules",
+        "docs", "docs/index.md", "docsite.md", "src/generated_api.py", "generated_api.py",
+    ]
+    for path in paths:
+        expected = is_ignored(str(tmp_path / path), str(tmp_path), gitignore_spec, patterns, logger)
+        assert matcher.is_ignored(path) == expected, path
+
+
+def test_matcher_directory_only_patterns_and_negation(tmp_path):
+    (tmp_path / ".gitignore").write_text("build/\n*.log\n!keep.log\n")
+    matcher = IgnoreMatcher(str(tmp_path), [], logger)
+    assert matcher.is_ignored("build", is_dir=True)
+    assert matcher.is_ignored("src/build", is_dir=True)
+    assert not matcher.is_ignored("build")  # A file named build is kept
+    assert matcher.is_ignored("debug.log")
+    assert not matcher.is_ignored("keep.log")
+
+
+def test_matcher_nested_gitignore(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ".gitignore").write_text("*.cache\n/local.py\n")
+    matcher = IgnoreMatcher(str(tmp_path), [], logger)
+    matcher.add_gitignore("sub")
+    assert matcher.is_ignored("sub/x.cache")
+    assert matcher.is_ignored("sub/deeper/x.cache")
+    assert matcher.is_ignored("sub/local.py")
+    assert not matcher.is_ignored("sub/deeper/local.py")
+    assert not matcher.is_ignored("x.cache")
+    assert not matcher.is_ignored("subway/x.cache")
+
+
+@pytest.mark.asyncio
+async def test_scrape_project_nested_gitignore(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / "pkg" / "build").mkdir(parents=True)
+    (project_path / "pkg" / ".gitignore").write_text("build/\nsecret.txt\n")
+    (project_path / "pkg" / "build" / "out.py").write_text("built = True")
+    (project_path / "pkg" / "secret.txt").write_text("hidden")
+    (project_path / "pkg" / "main.py").write_text("main = True")
+    (project_path / "secret.txt").write_text("visible")
+
+    output_file = tmp_path / "output.txt"
+    config = {"ignore_patterns": [], "file_extensions": [], "mask_patterns": [], "use_git": False}
+    await scrape_project(str(project_path), str(output_file), config, "text", lambda x: None)
+
+    content = output_file.read_text()
+    assert "main = True" in content
+    assert "visible" in content
+    assert "built = True" not in content
+    assert "hidden" not in content
@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+from code_context_compiler.index import CompiledOutput, extract, output_paths
+from code_context_compiler.scraper import scrape_project
+
+CONFIG = {
+    "ignore_patterns": [],
+    "file_extensions": [],
+    "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+    "use_git": False,
+    "index": True,
+}
+
+
+@pytest.fixture
+def project_path(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / "src").mkdir(parents=True)
+    (project_path / "src" / "app.py").write_text('password = "secret"\nprint("café")\n')
+    (project_path / "src" / "copy.py").write_text("print('util')\n")
+    (project_path / "util.py").write_text("print('util')\n")
+    (project_path / "image.png").write_bytes(b"\x89PNG")
+    return project_path
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["text", "json", "jsonl", "yaml"])
+async def test_index_gives_every_file(tmp_path, project_path, output_format):
+    output_file = tmp_path / f"output.{output_format}"
+    config = {**CONFIG, "dedupe": True}
+    await scrape_project(str(project_path), str(output_file), config, output_format, lambda x: None)
+
+    app = os.path.join("src", "app.py")
+    copy = os.path.join("src", "copy.py")
+    with CompiledOutput(output_file) as output:
+        assert output.paths() == ["image.png", "util.py", app, copy]
+        assert output.content(app) == 'password = "******"\nprint("café")\n'
+        # A copy written as a reference has the content of the first one
+        assert output.content(copy) == "print('util')\n"
+        assert output.sections[copy].identical_to == "util.py"
+        if output_format == "text":
+            assert output.section("util.py") == "File: util.py\nprint('util')\n\n\n"
+        with pytest.raises(KeyError):
+            output.content("missing.py")
+
+    if output_format == "json":
+        # The sections are records of the document
+        records = json.loads(output_file.read_text())["files"]
+        with CompiledOutput(output_file) as output:
+            assert [json.loads(output.section(r["path"])) for r in records] == records
+
+
+@pytest.mark.asyncio
+async def test_index_detects_changed_output(tmp_path, project_path):
+    output_file = tmp_path / "output.txt"
+    await scrape_project(str(project_path), str(output_file), CONFIG, "text", lambda x: None)
+
+    content = output_file.read_bytes()
+    output_file.write_bytes(content.replace(b"util", b"UTIL"))
+    with CompiledOutput(output_file) as output:
+        with pytest.raises(ValueError, match="hash"):
+            output.content("util.py")
+    with CompiledOutput(output_file, verify=False) as output:
+        assert output.content("util.py") == "print('UTIL')\n"
+
+    output_file.write_bytes(content + b"more")
+    with pytest.raises(ValueError, match="out of date"):
+        CompiledOutput(output_file)
+
+
+@pytest.mark.asyncio
+async def test_extract_from_shards(tmp_path, project_path):
+    output_file = tmp_path / "output.json"
+    config = {**CONFIG, "shards": 2}
+    await scrape_project(str(project_path), str(output_file), config, "json", lambda x: None)
+
+    manifest = tmp_path / "output.manifest.json"
+    app = os.path.join("src", "app.py")
+    assert output_paths(manifest) == ["image.png", "util.py", app, os.path.join("src", "copy.py")]
+    assert extract(manifest, [app, "util.py"]) == {
+        app: 'password = "******"\nprint("café")\n',
+        "util.py": "print('util')\n",
+    }
+    with pytest.raises(KeyError):
+        extract(manifest, ["missing.py"])
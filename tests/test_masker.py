@@ -1,5 +1,8 @@
 import pytest
-from code_context_compiler.masker import mask_sensitive_info, create_mask_function
+import re
+
+from code_context_compiler.config import DEFAULT_CONFIG
+from code_context_compiler.masker import Masker, mask_sensitive_info, create_mask_function
 
 @pytest.mark.parametrize("code, patterns, expected", [
     ('password = "secret"', [r'password\s*=\s*["\'].*?["\']'], 'password = "******"'),
@@ -37,6 +40,85 @@ def test_mask_sensitive_info_complex():
     masked_code = mask_sensitive_info(code, patterns)
     assert masked_code.strip() == expected.strip()
 
+def legacy_mask(code, patterns):
+    for pattern in patterns:
+        if isinstance(pattern, str):
+            code = re.sub(pattern, create_mask_function(), code)
+        else:
+            mask_func = create_mask_function(pattern.get("mask_char", "*"), pattern.get("preserve_length", True))
+            code = re.sub(pattern["pattern"], mask_func, code)
+    return code
+
+def test_masker_matches_sequential_masking():
+    code = '''
+    access_token = "abc"
+    token="xyz" ; client_secret = 'shh'
+    db = connect(database_url = "postgres://u:p@host/db")
+    plain = "nothing to see"
+    '''
+    patterns = DEFAULT_CONFIG["mask_patterns"] + [{"pattern": r"\d{4}-\d{4}", "mask_char": "X", "preserve_length": False}]
+    masker = Masker(patterns)
+    assert masker.combined is not None
+    assert masker.mask(code) == legacy_mask(code, patterns)
+    assert masker.mask("print('hello')") == "print('hello')"
+
+def test_masker_falls_back_without_merging():
+    patterns = [r'(["\'])secret\1', r"(?i)token"]
+    masker = Masker(patterns)
+    assert masker.combined is None
+    code = "x = 'secret'; TOKEN"
+    assert masker.mask(code) == legacy_mask(code, patterns)
+
+def test_masker_prefilter_skips_clean_text():
+    masker = Masker(DEFAULT_CONFIG["mask_patterns"])
+    assert masker.mask("def add(a, b):\n    return a + b\n") == "def add(a, b):\n    return a + b\n"
+    assert masker.mask('password = "secret"') == 'password = "******"'
+    assert masker.stats["files"] == 2
+    assert masker.stats["files_skipped"] == 1
+    # "password" and "secret" both occur in the second text
+    assert masker.stats["patterns_skipped"] == 2 * len(DEFAULT_CONFIG["mask_patterns"]) - 2
+
+def test_masker_prefilter_literals_and_case():
+    masker = Masker([
+        r'(?i)secret\s*=\s*".*?"',
+        {"pattern": r'(pass|pwd)\s*:\s*\S+', "literals": ["pass", "pwd"]},
+    ])
+    assert masker.rules[0].requirements == (("secret",),)
+    assert masker.mask('SECRET = "x"') == 'SECRET = "*"'
+    assert masker.mask("pwd: hunter2") == "*" * len("pwd: hunter2")
+    assert masker.mask("nothing here") == "nothing here"
+    assert masker.stats["files_skipped"] == 1
+
+
+def test_masker_chunks_match_whole_text():
+    code = "".join(
+        f'row {i}: password = "p{i}" api_key="{"k" * (i % 40)}" secret=\'s\'\n' for i in range(200)
+    )
+    masker = Masker(DEFAULT_CONFIG["mask_patterns"], max_match_length=64)
+    expected = masker.mask(code)
+    for size in (1, 13, 64, 1000):
+        chunks = [code[i:i + size] for i in range(0, len(code), size)]
+        assert "".join(masker.mask_chunks(chunks)) == expected
+
+def test_masker_chunks_match_whole_text_with_context():
+    # Each pattern sees the text before a chunk as it saw the whole text:
+    # masked by the patterns before it, not by itself or those after it
+    masker = Masker([r"(?<=key=)\d+", r"\bkey\b", r"(a)\1"], max_match_length=8)
+    code = "aakey key=12 key a\n" * 20
+    expected = masker.mask(code)
+    assert expected.startswith("**key ***=** *** a\n")
+    for size in (1, 3, 7, 50):
+        chunks = [code[i:i + size] for i in range(0, len(code), size)]
+        assert "".join(masker.mask_chunks(chunks)) == expected
+
+def test_mask_stream_window():
+    masker = Masker([r"\d{4}-\d{4}", r'token\s*=\s*".*?"'], max_match_length=100)
+    assert masker.window == 100
+    stream = masker.stream()
+    assert stream.feed("id 1234-") == ""
+    masked = stream.feed("5678 " + "x" * 300) + stream.finish()
+    assert masked == "id *********" + " " + "x" * 300
+
 # def test_create_mask_function():
 #     mask_func = create_mask_function(mask_char='#', preserve_length=True)
 #     assert mask_func(type('MockMatch', (), {'group': lambda: 'test = "value"'})()) == 'test = "#####"'
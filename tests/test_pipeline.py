@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+import pytest
+from code_context_compiler.pipeline import iterate_in_thread, ordered_map
+
+
+@pytest.mark.asyncio
+async def test_ordered_map_preserves_order():
+    async def work(i):
+        await asyncio.sleep(random.random() / 100)
+        return i * 2
+
+    results = [r async for r in ordered_map(work, range(50), jobs=4)]
+    assert results == [i * 2 for i in range(50)]
+
+
+@pytest.mark.asyncio
+async def test_ordered_map_limits_concurrency():
+    running = 0
+    peak = 0
+
+    async def work(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return i
+
+    results = [r async for r in ordered_map(work, range(40), jobs=3)]
+    assert results == list(range(40))
+    assert peak <= 3
+
+
+@pytest.mark.asyncio
+async def test_iterate_in_thread():
+    assert [item async for item in iterate_in_thread(range(100))] == list(range(100))
+
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        [item async for item in iterate_in_thread(failing())]
+
+
+@pytest.mark.asyncio
+async def test_ordered_map_accepts_async_iterables():
+    async def double(i):
+        return i * 2
+
+    results = [r async for r in ordered_map(double, iterate_in_thread(range(20)), jobs=4)]
+    assert results == [i * 2 for i in range(20)]
+
+
+@pytest.mark.asyncio
+async def test_iterate_in_thread_bounded():
+    produced = []
+
+    def producer():
+        for i in range(50):
+            produced.append(i)
+            yield i
+
+    consumed = []
+    async for item in iterate_in_thread(producer(), maxsize=3):
+        await asyncio.sleep(0.001)
+        # Items produced but not consumed yet: the queued ones and this one
+        assert len(produced) - len(consumed) <= 5
+        consumed.append(item)
+    assert consumed == list(range(50))
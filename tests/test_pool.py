@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+from code_context_compiler.config import DEFAULT_CONFIG
+from code_context_compiler.masker import Masker
+from code_context_compiler.pool import MaskPool
+
+
+@pytest.mark.asyncio
+async def test_mask_pool_batches_in_order_and_merges_stats():
+    patterns = DEFAULT_CONFIG["mask_patterns"]
+    masker = Masker(patterns)
+    texts = [f'password = "p{i}"' if i % 2 else f"x = {i}" for i in range(50)]
+    pool = MaskPool(masker, patterns, 2, batch_files=8)
+    try:
+        masked = await asyncio.gather(*(pool.mask(text) for text in texts))
+    finally:
+        pool.close()
+
+    assert masked == [Masker(patterns).mask(text) for text in texts]
+    assert masker.stats["files"] == 50
+    assert masker.stats["files_skipped"] == 25
+
+
+@pytest.mark.asyncio
+async def test_mask_pool_streams_chunks():
+    patterns = DEFAULT_CONFIG["mask_patterns"]
+    masker = Masker(patterns)
+    text = "".join(f'x = {i}\npassword = "secret{i}"\n' for i in range(200))
+    pool = MaskPool(masker, patterns, 2)
+    try:
+        stream = pool.stream()
+        # Chunks split secrets in two
+        pieces = [await stream.feed(text[i : i + 7]) for i in range(0, len(text), 7)]
+        pieces.append(await stream.finish())
+    finally:
+        pool.close()
+
+    assert "".join(pieces) == Masker(patterns).mask(text)
+    assert masker.stats["files"] == 1
+    assert sum(masker.stats["matches"]) == 200
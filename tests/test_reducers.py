@@ -0,0 +1,180 @@
+import ast
+import json
+
+import pytest
+from code_context_compiler.cache import config_fingerprint
+from code_context_compiler.reducers import reduce_file, reduce_python, strip_comments
+from code_context_compiler.scraper import scrape_project
+
+SOURCE = '''"""Module docstring."""
+import os
+from typing import List
+
+LIMIT = 10
+TABLE = {
+    "a": 1,
+}
+
+
+@decorator(
+    "x",
+)
+def top(a: int,
+        b: str = "é") -> List[str]:
+    """Top docstring."""
+    # A comment
+    return [b] * a
+
+
+class Base(object):
+    """Base docstring."""
+
+    name: str = "base"
+
+    def method(self):
+        return os.getcwd()
+
+    async def fetch(self): return 1
+
+    class Inner:
+        pass
+'''
+
+SKELETON = '''"""Module docstring."""
+import os
+from typing import List
+LIMIT = 10
+TABLE = ...
+
+@decorator(
+    "x",
+)
+def top(a: int,
+        b: str = "é") -> List[str]:
+    """Top docstring."""
+
+class Base(object):
+    """Base docstring."""
+    name: str = "base"
+    def method(self):
+        ...
+    async def fetch(self):
+        ...
+    class Inner:
+        ...
+'''
+
+
+def test_reduce_python():
+    assert reduce_python(SOURCE) == SKELETON
+    # Source that does not parse only loses its comments and blank lines
+    assert reduce_python("def broken(:\n\n    # comment\n    pass\n") == (
+        "def broken(:\n    pass\n"
+    )
+
+
+def test_reduce_python_decorated_first_member():
+    source = (
+        "class A:\n"
+        "    @property\n"
+        "    def x(self): return 1\n"
+        "\n"
+        "def outer(func):\n"
+        "    @wraps(func)\n"
+        "    def inner():\n"
+        "        pass\n"
+        "    return inner\n"
+    )
+    skeleton = reduce_python(source)
+    assert skeleton == (
+        "class A:\n"
+        "    @property\n"
+        "    def x(self):\n"
+        "        ...\n"
+        "\n"
+        "def outer(func):\n"
+        "    ...\n"
+    )
+    ast.parse(skeleton)
+
+
+def test_strip_comments():
+    text = "// line\nint x; // kept\n\n/* block\n   comment */\n  /* one */\nint y;\n"
+    assert strip_comments(text, ("//",)) == "int x; // kept\nint y;\n"
+    assert strip_comments("# a\nkey: 1\n\n", ("#",)) == "key: 1\n"
+    # Code sharing a line with a block comment is kept
+    assert strip_comments("/* x */ int y;\n", ("//",)) == "int y;\n"
+    text = "  /* a\n  b */ int x;\n/* c */ /* d */\n"
+    assert strip_comments(text, ("//",)) == "  int x;\n"
+
+
+def test_reduce_file():
+    reducers = {".py": "code_context_compiler.reducers:reduce_python"}
+    assert reduce_file("pkg/mod.py", SOURCE, reducers) == SKELETON
+    assert reduce_file("main.GO", "// c\nfunc main() {}\n", reducers) == (
+        "func main() {}\n"
+    )
+    # Files of unknown languages are left as they are
+    assert reduce_file("README.md", "# Title\n\ntext\n", reducers) == (
+        "# Title\n\ntext\n"
+    )
+    # Reducers are plugged in by extension
+    plugin = {".md": "string:capwords"}
+    assert reduce_file("README.md", "some text", plugin) == "Some Text"
+
+
+@pytest.mark.asyncio
+async def test_scrape_project_skeleton(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "mod.py").write_text(SOURCE)
+    # The same content, but not reduced under another extension
+    (project_path / "copy.txt").write_text(SOURCE)
+    (project_path / "secret.py").write_text(
+        'def login():\n    """Log in."""\n    password = "hunter2"\n\n'
+        'password = "hunter2"\n'
+    )
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+        "skeleton": True,
+        "cache": True,
+        "dedupe": True,
+    }
+
+    outputs = []
+    for run in ("first", "second"):
+        output_file = tmp_path / f"{run}.json"
+        reports = []
+        await scrape_project(
+            str(project_path),
+            str(output_file),
+            config,
+            "json",
+            lambda x: None,
+            reports.append,
+        )
+        outputs.append(output_file.read_text())
+    assert outputs[0] == outputs[1]
+    assert reports[0]["cache"]["hits"] == 3
+
+    files = {
+        record["path"]: record for record in json.loads(outputs[0])["files"]
+    }
+    assert files["mod.py"]["content"] == SKELETON
+    assert files["copy.txt"]["content"] == SOURCE
+    assert "identical_to" not in files["copy.txt"]
+    # Files are reduced, then masked
+    assert files["secret.py"]["content"] == (
+        'def login():\n    """Log in."""\npassword = "*******"\n'
+    )
+
+    assert config_fingerprint(config) != config_fingerprint(
+        {**config, "skeleton": False}
+    )
+    # Without skeleton mode, the reducers make no difference
+    assert config_fingerprint({**config, "skeleton": False}) == config_fingerprint(
+        {**config, "skeleton": False, "reducers": {".md": "string:capwords"}}
+    )
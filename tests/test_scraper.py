@@ -1,7 +1,11 @@
 import pytest
 import asyncio
 import json
-from code_context_compiler.scraper import scrape_project, is_ignored, get_git_tracked_files, load_gitignore
+import os
+from datetime import date, datetime, timezone
+import yaml
+from code_context_compiler.writers import FileRecord
+from code_context_compiler.scraper import _Scrape, scrape_project, iter_records, is_ignored, get_git_tracked_files, load_gitignore, is_binary, to_timestamp, MMAP_THRESHOLD
 from unittest.mock import patch, MagicMock
 import logging
 
@@ -55,29 +59,325 @@ async def test_scrape_project_with_gitignore(tmp_path):
     assert 'password = "******"' in content
     assert 'sensitive_log = "should_be_ignored"' not in content
 
-# @pytest.mark.asyncio
-# async def test_scrape_project_output_format(tmp_path):
-#     project_path = tmp_path / "project"
-#     project_path.mkdir()
-#     file_path = project_path / "test_file.py"
-#     file_path.write_text('password = "secret"')
+@pytest.mark.asyncio
+async def test_scrape_project_jobs_output_identical(tmp_path):
+    project_path = tmp_path / "project"
+    for i in range(30):
+        nested = project_path / f"pkg{i % 3}"
+        nested.mkdir(parents=True, exist_ok=True)
+        (nested / f"module_{i}.py").write_text(f'token = "value{i}"\n' * (i + 1))
 
-#     output_file = tmp_path / "output.json"
-    
-#     config = {
-#         "ignore_patterns": [],
-#         "file_extensions": [],
-#         "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
-#         "use_git": False
-#     }
-    
-#     await scrape_project(str(project_path), str(output_file), config, "json", lambda x: None)
-    
-#     with open(output_file, 'r') as f:
-#         content = json.load(f)
-    
-#     assert "test_file.py" in content
-#     assert 'password = "******"' in content["test_file.py"]
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'token\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+    }
+
+    outputs = []
+    for jobs in (1, 8):
+        output_file = tmp_path / f"output_{jobs}.txt"
+        await scrape_project(str(project_path), str(output_file), {**config, "jobs": jobs}, "text", lambda x: None)
+        outputs.append(output_file.read_bytes())
+
+    assert outputs[0] == outputs[1]
+    assert b"value" not in outputs[0]
+
+@pytest.mark.asyncio
+async def test_scrape_progress_never_goes_back(tmp_path):
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [],
+        "use_git": False,
+    }
+    progress = []
+    scrape = _Scrape(str(tmp_path), config, logging.getLogger(__name__), progress_callback=progress.append)
+
+    async def discover():
+        # Files are found a directory at a time, faster than they are processed
+        for batch in range(4):
+            scrape.total_files += 5
+            for i in range(5):
+                yield FileRecord(f"dir{batch}/file{i}", "unchanged", "")
+
+    records = [record async for record in scrape.records(discover(), None, 1)]
+    scrape.close()
+    assert len(records) == 20
+    assert progress == sorted(progress)
+    assert progress[-1] == 100
+
+@pytest.mark.asyncio
+async def test_scrape_project_workers_output_identical(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    for i in range(40):
+        (project_path / f"module_{i}.py").write_text(f'token = "value{i}"\nx = {i}\n' * (i + 1))
+    (project_path / "clean.py").write_text("print('hello')\n")
+
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'token\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+    }
+
+    outputs = []
+    for workers in (1, 2):
+        output_file = tmp_path / f"output_{workers}.txt"
+        await scrape_project(str(project_path), str(output_file), {**config, "workers": workers}, "text", lambda x: None)
+        outputs.append(output_file.read_bytes())
+
+    assert outputs[0] == outputs[1]
+    assert b"value" not in outputs[1]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["json", "jsonl", "yaml"])
+async def test_scrape_project_output_format(tmp_path, output_format):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "test_file.py").write_text('password = "secret"')
+    # A file mentioning the text output's own marker must not break the output
+    (project_path / "notes.md").write_text("\nFile: fake.py\nnot a file\n")
+
+    output_file = tmp_path / f"output.{output_format}"
+
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+        "use_git": False
+    }
+
+    await scrape_project(str(project_path), str(output_file), config, output_format, lambda x: None)
+
+    with open(output_file, 'r') as f:
+        if output_format == "json":
+            content = json.load(f)
+        elif output_format == "jsonl":
+            lines = [json.loads(line) for line in f]
+            content = {"prompt": lines[0]["prompt"], "files": lines[1:]}
+        else:
+            content = yaml.safe_load(f)
+
+    assert "compiled code" in content["prompt"]
+    files = {record["path"]: record for record in content["files"]}
+    assert set(files) == {"test_file.py", "notes.md"}
+    assert files["test_file.py"]["kind"] == "text"
+    assert files["test_file.py"]["content"] == 'password = "******"'
+    assert files["notes.md"]["content"] == "\nFile: fake.py\nnot a file\n"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["text", "json", "jsonl", "yaml"])
+async def test_scrape_project_chunked_masking(tmp_path, output_format):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    lines = [f'password = "secret{i}"\r\nquote = "\u00e9\\t"\n' for i in range(50)]
+    (project_path / "dump.sql").write_text("".join(lines), newline="")
+    (project_path / "small.py").write_text('token = "abc"')
+
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']', r'token\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+    }
+
+    outputs = []
+    chunked_config = {"chunk_threshold": 100, "chunk_size": 7}
+    # Chunks are masked on a thread, or in the workers of the pool
+    for chunked in ({}, chunked_config, {**chunked_config, "workers": 2}):
+        output_file = tmp_path / f"output_{len(outputs)}.{output_format}"
+        await scrape_project(str(project_path), str(output_file), {**config, **chunked}, output_format, lambda x: None)
+        outputs.append(output_file.read_bytes())
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert b"secret" not in outputs[1]
+
+
+@pytest.mark.asyncio
+async def test_scrape_project_stats_hook(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / ".gitignore").write_text("build/\n")
+    (project_path / "build").mkdir()
+    (project_path / "build" / "out.py").write_text("x = 1")
+    (project_path / "app.py").write_text('password = "a"\npassword = "b"\n')
+    (project_path / "notes.txt").write_text("notes")
+    (project_path / "logo.png").write_bytes(b"png")
+
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [".py", ".png", "ignore"],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']', r'token\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+    }
+    reports = []
+    await scrape_project(str(project_path), str(tmp_path / "output.txt"), config, "text", lambda x: None, reports.append)
+
+    [report] = reports
+    assert json.loads(json.dumps(report)) == report
+    assert report["files"] == {"text": 2, "media": 1}
+    assert report["skipped"] == {"ignored": 1, "extension": 1}
+    assert report["bytes_read"] == len('password = "a"\npassword = "b"\n') + len("build/\n")
+    assert [p["matches"] for p in report["patterns"]] == [2, 0]
+    assert {"total", "walk", "filter", "read", "mask", "write"} <= set(report["seconds"])
+    assert sorted(f["path"] for f in report["slowest_files"]) == [".gitignore", "app.py", "logo.png"]
+
+
+@pytest.mark.asyncio
+async def test_scrape_project_since_mtime(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / "src").mkdir(parents=True)
+    for name in ("old.py", "src/old.py", "src/new.py", "new.txt"):
+        (project_path / name).write_text(f"print({name!r})")
+        mtime = 1_000_000 if "old" in name else 2_000_000
+        os.utime(project_path / name, (mtime, mtime))
+
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [".py"],
+        "mask_patterns": [],
+        "use_git": False,
+        "since_mtime": "1500000",
+    }
+    output_file = tmp_path / "output.json"
+    await scrape_project(str(project_path), str(output_file), config, "json", lambda x: None)
+    files = json.loads(output_file.read_text())["files"]
+    assert [record["path"] for record in files] == [os.path.join("src", "new.py")]
+
+    config = {**config, "list_unchanged": True}
+    await scrape_project(str(project_path), str(output_file), config, "json", lambda x: None)
+    files = json.loads(output_file.read_text())["files"]
+    assert [(record["path"], record["kind"]) for record in files] == [
+        ("old.py", "unchanged"),
+        (os.path.join("src", "new.py"), "text"),
+        (os.path.join("src", "old.py"), "unchanged"),
+    ]
+
+    output_file = tmp_path / "output.txt"
+    await scrape_project(str(project_path), str(output_file), config, "text", lambda x: None)
+    assert "[UNCHANGED FILE PLACEHOLDER: old.py]" in output_file.read_text()
+
+
+@pytest.mark.parametrize("since, expected", [
+    (1500000, 1500000.0),
+    ("1500000.5", 1500000.5),
+    ("2024-01-02T03:04:05+00:00", 1704164645.0),
+    (datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc), 1704164645.0),
+    (date(2024, 1, 2), datetime(2024, 1, 2).timestamp()),
+])
+def test_to_timestamp(since, expected):
+    assert to_timestamp(since) == expected
+
+
+@pytest.mark.parametrize("probe, expected", [
+    (b"plain ascii text\n", False),
+    ("utf-8 t\u00e9xt \u4e2d".encode("utf-8"), False),
+    ("truncated \u4e2d".encode("utf-8")[:-1], False),
+    ("latin-1 t\u00e9xt".encode("latin-1"), False),
+    (b"\x7fELF\x02\x01\x01\x00\x00", True),
+    (bytes(range(1, 32)) * 4, True),
+])
+def test_is_binary(probe, expected):
+    assert is_binary(probe) == expected
+
+
+@pytest.mark.asyncio
+async def test_scrape_project_binary_and_large_files(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "lib.so").write_bytes(b"\x7fELF\x02\x01\x01" + bytes(40))
+    (project_path / "dump.sql").write_text("x" * 200)
+    (project_path / "small.py").write_text('token = "abc"')
+    # Big enough to be memory-mapped, with a secret and CRLF line endings
+    big = 'token = "abc"\r\n' + "y = 1\r\n" * (MMAP_THRESHOLD // 7)
+    (project_path / "big.py").write_bytes(big.encode())
+
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'token\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+    }
+    output_file = tmp_path / "output.txt"
+    await scrape_project(str(project_path), str(output_file), {**config, "max_file_size": 100}, "text", lambda x: None)
+    content = output_file.read_text()
+    assert "[BINARY FILE PLACEHOLDER: lib.so]" in content
+    assert "[LARGE FILE PLACEHOLDER: dump.sql]" in content
+    assert "[LARGE FILE PLACEHOLDER: big.py]" in content
+    assert 'token = "***"' in content
+
+    await scrape_project(str(project_path), str(output_file), config, "text", lambda x: None)
+    content = output_file.read_text()
+    assert "x" * 200 in content
+    assert 'token = "***"\ny = 1\ny = 1\n' in content
+    assert "\r" not in content
+
+
+@pytest.mark.asyncio
+async def test_iter_records(tmp_path):
+    project_path = tmp_path / "project"
+    (project_path / "src").mkdir(parents=True)
+    for i in range(20):
+        (project_path / "src" / f"module{i}.py").write_text(f'password = "secret{i}"\n')
+    (project_path / "logo.png").write_bytes(b"\x89PNG")
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+        "jobs": 4,
+        "cache": True,
+    }
+
+    reports = []
+    records = [record async for record in iter_records(str(project_path), config, reports.append)]
+    # The records written to the output, without going through a file
+    output_file = tmp_path / "output.json"
+    await scrape_project(str(project_path), str(output_file), config, "json", lambda x: None)
+    written = json.loads(output_file.read_text())["files"]
+    assert [(r["path"], r["kind"], r["content"]) for r in written] == [tuple(r[:3]) for r in records]
+    relative_path, kind, content, *_ = records[1]
+    assert (kind, content) == ("text", 'password = "*******"\n')
+    assert reports[0]["files"] == {"media": 1, "text": 20}
+
+    # Consumers may stop at any record
+    agen = iter_records(str(project_path), config)
+    assert (await agen.__anext__()).kind == "media"
+    await agen.aclose()
+
+
+@pytest.mark.asyncio
+async def test_scrape_project_compressed_output(tmp_path):
+    import lzma
+
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "app.py").write_text('password = "secret"\n' * 100)
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+    }
+
+    plain = tmp_path / "output.json"
+    await scrape_project(str(project_path), str(plain), config, "json", lambda x: None)
+    # Chosen by the extension, or by the configuration
+    compressed = tmp_path / "output.json.xz"
+    await scrape_project(str(project_path), str(compressed), config, "json", lambda x: None)
+    assert lzma.decompress(compressed.read_bytes()) == plain.read_bytes()
+    assert compressed.stat().st_size < plain.stat().st_size
+
+    compressed = tmp_path / "output.json.z"
+    config = {**config, "compress": "xz", "compress_level": 1}
+    await scrape_project(str(project_path), str(compressed), config, "json", lambda x: None)
+    assert lzma.decompress(compressed.read_bytes()) == plain.read_bytes()
+
+    with pytest.raises(ValueError, match="compressed"):
+        await scrape_project(str(project_path), str(compressed), {**config, "index": True}, "json", lambda x: None)
 
 
 # def test_is_ignored(tmp_path):
@@ -0,0 +1,116 @@
+import json
+import os
+from typing import NamedTuple
+
+import pytest
+from code_context_compiler.ai_prompt import AI_PROMPT
+from code_context_compiler.budget import RECORD_OVERHEAD
+from code_context_compiler.scraper import scrape_project
+from code_context_compiler.shards import plan_shards, shard_paths
+
+
+class Entry(NamedTuple):
+    relative_path: str
+    size: int
+
+
+def paths_of(shards):
+    return [[entry.relative_path for entry in shard] for shard in shards]
+
+
+def test_plan_shards_by_count_follows_directories():
+    # In walk order: the files of a directory, then its subdirectories
+    entries = [
+        Entry("setup.py", 100),
+        Entry(os.path.join("docs", "a.md"), 100),
+        Entry(os.path.join("docs", "b.md"), 100),
+        Entry(os.path.join("src", "a.py"), 100),
+        Entry(os.path.join("src", "b.py"), 100),
+        Entry(os.path.join("src", "c.py"), 100),
+    ]
+    # An even split would cut src/ in two; docs/ ends close enough
+    assert paths_of(plan_shards(entries, count=2)) == [
+        ["setup.py", os.path.join("docs", "a.md"), os.path.join("docs", "b.md")],
+        [os.path.join("src", p) for p in ("a.py", "b.py", "c.py")],
+    ]
+    assert len(plan_shards(entries, count=6)) == 6
+    # Never more shards than files, never an empty one
+    assert len(plan_shards(entries, count=10)) == 6
+    assert plan_shards([], count=3) == [[]]
+
+
+def test_plan_shards_by_size():
+    entries = [Entry(os.path.join("pkg", f"{i}.py"), 100) for i in range(3)]
+    entries += [Entry(os.path.join("tests", f"{i}.py"), 100) for i in range(3)]
+    entries.append(Entry("huge.bin", 10_000))
+    size = 100 + len(entries[0].relative_path) + RECORD_OVERHEAD
+
+    # Room for four files: the first shard stops at the end of pkg/
+    shards = plan_shards(entries, max_bytes=1000 + 4 * size, base_bytes=1000)
+    assert paths_of(shards)[0] == [entry.relative_path for entry in entries[:3]]
+    # A file larger than a shard gets a shard of its own
+    assert paths_of(shards)[-1] == ["huge.bin"]
+    assert [entry for shard in shards for entry in shard] == entries
+
+    with pytest.raises(ValueError):
+        plan_shards(entries, max_bytes=1000, base_bytes=1000)
+    with pytest.raises(ValueError):
+        plan_shards(entries)
+
+
+def test_shard_paths():
+    assert shard_paths("out/context.txt", 2) == ["out/context.001.txt", "out/context.002.txt"]
+    assert shard_paths("context", 1000)[-1] == "context.1000"
+    assert shard_paths("context.txt.gz", 1) == ["context.001.txt.gz"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("output_format", ["text", "json"])
+async def test_scrape_project_shards(tmp_path, output_format):
+    project_path = tmp_path / "project"
+    for directory in ("a", "b", "c"):
+        (project_path / directory).mkdir(parents=True)
+        for i in range(3):
+            (project_path / directory / f"{i}.py").write_text(f"print('{directory}{i}')\n" * 20)
+    (project_path / "b" / "secret.py").write_text('password = "hunter2"\n')
+    config = {
+        "ignore_patterns": [],
+        "file_extensions": [],
+        "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+        "use_git": False,
+        "shards": 3,
+        "dedupe": True,
+    }
+
+    output_file = tmp_path / f"output.{output_format}"
+    reports = []
+    await scrape_project(
+        str(project_path), str(output_file), config, output_format, lambda x: None, reports.append
+    )
+    assert not output_file.exists()
+
+    manifest = json.loads((tmp_path / "output.manifest.json").read_text())
+    names = [f"output.00{i}.{output_format}" for i in (1, 2, 3)]
+    assert [shard["path"] for shard in manifest["shards"]] == names
+    # One directory per shard
+    for relative_path, name in manifest["files"].items():
+        assert name == names["abc".index(relative_path[0])]
+    assert len(manifest["files"]) == 10
+
+    unsharded = tmp_path / f"unsharded.{output_format}"
+    await scrape_project(
+        str(project_path), str(unsharded), {**config, "shards": None}, output_format, lambda x: None
+    )
+    contents = [(tmp_path / name).read_text() for name in names]
+    for content, shard in zip(contents, manifest["shards"]):
+        assert content.count(AI_PROMPT.strip()[:40]) == 1
+        assert len(content) == shard["bytes"]
+    assert "hunter2" not in "".join(contents)
+    if output_format == "json":
+        # Together, the shards hold the records of the whole output
+        records = [record for content in contents for record in json.loads(content)["files"]]
+        assert records == json.loads(unsharded.read_text())["files"]
+    assert reports[0]["files"]["text"] == 10
+
+    with pytest.raises(ValueError, match="standard output"):
+        await scrape_project(str(project_path), "-", config, output_format, lambda x: None)
@@ -0,0 +1,55 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+from code_context_compiler.sink import OutputSink, compression_for, split_ext
+
+
+@pytest.mark.asyncio
+async def test_output_sink_buffers_and_writes_everything(tmp_path):
+    target = tmp_path / "output.txt"
+    sections = [f"File: {i}.py\n{'x' * i}\n\n" for i in range(500)]
+    async with OutputSink(str(target), buffer_size=4096) as sink:
+        for section in sections:
+            await sink.write(section)
+        # Nothing beyond the last full buffer has been handed over yet
+        assert sink._buffered < 4096
+    assert target.read_text() == "".join(sections)
+
+
+@pytest.mark.asyncio
+async def test_output_sink_stdout(capsys):
+    async with OutputSink("-") as sink:
+        await sink.write("piped ")
+        await sink.write("output\n")
+    assert capsys.readouterr().out == "piped output\n"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compression, module", [("gzip", gzip), ("bz2", bz2), ("xz", lzma)])
+async def test_output_sink_compression(tmp_path, compression, module):
+    target = tmp_path / "output.txt"
+    sections = [f"File: {i}.py\n{'x' * i}\n\n" for i in range(500)]
+    async with OutputSink(str(target), buffer_size=4096, compression=compression, level=1) as sink:
+        for section in sections:
+            await sink.write(section)
+    assert module.decompress(target.read_bytes()).decode() == "".join(sections)
+
+
+@pytest.mark.asyncio
+async def test_output_sink_compressed_stdout(capsysbinary):
+    async with OutputSink("-", compression="gzip") as sink:
+        await sink.write("piped output\n")
+    assert gzip.decompress(capsysbinary.readouterr().out) == b"piped output\n"
+
+
+def test_compression_for():
+    assert compression_for("out.txt.gz") == "gzip"
+    assert compression_for("out.json.BZ2") == "bz2"
+    assert compression_for("out.xz") == "xz"
+    assert compression_for("out.txt") is None
+    assert split_ext("out/context.txt.gz") == ("out/context", ".txt.gz")
+    assert split_ext("out/context.txt") == ("out/context", ".txt")
+    with pytest.raises(ValueError, match="zip"):
+        OutputSink("out.zip", compression="zip")
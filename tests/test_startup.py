@@ -0,0 +1,46 @@
+import json
+import subprocess
+import sys
+import time
+
+# Generous wall-clock budgets: they catch an accidental eager import of a
+# heavy dependency, not small fluctuations between machines.
+HELP_BUDGET = 2.0
+SCRAPE_BUDGET = 4.0
+
+HEAVY_MODULES = ["asyncio", "git", "pathspec", "rich", "yaml", "multiprocessing"]
+
+
+def run(*args):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout, time.perf_counter() - start
+
+
+def test_cli_import_is_lazy():
+    code = "import sys, json, code_context_compiler.cli; print(json.dumps(sorted(sys.modules)))"
+    stdout, _ = run("-c", code)
+    modules = set(json.loads(stdout))
+    assert [name for name in HEAVY_MODULES if name in modules] == []
+    assert "code_context_compiler.scraper" not in modules
+
+
+def test_scraper_import_is_lazy():
+    code = "import sys, json, code_context_compiler.scraper; print(json.dumps(sorted(sys.modules)))"
+    stdout, _ = run("-c", code)
+    modules = set(json.loads(stdout))
+    assert [name for name in ["git", "pathspec", "yaml", "multiprocessing"] if name in modules] == []
+
+
+def test_startup_budget(tmp_path):
+    _, elapsed = run("-m", "code_context_compiler.cli", "--help")
+    assert elapsed < HELP_BUDGET
+
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "main.py").write_text('password = "secret"\n')
+    output_file = tmp_path / "output.txt"
+    _, elapsed = run("-m", "code_context_compiler.cli", str(project_path), str(output_file))
+    assert elapsed < SCRAPE_BUDGET
+    assert 'password = "******"' in output_file.read_text()
@@ -0,0 +1,28 @@
+from code_context_compiler.masker import Masker
+from code_context_compiler.stats import ScrapeStats
+
+
+def test_scrape_stats_keeps_slowest_files():
+    stats = ScrapeStats(slowest=3)
+    for i in range(10):
+        stats.file_done(f"file_{i}.py", "text", i / 100)
+    stats.skip("extension")
+
+    report = stats.report()
+    assert report["files"] == {"text": 10}
+    assert report["skipped"] == {"extension": 1}
+    assert [f["path"] for f in report["slowest_files"]] == ["file_9.py", "file_8.py", "file_7.py"]
+
+
+def test_scrape_stats_timed_and_patterns():
+    stats = ScrapeStats()
+    masker = Masker([r"\d{4}", r"secret"])
+    masker.timing = True
+    mask = stats.timed("mask", masker.mask)
+    assert mask("1234 5678 secret") == "**** **** ******"
+
+    report = stats.report(masker)
+    assert report["seconds"]["mask"] > 0
+    assert [p["matches"] for p in report["patterns"]] == [2, 1]
+    assert all(p["seconds"] > 0 for p in report["patterns"])
+    assert "cache" not in report
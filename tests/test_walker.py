@@ -0,0 +1,67 @@
+import logging
+import os
+
+import pytest
+from code_context_compiler.ignore import IgnoreMatcher
+from code_context_compiler.walker import ProjectWalker
+
+logger = logging.getLogger(__name__)
+
+
+def make_tree(root):
+    for relative_path in [
+        "b.py", "a.py", "z/inner.py", "z/deep/x.py", "m/one.py", "m/two.txt",
+        "build/out.py", "m/.gitignore",
+    ]:
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(relative_path)
+    (root / ".gitignore").write_text("build/\n")
+    (root / "m" / ".gitignore").write_text("*.txt\n")
+
+
+def walk(root, workers=None, subtrees=None):
+    matcher = IgnoreMatcher(str(root), [], logger)
+    walker = ProjectWalker(str(root), matcher, logger, workers=workers, subtrees=subtrees)
+    return [entry for batch in walker for entry in batch]
+
+
+def test_walker_order_and_filtering(tmp_path):
+    make_tree(tmp_path)
+    entries = walk(tmp_path)
+    assert [entry.relative_path for entry in entries] == [
+        ".gitignore", "a.py", "b.py",
+        os.path.join("m", ".gitignore"), os.path.join("m", "one.py"),
+        os.path.join("z", "inner.py"), os.path.join("z", "deep", "x.py"),
+    ]
+    entry = entries[1]
+    assert entry.path == str(tmp_path / "a.py")
+    assert entry.size == len("a.py")
+    assert entry.mtime_ns == os.stat(tmp_path / "a.py").st_mtime_ns
+
+
+def test_walker_only_enters_subtrees(tmp_path):
+    make_tree(tmp_path)
+    entries = walk(tmp_path, subtrees={"z", os.path.join("z", "deep")})
+    assert [entry.relative_path for entry in entries] == [
+        ".gitignore", "a.py", "b.py",
+        os.path.join("z", "inner.py"), os.path.join("z", "deep", "x.py"),
+    ]
+    assert walk(tmp_path, subtrees=set()) == entries[:3]
+
+
+def test_walker_is_deterministic_across_worker_counts(tmp_path):
+    for i in range(40):
+        (tmp_path / f"d{i % 7}" / f"e{i % 3}").mkdir(parents=True, exist_ok=True)
+        (tmp_path / f"d{i % 7}" / f"e{i % 3}" / f"f{i}.py").write_text("x")
+    assert walk(tmp_path, workers=1) == walk(tmp_path, workers=16)
+
+
+def test_walker_does_not_follow_directory_symlinks(tmp_path):
+    (tmp_path / "real").mkdir()
+    (tmp_path / "real" / "file.py").write_text("x")
+    try:
+        os.symlink(tmp_path / "real", tmp_path / "link", target_is_directory=True)
+    except OSError:
+        pytest.skip("symlinks are not supported here")
+    assert [entry.relative_path for entry in walk(tmp_path)] == [os.path.join("real", "file.py")]
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import sys
+
+import pytest
+from code_context_compiler.scraper import scrape_project
+from code_context_compiler.watch import WatchSession, watch_project
+
+CONFIG = {
+    "ignore_patterns": ["*.log"],
+    "file_extensions": [],
+    "mask_patterns": [r'password\s*=\s*["\'].*?["\']'],
+    "use_git": False,
+}
+
+
+async def next_update(updates):
+    return await asyncio.wait_for(updates.get(), 10)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("poll_interval, debounce", [
+    pytest.param(None, 0.05, marks=pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify")),
+    (0.05, 0.05),
+    # Polling ticks only count when something changed
+    (0.05, 0.2),
+])
+async def test_watch_project_updates_output(tmp_path, poll_interval, debounce):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    (project_path / "a.py").write_text('password = "one"\n')
+    (project_path / "b.py").write_text("b = 1\n")
+    output_file = tmp_path / "output.txt"
+
+    updates = asyncio.Queue()
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(watch_project(
+        str(project_path), str(output_file), CONFIG, "text",
+        debounce=debounce, poll_interval=poll_interval,
+        on_update=lambda: updates.put_nowait(output_file.read_text()), stop=stop,
+    ))
+    try:
+        initial = await next_update(updates)
+        expected_file = tmp_path / "expected.txt"
+        await scrape_project(str(project_path), str(expected_file), CONFIG, "text", lambda x: None)
+        assert initial == expected_file.read_text()
+
+        (project_path / "a.py").write_text('password = "two"\nx = 2\n')
+        (project_path / "b.py").unlink()
+        (project_path / "pkg").mkdir()
+        (project_path / "pkg" / "c.py").write_text("c = 3\n")
+        updated = await next_update(updates)
+        while "File: pkg/c.py" not in updated:
+            updated = await next_update(updates)
+
+        await scrape_project(str(project_path), str(expected_file), CONFIG, "text", lambda x: None)
+        assert updated == expected_file.read_text()
+        assert "File: b.py" not in updated
+        assert 'password = "***"\nx = 2' in updated
+    finally:
+        stop.set()
+        await asyncio.wait_for(task, 10)
+
+
+@pytest.mark.asyncio
+async def test_watch_session_only_remasks_changed_files(tmp_path):
+    project_path = tmp_path / "project"
+    project_path.mkdir()
+    for name in ("a.py", "b.py"):
+        (project_path / name).write_text('password = "x"\n')
+    # The output inside the project is never compiled into itself
+    output_file = project_path / "context.txt"
+    session = WatchSession(str(project_path), str(output_file), CONFIG, "text", logging.getLogger())
+
+    assert await session.update()
+    assert session.masker.stats["files"] == 2
+    assert "File: context.txt" not in output_file.read_text()
+
+    # Nothing changed: stat is trusted once it is old enough
+    for name in ("a.py", "b.py"):
+        os.utime(project_path / name, ns=(0, 0))
+    await session.update()
+    files = session.masker.stats["files"]
+    assert not await session.update()
+    assert session.masker.stats["files"] == files
+
+    (project_path / "a.py").write_text('password = "y"\nmore = 1\n')
+    (project_path / "debug.log").write_text("ignored")
+    assert await session.update()
+    assert session.masker.stats["files"] == files + 1
+    assert "more = 1" in output_file.read_text()
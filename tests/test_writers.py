@@ -0,0 +1,43 @@
+import io
+import json
+
+import pytest
+import yaml
+from code_context_compiler.writers import FileRecord, JsonWriter, YamlWriter, yaml_quote
+
+
+class StringOutput(io.StringIO):
+    async def write(self, text):
+        return super().write(text)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "plain text",
+    'quotes " and \\ backslashes',
+    "tabs\tand\nnewlines\r\n",
+    "control \x00\x07\x1b\x7f\x85 chars",
+    "line separators \u2028 \u2029 and bom \ufeff",
+    "unicode \u00e9 \u4e2d\u6587 \U0001F600",
+    "- looks: like [yaml] # comment",
+])
+def test_yaml_quote_round_trips(text):
+    assert yaml.safe_load(f"key: {yaml_quote(text)}") == {"key": text}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("writer_class, load", [(JsonWriter, json.loads), (YamlWriter, yaml.safe_load)])
+async def test_structured_writers(writer_class, load):
+    for records in ([], [FileRecord("a.py", "text", "x = 1\n"), FileRecord("b.png", "media", "")]):
+        out = StringOutput()
+        writer = writer_class(out)
+        await writer.start()
+        for record in records:
+            await writer.write_record(record)
+        await writer.finish()
+
+        document = load(out.getvalue())
+        assert document["prompt"]
+        assert document["files"] == [
+            {"path": r.relative_path, "kind": r.kind, "content": r.content} for r in records
+        ]